@@ -0,0 +1,418 @@
+#!/usr/bin/env python2.7
+# coding: utf-8
+"""
+Сквозной замер скорости проверки урлов: get_redirect_history и обработчики
+lib.worker на локальной ферме редиректов, без сети и tarantool.
+
+Ферма - http сервер на 127.0.0.1 (в нескольких процессах), который отдает
+цепочки http редиректов и мета-редиректов, циклы, медленные ответы, большие
+страницы и страницы со счетчиками (см. FARM_MIX). Обработчики берут задачи
+из FakeTube - очереди в памяти процесса обработчика, которая запоминает,
+когда каждая задача была взята и подтверждена.
+
+Для get_redirect_history (последовательно, в одном процессе) и для каждого
+сочетания бэкенда, количества обработчиков, размера пула цепочек
+(MULTI_MAX_CHAINS / GEVENT_POOL_SIZE), ограничения запросов к хосту
+(MAX_REQUESTS_PER_HOST) и бюджета цепочки (CHAIN_TIMEOUT) печатаются: задач
+в секунду, 50-й и 99-й перцентили времени задачи от взятия до подтверждения
+(вместе с ожиданием отправки пачки результатов, см. RESULT_FLUSH_INTERVAL),
+сколько задач ушло на перепроверку и наибольший RSS обработчика.
+
+По умолчанию ограничение запросов к хосту берется из конфига, а бюджет
+цепочки проверяется со значением из конфига и с SHORT_BUDGET, который
+обрезает медленные хопы фермы. Все урлы фермы на одном хосте, поэтому
+ограничение запросов к хосту ограничивает и число одновременных запросов
+обработчика.
+
+Запуск: ./benchmarks/bench_checker.py [--tasks 2000] [--workers 1,2,4] [--backends process,multi,gevent]
+        [--chains 20,100] [--per-host 20,0] [--budgets 20,1.5] [--config source/config/checker_config.py]
+"""
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from multiprocessing import Process, Queue
+from Queue import Empty
+import os
+import random
+import resource
+from SocketServer import ThreadingMixIn
+import sys
+import time
+
+source_dir = os.path.join(os.path.dirname(__file__), '..', 'source')
+sys.path.insert(0, source_dir)
+
+import gevent
+
+import lib.worker
+from lib import CheckSettings, get_counter_scanner, get_redirect_history
+from lib.curl_pool import CurlPool
+from lib.utils import load_config_from_pyfile
+
+FARM_MIX = (
+    ('/http/3/{}', 30),
+    ('/meta/2/{}', 15),
+    ('/loop/a/{}', 5),
+    ('/slow/200/{}', 10),
+    # longer than HTTP_TIMEOUT, the task goes to recheck
+    ('/slow/5000/{}', 2),
+    ('/big/2048/{}', 8),
+    ('/counters/{}', 30),
+)
+"""Пути фермы (в {} подставляется номер задачи, чтобы урлы не повторялись) и их доли в задачах"""
+
+FINAL_PAGE = '<html><head><title>Final</title></head><body><p>Landing page</p></body></html>'
+
+COUNTERS_PAGE = (
+    '<html><head><title>Counters</title>'
+    '<script src="//mc.yandex.ru/metrika/watch.js"></script>'
+    '<script src="//www.google-analytics.com/ga.js"></script></head><body>{}'
+    '<img src="//top-fwz1.mail.ru/counter?id=1;js=na" height="1" width="1">'
+    '</body></html>'
+)
+
+META_PAGE = '<html><head><meta http-equiv="refresh" content="0; url={}"></head><body></body></html>'
+
+BIG_PAGE_CHUNK = '<div class="item"><a href="/catalog/item">Item</a> Lorem ipsum dolor sit amet.</div>\n'
+
+SHORT_BUDGET = 1.5
+"""Бюджет цепочки, меньший HTTP_TIMEOUT, так что запросы /slow/5000 прерываются бюджетом"""
+
+
+class FarmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        serve = getattr(self, 'serve_' + parts[0], None)
+        if serve is None:
+            self.send_page('', status=404)
+            return
+        serve(*parts[1:])
+
+    def serve_http(self, hops, token):
+        hops = int(hops)
+        if hops:
+            self.send_page('', status=302, location='/http/{}/{}'.format(hops - 1, token))
+        else:
+            self.send_page(FINAL_PAGE)
+
+    def serve_meta(self, hops, token):
+        hops = int(hops)
+        if hops:
+            self.send_page(META_PAGE.format(self.absolute('/meta/{}/{}'.format(hops - 1, token))))
+        else:
+            self.send_page(FINAL_PAGE)
+
+    def serve_loop(self, side, token):
+        self.send_page('', status=302, location='/loop/{}/{}'.format('b' if side == 'a' else 'a', token))
+
+    def serve_slow(self, milliseconds, token):
+        time.sleep(int(milliseconds) / 1000.0)
+        self.send_page(FINAL_PAGE)
+
+    def serve_big(self, kilobytes, token):
+        self.send_page(BIG_PAGE_CHUNK * (int(kilobytes) * 1024 // len(BIG_PAGE_CHUNK)))
+
+    def serve_counters(self, token):
+        self.send_page(COUNTERS_PAGE.format(BIG_PAGE_CHUNK * 50))
+
+    def absolute(self, path):
+        return 'http://{}:{}{}'.format(self.server.server_address[0], self.server.server_address[1], path)
+
+    def send_page(self, body, status=200, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header('Location', self.absolute(location))
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FarmServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # curl closes connections of stopped downloads and idle pooled handles
+        pass
+
+
+def start_farm(processes):
+    """
+    Запускает ферму в processes процессах, принимающих соединения с одного сокета
+
+    :return: адрес фермы, процессы фермы
+    """
+    server = FarmServer(('127.0.0.1', 0), FarmHandler)
+    farm = [Process(target=server.serve_forever) for _ in xrange(processes)]
+    for process in farm:
+        process.daemon = True
+        process.start()
+    server.socket.close()
+    return 'http://{}:{}'.format(*server.server_address), farm
+
+
+def make_urls(base, count, seed=1):
+    rnd = random.Random(seed)
+    paths = []
+    for path, weight in FARM_MIX:
+        paths.extend([path] * weight)
+    return [base + rnd.choice(paths).format(i) for i in xrange(count)]
+
+
+class FakeTask(object):
+    def __init__(self, task_id, data, pri=0):
+        self.task_id = task_id
+        self.data = data
+        self.pri = pri
+
+
+class FakeTube(object):
+    """
+    Очередь в памяти процесса с методами lib.tube.BatchTube, которые нужны обработчикам.
+    Задачи на перепроверку только считаются и снова не выдаются.
+
+    :param sleep: функция ожидания задачи, когда очередь пуста (gevent.sleep для gevent_worker)
+    """
+
+    def __init__(self, tasks=(), sleep=time.sleep):
+        self.tasks = deque(tasks)
+        self.sleep = sleep
+        self.opt = {'tube': 'bench'}
+        self.unacked = len(self.tasks)
+        self.put = 0
+        self.taken_at = {}
+        self.latencies = []
+
+    def take_batch(self, count, timeout=0):
+        if not self.tasks:
+            if timeout:
+                self.sleep(min(timeout, 0.05))
+            return []
+        tasks = [self.tasks.popleft() for _ in xrange(min(count, len(self.tasks)))]
+        now = time.time()
+        for task in tasks:
+            self.taken_at[task.task_id] = now
+        return tasks
+
+    def put_batch(self, items, **kwargs):
+        self.put += len(items)
+        return len(items)
+
+    def ack_batch(self, tasks):
+        now = time.time()
+        for task in tasks:
+            self.latencies.append(now - self.taken_at.pop(task.task_id))
+        self.unacked -= len(tasks)
+        return set(task.task_id for task in tasks)
+
+
+class FakeParent(object):
+    """Заменяет lib.utils.ParentWatcher: обработчик завершается, когда подтверждены все задачи"""
+
+    def __init__(self, tube):
+        self.tube = tube
+
+    def alive(self):
+        return self.tube.unacked > 0
+
+
+def get_rss():
+    # peak resident set size, kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_worker(config, tasks, results):
+    """Выполняет tasks обработчиком config.WORKER_BACKEND и кладет его замеры в results"""
+    input_tube = FakeTube(tasks, gevent.sleep if config.WORKER_BACKEND == 'gevent' else time.sleep)
+    output_tube = FakeTube()
+    lib.worker.get_tubes = lambda config: (input_tube, output_tube)
+    lib.worker.ParentWatcher = lambda parent_pid: FakeParent(input_tube)
+
+    lib.worker.WORKER_BACKENDS[config.WORKER_BACKEND](config, os.getppid())
+    results.put((input_tube.latencies, input_tube.put, get_rss()))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(q * (len(values) - 1)))]
+
+
+def make_config(path, backend='process', chains=None, per_host=None, budget=None):
+    config = load_config_from_pyfile(path)
+    config.WORKER_BACKEND = backend
+    if chains:
+        config.MULTI_MAX_CHAINS = config.GEVENT_POOL_SIZE = chains
+    config.MAX_REQUESTS_PER_HOST = per_host
+    config.CHAIN_TIMEOUT = budget
+    # the benchmark measures the checker alone
+    config.WORKER_MAX_TASKS = config.WORKER_MAX_RSS = None
+    config.RATE_LIMIT = config.STATS_INTERVAL = config.RESULT_CACHE_PATH = config.HOP_CACHE_SNAPSHOT = None
+    config.BREAKER_FILE = config.METRICS_PORT = config.PROFILE_DIR = None
+    return config
+
+
+class WorkerFailed(Exception):
+    pass
+
+
+def bench_workers(config, urls, workers, timeout):
+    """
+    :return: задач в секунду, времена задач, перепроверок, наибольший RSS обработчика
+    :raise WorkerFailed: если обработчик завершился, не выполнив задачи, или не выполнил их за timeout секунд
+    """
+    tasks = [FakeTask(i, {'url': url, 'url_id': i}) for i, url in enumerate(urls)]
+    results = Queue()
+    processes = [Process(target=run_worker, args=(config, tasks[i::workers], results)) for i in xrange(workers)]
+
+    started_at = time.time()
+    for process in processes:
+        process.start()
+    measures = []
+    while len(measures) < workers:
+        try:
+            measures.append(results.get(timeout=1))
+        except Empty:
+            failed = [process for process in processes if process.exitcode]
+            timed_out = time.time() - started_at > timeout
+            if failed or timed_out:
+                for process in processes:
+                    process.terminate()
+                if timed_out:
+                    raise WorkerFailed('workers did not finish in {}s'.format(timeout))
+                raise WorkerFailed('worker failed with exit code {}'.format(failed[0].exitcode))
+    elapsed = time.time() - started_at
+    for process in processes:
+        process.join()
+
+    latencies = [latency for worker_latencies, _, _ in measures for latency in worker_latencies]
+    return (
+        len(latencies) / elapsed,
+        latencies,
+        sum(put for _, put, _ in measures),
+        max(rss for _, _, rss in measures)
+    )
+
+
+def bench_history(config, urls):
+    """:return: то же, что bench_workers, для последовательных вызовов get_redirect_history"""
+    curl_pool = CurlPool(config.CURL_POOL_SIZE, config.CURL_POOL_MAX_IDLE)
+    settings = CheckSettings(
+        config.HTTP_TIMEOUT,
+        max_redirects=config.MAX_REDIRECTS,
+        user_agent=config.USER_AGENT,
+        curl_pool=curl_pool,
+        counter_scanner=get_counter_scanner(config.EXTRA_COUNTER_TYPES),
+        budget=config.CHAIN_TIMEOUT,
+        connect_timeout=config.CONNECT_TIMEOUT,
+        retries=config.HOP_RETRIES,
+        retry_delay=config.HOP_RETRY_DELAY
+    )
+    latencies = []
+    failed = 0
+
+    started_at = time.time()
+    for url in urls:
+        chain_started_at = time.time()
+        history_types, _, _ = get_redirect_history(url, settings)
+        latencies.append(time.time() - chain_started_at)
+        failed += 'ERROR' in history_types or 'DEADLINE' in history_types
+    elapsed = time.time() - started_at
+
+    curl_pool.close()
+    return len(urls) / elapsed, latencies, failed, get_rss()
+
+
+ROW = '{:<22} {:>7} {:>6} {:>8} {:>6} '
+"""Начало строки таблицы: бэкенд, обработчиков, размер пула цепочек, запросов к хосту, бюджет цепочки"""
+
+
+def report(name, workers, chains, config, measures):
+    rate, latencies, rechecks, rss = measures
+    print (ROW + '{:>9.1f} {:>8.1f} {:>8.1f} {:>8} {:>7.1f}').format(
+        name, workers, chains or '-', config.MAX_REQUESTS_PER_HOST or '-', config.CHAIN_TIMEOUT or '-',
+        rate, 1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.99), rechecks, rss / 1024.0 ** 2
+    )
+
+
+def report_failure(name, workers, chains, config, error):
+    print (ROW + '{}').format(
+        name, workers, chains or '-', config.MAX_REQUESTS_PER_HOST or '-', config.CHAIN_TIMEOUT or '-', error
+    )
+
+
+def parse_list(value):
+    return [item for item in value.split(',') if item]
+
+
+def parse_numbers(value):
+    """:return: числа из списка через запятую, 0 - None (без ограничения)"""
+    return [float(item) or None for item in parse_list(value)]
+
+
+def main(argv):
+    parser = ArgumentParser(description='End-to-end redirect checker benchmark')
+    parser.add_argument('--tasks', type=int, default=2000, help='tasks per run')
+    parser.add_argument('--history-tasks', type=int, default=200, help='urls for get_redirect_history, 0 - skip')
+    parser.add_argument('--workers', type=parse_list, default=['1', '2', '4'], help='worker counts')
+    parser.add_argument('--backends', type=parse_list, default=['process', 'multi', 'gevent'])
+    parser.add_argument('--chains', type=parse_list, default=['20', '100'],
+                        help='MULTI_MAX_CHAINS / GEVENT_POOL_SIZE values')
+    parser.add_argument('--per-host', type=parse_numbers,
+                        help='MAX_REQUESTS_PER_HOST values, 0 - no limit; default - the config value')
+    parser.add_argument('--budgets', type=parse_numbers, help='CHAIN_TIMEOUT values, 0 - no limit; '
+                                                              'default - the config value and {}'.format(SHORT_BUDGET))
+    parser.add_argument('--run-timeout', type=float, default=600, help='seconds for one run of workers')
+    parser.add_argument('--farm-processes', type=int, default=4)
+    parser.add_argument('--config', default=os.path.join(source_dir, 'config', 'checker_config.py'))
+    args = parser.parse_args(argv[1:])
+
+    defaults = load_config_from_pyfile(args.config)
+    per_host_values = [int(value) if value else None for value in args.per_host or [defaults.MAX_REQUESTS_PER_HOST]]
+    budgets = args.budgets or [defaults.CHAIN_TIMEOUT, SHORT_BUDGET]
+
+    base, farm = start_farm(args.farm_processes)
+    urls = make_urls(base, args.tasks)
+    print 'Farm {}, {} tasks: {}'.format(base, args.tasks, ', '.join(
+        '{} {}%'.format(path.format('N'), weight) for path, weight in FARM_MIX
+    ))
+    print (ROW + '{:>9} {:>8} {:>8} {:>8} {:>7}').format(
+        'backend', 'workers', 'chains', 'per host', 'budget', 'tasks/s', 'p50 ms', 'p99 ms', 'rechecks', 'rss MB'
+    )
+
+    try:
+        if args.history_tasks:
+            # requests are sequential, the per host limit does not apply
+            for budget in budgets:
+                config = make_config(args.config, budget=budget)
+                report('get_redirect_history', 1, None, config, bench_history(config, urls[:args.history_tasks]))
+
+        for backend in args.backends:
+            chains_values = [int(chains) for chains in args.chains] if backend != 'process' else [None]
+            # process workers make one request at a time
+            backend_per_host_values = per_host_values if backend != 'process' else [None]
+            for chains in chains_values:
+                for per_host in backend_per_host_values:
+                    for budget in budgets:
+                        for workers in args.workers:
+                            config = make_config(args.config, backend, chains, per_host, budget)
+                            try:
+                                measures = bench_workers(config, urls, int(workers), args.run_timeout)
+                            except WorkerFailed as e:
+                                report_failure(backend, workers, chains, config, e)
+                            else:
+                                report(backend, workers, chains, config, measures)
+    finally:
+        for process in farm:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python2.7
+# coding: utf-8
+"""
+Сравнивает поиск счетчиков по странице циклом re.match('.*pattern.*')
+(как было в lib.get_counters) и CounterScanner.
+
+Запуск: ./benchmarks/bench_counters.py [page.html ...]
+Без аргументов проверяются сгенерированные страницы размером 256KB, 1MB и 4MB.
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+source_dir = os.path.join(os.path.dirname(__file__), '..', 'source')
+sys.path.insert(0, source_dir)
+
+from lib import COUNTER_TYPES
+from lib.counters import CounterScanner
+
+PAGE_CHUNKS = (
+    '<div class="item"><a href="/catalog/{0}">Item {0}</a></div>\n',
+    '<script src="/static/app.{0}.js"></script>\n',
+    '<img src="//cdn.example.com/i/{0}.png" alt="google mail counter top">\n',
+    '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit {0}.</p>\n',
+)
+
+COUNTER_SNIPPETS = (
+    '<script src="//mc.yandex.ru/metrika/watch.js"></script>\n',
+    '<img src="//top-fwz1.mail.ru/counter?id={0};js=na" height="1" width="1">\n',
+)
+
+
+def make_page(size, seed=1):
+    rnd = random.Random(seed)
+    chunks = []
+    length = 0
+    while length < size:
+        chunk = rnd.choice(PAGE_CHUNKS).format(rnd.randint(0, 10 ** 6))
+        chunks.append(chunk)
+        length += len(chunk)
+    # counters are usually in the head and at the end of the body
+    chunks.insert(len(chunks) // 10, COUNTER_SNIPPETS[0])
+    chunks.append(COUNTER_SNIPPETS[1].format(seed))
+    return ''.join(chunks)
+
+
+def regexp_loop(rules):
+    compiled = [(name, re.compile('.*' + pattern + '.*', re.I + re.S)) for name, pattern in rules]
+
+    def get_counters(content):
+        return [name for name, regexp in compiled if re.match(regexp, content)]
+
+    return get_counters
+
+
+def bench(name, func, content, number):
+    seconds = min(timeit.repeat(lambda: func(content), number=number, repeat=3)) / number
+    print '  {:<14} {:>9.2f} ms'.format(name, seconds * 1000)
+    return seconds
+
+
+def main(argv):
+    if argv[1:]:
+        pages = [(path, open(path).read()) for path in argv[1:]]
+    else:
+        pages = [('{}KB'.format(size // 1024), make_page(size)) for size in (256 * 1024, 1024 ** 2, 4 * 1024 ** 2)]
+
+    old = regexp_loop(COUNTER_TYPES)
+    scanner = CounterScanner(COUNTER_TYPES)
+
+    for title, content in pages:
+        assert old(content) == scanner.scan(content)
+        number = max(1, (4 * 1024 ** 2) // len(content))
+        print '{} ({} bytes), counters: {}'.format(title, len(content), ', '.join(scanner.scan(content)))
+        old_time = bench('regexp loop', old, content, number)
+        new_time = bench('CounterScanner', scanner.scan, content, number)
+        print '  speedup        {:>9.1f}x'.format(old_time / new_time)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python2.7
+# coding: utf-8
+"""
+Сравнивает нормализацию урлов прежней функцией prepare_url (полный разбор
+каждого урла) с prepare_url с проверкой уже нормализованных ASCII урлов
+и запоминанием результатов.
+
+Запуск: ./benchmarks/bench_prepare_url.py [urls.txt]
+Без аргументов используется сгенерированный набор урлов, похожий на хопы
+рекламных цепочек: по каждому урлу в среднем несколько обращений.
+"""
+import os
+import random
+import sys
+import timeit
+from urllib import quote, quote_plus
+from urlparse import urlparse, urlunparse
+
+source_dir = os.path.join(os.path.dirname(__file__), '..', 'source')
+sys.path.insert(0, source_dir)
+
+import lib
+from lib import prepare_url, to_str, to_unicode
+
+URL_TEMPLATES = (
+    'http://ad.example.com/click?bid={0}&cid={1}&url=http%3A%2F%2Fshop.example.ru%2F',
+    'https://tracker{1}.example.net/r/{0}/{1}',
+    'http://bit.example/{0:x}',
+    u'http://магазин.рф/каталог/{0}?q=товар {1}',
+    'http://example.com/path with spaces/{0}?a=b|c',
+)
+
+
+def original_prepare_url(url):
+    if url is None:
+        return url
+    scheme, netloc, path, qs, anchor, fragments = urlparse(
+        to_unicode(url),
+        allow_fragments=False
+    )
+    try:
+        netloc = netloc.encode('idna')
+    except UnicodeError:
+        pass
+    path = quote(to_str(path, 'ignore'), safe='/%+$!*\'(),')
+    qs = quote_plus(to_str(qs, 'ignore'), safe=':&%=+$!*\'(),')
+    return urlunparse((scheme, netloc, path, qs, anchor, fragments))
+
+
+def make_urls(count, calls_per_url=4, chains=200, seed=1):
+    rnd = random.Random(seed)
+    urls = [
+        rnd.choice(URL_TEMPLATES).format(rnd.randint(0, 10 ** 6), rnd.randint(0, 100))
+        for _ in xrange(count)
+    ]
+    # every hop url is normalized several times (in the chain, for the request and
+    # on return) while up to `chains` chains are checked concurrently
+    calls = []
+    for start in xrange(0, count, chains):
+        window = urls[start:start + chains] * calls_per_url
+        rnd.shuffle(window)
+        calls.extend(window)
+    return calls
+
+
+def bench(name, func, urls, number=3, setup='pass'):
+    def run():
+        for url in urls:
+            func(url)
+
+    seconds = min(timeit.repeat(run, setup, number=1, repeat=number))
+    print '  {:<22} {:>9.2f} us/url'.format(name, seconds * 10 ** 6 / len(urls))
+    return seconds
+
+
+def main(argv):
+    if argv[1:]:
+        urls = [line.strip() for line in open(argv[1]) if line.strip()]
+    else:
+        urls = make_urls(20000)
+
+    for url in set(urls):
+        assert original_prepare_url(url) == prepare_url(url)
+
+    print '{} urls, {} unique'.format(len(urls), len(set(urls)))
+    old_time = bench('original', original_prepare_url, urls)
+    fast_time = bench('fast path, no memo', lib._prepare_url, urls)
+    # every run starts with an empty memo
+    new_time = bench('prepare_url', prepare_url, urls, setup=lib._prepared_urls.clear)
+    print '  speedup (fast path)    {:>9.1f}x'.format(old_time / fast_time)
+    print '  speedup (prepare_url)  {:>9.1f}x'.format(old_time / new_time)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
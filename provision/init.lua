@@ -688,6 +688,21 @@ queue.put = function(space, tube, ...)
     return put_task(space, tube, queue.default.ipri, ...)
 end
 
+-- queue.put_batch(space, tube, delay, ttl, ttr, pri, data, pri, data, ...)
+--  put several tasks with one data field into queue,
+--  every task is a pair of priority and data
+--  returns number of put tasks
+queue.put_batch = function(space, tube, delay, ttl, ttr, ...)
+    space = tonumber(space)
+    local count = math.floor(select('#', ...) / 2)
+    for i = 1, count do
+        local pri, data = select(2 * i - 1, ...)
+        queue.stat[space][tube]:inc('put')
+        put_task(space, tube, queue.default.ipri, delay, ttl, ttr, pri, data)
+    end
+    return tostring(count)
+end
+
 -- queue.put_unique(space, tube, delay, ttl, ttr, pri, ...)
 --  put unique task into queue.
 --   arguments
@@ -743,9 +758,54 @@ queue.urgent = function(space, tube, delayed, ...)
     return put_task(space, tube, ipri, delayed, ...)
 end
 
--- queue.take(space, tube, timeout)
--- take task for processing
-queue.take = function(space, tube, timeout)
+-- take_ready(space, tube)
+-- take ready task without waiting, returns nil if there is no ready task
+local function take_ready(space, tube)
+
+    local iterator = box.space[space].index[idx_tube]
+                            :iterator(box.index.EQ, tube, ST_READY)
+
+    for task in iterator do
+        local now = box.time64()
+        local created = box.unpack('l', task[i_created])
+        local ttr = box.unpack('l', task[i_ttr])
+        local ttl = box.unpack('l', task[i_ttl])
+        local event = now + ttr
+        if event > created + ttl then
+            event = created + ttl
+            -- tube started too late
+            if event <= now then
+                return
+            end
+        end
+
+
+        task = box.update(space,
+            task[i_uuid],
+                '=p=p=p+p',
+                i_status,
+                ST_TAKEN,
+
+                i_event,
+                event,
+
+                i_cid,
+                box.session.id(),
+
+                i_ctaken,
+                1
+        )
+
+        queue.workers[space][tube].ch:put(true, 0)
+        queue.consumers[space][tube]:put(true, 0)
+        queue.stat[space][tube]:inc('take')
+        return task
+    end
+end
+
+-- take_task(space, tube, timeout)
+-- take task waiting for it like queue.take
+local function take_task(space, tube, timeout)
 
     space = tonumber(space)
 
@@ -762,44 +822,9 @@ queue.take = function(space, tube, timeout)
 
     while true do
 
-        local iterator = box.space[space].index[idx_tube]
-                                :iterator(box.index.EQ, tube, ST_READY)
-
-        for task in iterator do
-            local now = box.time64()
-            local created = box.unpack('l', task[i_created])
-            local ttr = box.unpack('l', task[i_ttr])
-            local ttl = box.unpack('l', task[i_ttl])
-            local event = now + ttr
-            if event > created + ttl then
-                event = created + ttl
-                -- tube started too late
-                if event <= now then
-                    break
-                end
-            end
-
-
-            task = box.update(space,
-                task[i_uuid],
-                    '=p=p=p+p',
-                    i_status,
-                    ST_TAKEN,
-
-                    i_event,
-                    event,
-
-                    i_cid,
-                    box.session.id(),
-
-                    i_ctaken,
-                    1
-            )
-
-            queue.workers[space][tube].ch:put(true, 0)
-            queue.consumers[space][tube]:put(true, 0)
-            queue.stat[space][tube]:inc('take')
-            return rettask(task)
+        local task = take_ready(space, tube)
+        if task ~= nil then
+            return task
         end
 
         if timeout > 0 then
@@ -816,6 +841,52 @@ queue.take = function(space, tube, timeout)
     end
 end
 
+-- queue.take(space, tube, timeout)
+-- take task for processing
+queue.take = function(space, tube, timeout)
+    return rettask(take_task(space, tube, timeout))
+end
+
+
+-- rettask_pri(task)
+-- like rettask, but with task priority (as queue.put accepts it) after status
+local function rettask_pri(task)
+    local pri = max_pri - pri_unpack(task[i_pri]) + min_pri - queue.default.pri
+    return task
+        :transform(i_event, i_task - i_event, tostring(pri))
+        :transform(i_status, 1, human_status[ task[i_status] ])
+end
+
+-- queue.take_batch(space, tube, count, timeout)
+-- take up to count tasks for processing: waits for the first task
+-- like queue.take (but doesn't wait if timeout is 0),
+-- the others are taken only if they are ready
+--  returns tasks like queue.take, with priority after status
+queue.take_batch = function(space, tube, count, timeout)
+
+    space = tonumber(space)
+
+    local task
+    if timeout ~= nil and tonumber(timeout) <= 0 then
+        task = take_ready(space, tube)
+    else
+        task = take_task(space, tube, timeout)
+    end
+    if task == nil then
+        return
+    end
+
+    local tasks = { rettask_pri(task) }
+    for i = 2, tonumber(count) do
+        task = take_ready(space, tube)
+        if task == nil then
+            break
+        end
+        table.insert(tasks, rettask_pri(task))
+    end
+    return unpack(tasks)
+end
+
 
 -- queue.delete(space, id)
 --  deletes task from queue
@@ -853,6 +924,26 @@ queue.ack = function(space, id)
 end
 
 
+-- process_batch(method, space, id, ...)
+-- calls method for each task, returns ids of tasks processed without errors
+local function process_batch(method, space, ...)
+    local processed = {}
+    for i = 1, select('#', ...) do
+        local id = select(i, ...)
+        if pcall(method, space, id) then
+            table.insert(processed, id)
+        end
+    end
+    return unpack(processed)
+end
+
+-- queue.ack_batch(space, id, ...)
+--  done processing of several tasks, returns ids of acked tasks
+queue.ack_batch = function(space, ...)
+    return process_batch(queue.ack, space, ...)
+end
+
+
 -- queue.touch(space, id)
 --  prolong ttr for taken task
 queue.touch = function(space, id)
@@ -958,6 +1049,12 @@ queue.bury = function(space, id)
     return rettask(task)
 end
 
+-- queue.bury_batch(space, id, ...)
+--  bury several tasks, returns ids of buried tasks
+queue.bury_batch = function(space, ...)
+    return process_batch(queue.bury, space, ...)
+end
+
 -- queue.dig(space, id)
 --  dig(unbury) task
 queue.dig = function(space, id)
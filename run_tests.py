@@ -13,6 +13,23 @@ from tests.test_redirect_checker import RedirectCheckerTestCase
 from tests.test_lib_init import LibInitCase
 from tests.test_lib_utils import LibUtilsCase
 from tests.test_lib_worker import LibWorkerTestCase
+from tests.test_lib_engine import LibEngineTestCase
+from tests.test_lib_curl_pool import LibCurlPoolTestCase
+from tests.test_lib_counters import LibCountersTestCase
+from tests.test_lib_meta import LibMetaTestCase
+from tests.test_lib_policy import LibPolicyTestCase
+from tests.test_lib_hop_cache import LibHopCacheTestCase
+from tests.test_lib_result_cache import LibResultCacheTestCase
+from tests.test_lib_rate_limit import LibRateLimitTestCase
+from tests.test_lib_stats import LibStatsTestCase
+from tests.test_lib_tube import LibTubeTestCase
+from tests.test_lib_publisher import LibPublisherTestCase
+from tests.test_lib_supervisor import LibSupervisorTestCase
+from tests.test_lib_autoscale import LibAutoscaleTestCase
+from tests.test_lib_breaker import LibBreakerTestCase
+from tests.test_lib_metrics import LibMetricsTestCase
+from tests.test_lib_profiler import LibProfilerTestCase
+from tests.test_lib_shared_state import LibSharedStateTestCase
 
 
 class MockedConnection():
@@ -37,6 +54,23 @@ if __name__ == '__main__':
         unittest.makeSuite(LibInitCase),
         unittest.makeSuite(LibUtilsCase),
         unittest.makeSuite(LibWorkerTestCase),
+        unittest.makeSuite(LibEngineTestCase),
+        unittest.makeSuite(LibCurlPoolTestCase),
+        unittest.makeSuite(LibCountersTestCase),
+        unittest.makeSuite(LibMetaTestCase),
+        unittest.makeSuite(LibPolicyTestCase),
+        unittest.makeSuite(LibHopCacheTestCase),
+        unittest.makeSuite(LibResultCacheTestCase),
+        unittest.makeSuite(LibRateLimitTestCase),
+        unittest.makeSuite(LibStatsTestCase),
+        unittest.makeSuite(LibTubeTestCase),
+        unittest.makeSuite(LibPublisherTestCase),
+        unittest.makeSuite(LibSupervisorTestCase),
+        unittest.makeSuite(LibAutoscaleTestCase),
+        unittest.makeSuite(LibBreakerTestCase),
+        unittest.makeSuite(LibMetricsTestCase),
+        unittest.makeSuite(LibProfilerTestCase),
+        unittest.makeSuite(LibSharedStateTestCase),
     ))
 
     with MockedConnection():
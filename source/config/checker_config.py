@@ -13,16 +13,126 @@ OUTPUT_QUEUE_SPACE = 0
 OUTPUT_QUEUE_TUBE = 'url_redirect.queue'
 
 WORKER_POOL_SIZE = 10
+# the pool grows up to WORKER_POOL_MAX_SIZE workers while the input queue falls behind
+# and shrinks back to WORKER_POOL_SIZE, None - always WORKER_POOL_SIZE workers
+WORKER_POOL_MAX_SIZE = None
+# the pool grows / shrinks by AUTOSCALE_STEP workers when ready tasks would wait longer / less
+# than this many seconds at the current take rate, at most once in AUTOSCALE_COOLDOWN seconds
+AUTOSCALE_UP_BACKLOG = 30
+AUTOSCALE_DOWN_BACKLOG = 5
+AUTOSCALE_STEP = 2
+AUTOSCALE_COOLDOWN = 60
+# the pool shrinks while load average per cpu or free memory (bytes) is past these limits
+AUTOSCALE_MAX_LOAD = 0.9
+AUTOSCALE_MIN_FREE_MEMORY = 256 * 1024 * 1024
+# a worker is restarted after taking this many tasks or using more memory (bytes), None - never
+WORKER_MAX_TASKS = 100000
+WORKER_MAX_RSS = 512 * 1024 * 1024
+# seconds a stopped worker may finish its tasks before it is killed
+WORKER_DRAIN_TIMEOUT = 60
+# exit code of the checker stopped by SIGTERM (after its workers are drained)
+EXIT_CODE = 0
+# process - one chain at a time per worker, multi - up to MULTI_MAX_CHAINS chains per worker,
+# gevent - up to GEVENT_POOL_SIZE greenlets per worker, each checks one chain
+WORKER_BACKEND = 'process'
+MULTI_MAX_CHAINS = 200
+GEVENT_POOL_SIZE = 100
+# concurrent requests to one host made by a multi worker, None - no limit
+MAX_REQUESTS_PER_HOST = 20
+
+# idle curl handles kept by each worker and seconds before an idle handle is closed
+CURL_POOL_SIZE = 10
+CURL_POOL_MAX_IDLE = 60
 QUEUE_TAKE_TIMEOUT = 0.1
+# seconds an idle worker waits for a task, the task is taken as soon as it is put
+QUEUE_IDLE_TAKE_TIMEOUT = 5
+# tasks taken from the input queue with one request by multi and gevent workers,
+# process workers take one task at a time to check it before the queue ttr
+QUEUE_TAKE_BATCH = 10
+# results sent to the queues with one request and seconds a result may wait to be sent
+RESULT_BATCH_SIZE = 100
+RESULT_FLUSH_INTERVAL = 0.5
 
 SLEEP = 10
 
 HTTP_TIMEOUT = 3
+# seconds to establish a connection, at most HTTP_TIMEOUT
+CONNECT_TIMEOUT = 1
+# seconds to check the whole chain, hop timeouts are cut to fit it; None - no limit
+CHAIN_TIMEOUT = 20
 MAX_REDIRECTS = 30
+# a request failed with a connection reset or 5xx is repeated up to HOP_RETRIES times
+# after HOP_RETRY_DELAY, 2 * HOP_RETRY_DELAY, ... seconds; other failed tasks are rechecked
+# through the input queue after RECHECK_DELAY seconds
+HOP_RETRIES = 2
+HOP_RETRY_DELAY = 0.5
 RECHECK_DELAY = 300
+# a recheck continues from the last good hop of the failed check; the first hop is requested
+# again and the chain is checked from the start if it has changed
+RECHECK_VERIFY_FIRST_HOP = True
+# bytes of the final page downloaded for counter search, None - whole page
+MAX_BODY_SIZE = 1024 * 1024
+# responses with bigger Content-Length or not html are not downloaded, None - no limit
+MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+# urls of these domains (and subdomains) are checked with HEAD before GET
+HEAD_FIRST_DOMAINS = ()
+
+# http redirects cache, 0 - disabled
+HOP_CACHE_SIZE = 10000
+HOP_CACHE_MAX_MEMORY = 16 * 1024 * 1024
+# seconds to keep 301/308 and other redirects without Cache-Control/Expires
+HOP_CACHE_PERMANENT_TTL = 24 * 60 * 60
+HOP_CACHE_DEFAULT_TTL = 0
+# file to keep the cache between worker restarts, None - not saved
+HOP_CACHE_SNAPSHOT = None
+HOP_CACHE_SNAPSHOT_INTERVAL = 300
+
+# sqlite file with chain results shared by all workers of the node, None - disabled
+RESULT_CACHE_PATH = None
+RESULT_CACHE_TTL = 300
+
+# requests per second made by all workers of the node, None - no limit
+RATE_LIMIT = None
+RATE_LIMIT_BURST = None
+RATE_LIMIT_FILE = '/tmp/redirect_checker.rate'
+
+# seconds between request timing stats in the worker log, None - not collected
+STATS_INTERVAL = 60
+
+# prometheus metrics of all workers on http://METRICS_HOST:METRICS_PORT/metrics (e.g. 9102), None - not collected;
+# workers write them to files in METRICS_DIR (better on tmpfs)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+METRICS_DIR = '/dev/shm/redirect_checker.metrics'
+
+# kill -USR2 <redirect_checker pid> profiles all workers for PROFILE_DURATION seconds: with
+# PROFILE_MODE = 'sample' stacks are sampled every PROFILE_INTERVAL seconds of cpu time and written
+# as collapsed stacks (flamegraph.pl), with 'cprofile' workers run under cProfile and write pstats;
+# results are written to PROFILE_DIR/<pid>.<time>.collapsed|pstats, None - profiling is disabled
+PROFILE_DIR = None
+PROFILE_MODE = 'sample'
+PROFILE_DURATION = 30
+PROFILE_INTERVAL = 0.005
+
+# workers stop taking tasks when BREAKER_THRESHOLD of at least BREAKER_MIN_CHAINS chains checked
+# in BREAKER_WINDOW seconds fail with connect timeouts or dns errors (not with the CHAIN_TIMEOUT
+# deadline), state is shared through BREAKER_FILE (e.g. '/tmp/redirect_checker.breaker'), None - tasks
+# are always taken; dead domains of the checked urls fail with dns errors too, so enable it for sets
+# of urls that mostly resolve
+BREAKER_FILE = None
+BREAKER_WINDOW = 30
+BREAKER_MIN_CHAINS = 20
+BREAKER_THRESHOLD = 0.5
+# seconds before BREAKER_PROBES probe tasks are taken, twice as many tasks are let in
+# after each successful step, after BREAKER_STEPS steps tasks are taken as usual
+BREAKER_OPEN_TIMEOUT = 30
+BREAKER_PROBES = 5
+BREAKER_STEPS = 3
+
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/31.0.1650.63 Safari/537.36"
 
-CHECK_URL = "http://t.mail.ru"
+# counters searched on the final page in addition to lib.COUNTER_TYPES: (name, regexp)
+EXTRA_COUNTER_TYPES = ()
 
 LOGGING = {
     'version': 1,
@@ -1,33 +1,89 @@
 # coding: utf-8
 from StringIO import StringIO
 from logging import getLogger, NullHandler
+from math import ceil
 import re
+from time import sleep, time
 from urllib import quote, quote_plus
 from urlparse import urljoin, urlsplit, urlparse, urlunparse
 
 from bs4 import BeautifulSoup
 import pycurl
 
+from counters import CounterScanner
+from meta import MarkupError, find_first_meta
+
 logger = getLogger('redirect_checker')
 logger.addHandler(NullHandler())
 
 REDIRECT_META = 'meta_tag'
 REDIRECT_HTTP = 'http_status'
 
+DEADLINE_EXCEEDED = 'DEADLINE'
+"""Тип последнего хопа цепочки, проверка которой не уложилась в общий бюджет времени"""
+
 OK_REDIRECT = re.compile(r'http://(www\.)?odnoklassniki\.ru/.*st\.redirect', re.I)
 OK_URL = re.compile(r'http(?:s)?://(www\.)?odnoklassniki\.ru/', re.I)
 MM_URL = re.compile(r'http(?:s)?://my\.mail\.ru/apps/', re.I)
 
 COUNTER_TYPES = (
-    ('GOOGLE_ANALYTICS', re.compile(r'.*google-analytics\.com/ga\.js.*', re.I+re.S)),
-    ('YA_METRICA', re.compile(r'.*mc\.yandex\.ru/metrika/watch\.js.*', re.I+re.S)),
-    ('TOP_MAIL_RU', re.compile(r'.*top-fwz1\.mail\.ru/counter.*', re.I+re.S)),
-    ('TOP_MAIL_RU', re.compile(r'.*top\.mail\.ru/jump\?from.*', re.I+re.S)),
-    ('DOUBLECLICK', re.compile(r'.*//googleads\.g\.doubleclick\.net/pagead/viewthroughconversion.*', re.I+re.S)),
-    ('VISUALDNA', re.compile(r'.*//a1\.vdna-assets\.com/analytics\.js.*', re.I+re.S)),
-    ('LI_RU', re.compile(r'.*/counter\.yadro\.ru/hit.*', re.I+re.S)),
-    ('RAMBLER_TOP100', re.compile(r'.*counter\.rambler\.ru/top100.*', re.I+re.S))
+    ('GOOGLE_ANALYTICS', r'google-analytics\.com/ga\.js'),
+    ('YA_METRICA', r'mc\.yandex\.ru/metrika/watch\.js'),
+    ('TOP_MAIL_RU', r'top-fwz1\.mail\.ru/counter'),
+    ('TOP_MAIL_RU', r'top\.mail\.ru/jump\?from'),
+    ('DOUBLECLICK', r'//googleads\.g\.doubleclick\.net/pagead/viewthroughconversion'),
+    ('VISUALDNA', r'//a1\.vdna-assets\.com/analytics\.js'),
+    ('LI_RU', r'/counter\.yadro\.ru/hit'),
+    ('RAMBLER_TOP100', r'counter\.rambler\.ru/top100')
 )
+"""Правила поиска счетчиков: имя счетчика, регулярное выражение (без учета регистра)"""
+
+_counter_scanners = {}
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+REDIRECT_DRAIN_SIZE = 4 * 1024
+"""Тело редиректа не больше этого размера дочитывается (чтобы сохранить keep-alive соединение)"""
+
+HEAD_SIZE = 64 * 1024
+"""Мета-редирект ищется во время загрузки в первых HEAD_SIZE байтах страницы"""
+
+HEAD_END = re.compile(r'</head\s*>|<body[\s>]', re.I)
+
+NORMALIZED_URL = re.compile(
+    r"[a-z][a-z0-9+.-]*://[A-Za-z0-9._:@-]+"
+    r"(?:/[A-Za-z0-9_./%+$!*'(),-]*)?"
+    r"(?:\?[A-Za-z0-9_.:&%=+$!*'(),-]+)?\Z"
+)
+"""ASCII урлы, которые prepare_url не изменяет"""
+
+PREPARED_URLS_CACHE_SIZE = 10000
+
+HOP_TIMINGS = (
+    ('namelookup', 'NAMELOOKUP_TIME'),
+    ('connect', 'CONNECT_TIME'),
+    ('appconnect', 'APPCONNECT_TIME'),
+    ('starttransfer', 'STARTTRANSFER_TIME'),
+    ('total', 'TOTAL_TIME'),
+)
+"""Времена запроса, сохраняемые для каждого хопа (секунды от начала запроса)"""
+
+ERROR_KINDS = (
+    ('dns', (pycurl.E_COULDNT_RESOLVE_PROXY, pycurl.E_COULDNT_RESOLVE_HOST)),
+    ('connect', (pycurl.E_COULDNT_CONNECT, pycurl.E_SEND_ERROR, pycurl.E_RECV_ERROR, pycurl.E_GOT_NOTHING,
+                 pycurl.E_PARTIAL_FILE)),
+    ('timeout', (pycurl.E_OPERATION_TIMEDOUT,)),
+    ('tls', (pycurl.E_SSL_CONNECT_ERROR, pycurl.E_SSL_CERTPROBLEM, pycurl.E_SSL_CIPHER, pycurl.E_SSL_CACERT,
+             pycurl.E_SSL_CACERT_BADFILE, pycurl.E_SSL_SHUTDOWN_FAILED)),
+)
+"""Виды ошибок запроса по кодам ошибок curl, остальные ошибки - http"""
+
+TRANSIENT_ERRORS = (pycurl.E_SEND_ERROR, pycurl.E_RECV_ERROR, pycurl.E_GOT_NOTHING, pycurl.E_PARTIAL_FILE)
+"""Ошибки curl, после которых запрос стоит повторить: соединение оборвано сервером или сетью"""
+
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+"""Коды ответа, после которых запрос стоит повторить"""
+_prepared_urls = {}
 
 
 def to_unicode(val, errors='strict'):
@@ -38,27 +94,33 @@ def to_str(val, errors='strict'):
     return val.encode('utf8', errors=errors) if isinstance(val, unicode) else val
 
 
-def get_counters(content):
+def get_counter_scanner(counter_types=None):
+    """
+    :param counter_types: правила поиска счетчиков, по умолчанию COUNTER_TYPES
+    :return: CounterScanner для правил (создается один раз на набор правил)
+    """
+    counter_types = tuple(COUNTER_TYPES if counter_types is None else counter_types)
+    scanner = _counter_scanners.get(counter_types)
+    if scanner is None:
+        scanner = _counter_scanners[counter_types] = CounterScanner(counter_types)
+    return scanner
+
+
+def get_counters(content, scanner=None):
     """
     Ищет в хтмл-странице счетичик и возвращает массив типов найденных
     """
-    counters = []
-    for counter_name, regexp in COUNTER_TYPES:
-        if re.match(regexp, content):
-            counters.append(counter_name)
-    return counters
+    return (scanner or get_counter_scanner()).scan(content)
 
 
-def check_for_meta(content, url):
+def get_refresh_url(attrs, url):
     """
-    Ищет в хтмл-странице мета-редирект теги и возраещет урл редиректа
+    Возвращает урл редиректа по атрибутам тега <meta http-equiv="refresh">
     """
-    soup = BeautifulSoup(content, "html.parser")
-    result = soup.find("meta")
-    if result and 'content' in result.attrs:
-        for attr, value in result.attrs.items():
+    if 'content' in attrs:
+        for attr, value in attrs.items():
             if attr == 'http-equiv' and value.lower() == 'refresh':
-                splitted = result['content'].split(";")
+                splitted = attrs['content'].split(";")
                 if len(splitted) != 2:
                     return
                 wait, text = splitted
@@ -69,48 +131,302 @@ def check_for_meta(content, url):
                     return urljoin(url, to_unicode(meta_url, 'ignore'))
 
 
+def check_for_meta(content, url):
+    """
+    Ищет в хтмл-странице мета-редирект теги и возраещет урл редиректа
+    Рассматривается первый тег <meta> страницы. BeautifulSoup используется,
+    только если разметку не удалось разобрать find_first_meta.
+    """
+    try:
+        attrs = find_first_meta(content)
+    except MarkupError:
+        result = BeautifulSoup(content, "html.parser").find("meta")
+        attrs = result.attrs if result else None
+
+    if attrs:
+        return get_refresh_url(attrs, url)
+
+
 def fix_market_url(url):
     """Преобразует market:// урлы в http://"""
     # removed bugged: 'http://play.google.com/store/apps/' + url.lstrip("market://")
     return 'http://play.google.com/store/apps/' + url[len('market://'):]
 
 
-def make_pycurl_request(url, timeout, useragent=None):
-    """Делает http запрос (без перехода по редиректам)
-    Возвращает контент ответа и возможный редирект
-    :return: содержимое ответа, урл редиректа
+class ResponseStream(object):
+    """
+    Принимает ответ от curl по мере загрузки (HEADERFUNCTION и WRITEFUNCTION).
+
+    Останавливает загрузку, как только ясно, что остаток ответа не нужен:
+     * пришли заголовки редиректа с Location (тело не больше REDIRECT_DRAIN_SIZE
+       дочитывается, не сохраняясь);
+     * в <head> страницы найден мета-редирект;
+     * по заголовкам видно, что тело не нужно загружать (FetchPolicy.should_download),
+       тогда skipped == True;
+     * тело превысило policy.max_body_size байт (сохраненное начало используется
+       для поиска счетчиков).
+    Остановленная загрузка завершается pycurl.error, при этом stopped == True.
+    """
+
+    def __init__(self, url, policy=None, head=False):
+        self.url = url
+        self.policy = policy
+        self.max_body_size = policy.max_body_size if policy else None
+        self.head = head
+        self.buff = StringIO()
+        self.size = 0
+        self.status = None
+        self.headers = {}
+        self.redirect_url = None
+        self.head_checked = False
+        self.truncated = False
+        self.skipped = False
+        self.stopped = False
+
+    @property
+    def needs_body(self):
+        """Нужно ли после HEAD запроса загружать страницу GET запросом"""
+        return self.head and not (self.redirect_url or self.skipped)
+
+    def getvalue(self):
+        """
+        :return: загруженное тело ответа или None, если оно не загружалось
+        """
+        return None if self.skipped else self.buff.getvalue()
+
+    def stop(self):
+        """Прерывает загрузку (curl прерывает запрос, если callback не вернул длину данных)"""
+        self.stopped = True
+        return 0
+
+    def header(self, line):
+        if line.startswith('HTTP/'):
+            # a new response begins (e.g. after 100 Continue)
+            self.status = int(line.split(None, 2)[1])
+            self.headers = {}
+        elif ':' in line:
+            name, value = line.split(':', 1)
+            self.headers[name.strip().lower()] = value.strip()
+        elif not line.strip():
+            location = self.headers.get('location')
+            if self.status in REDIRECT_STATUSES and location:
+                self.redirect_url = urljoin(self.url, location)
+                length = self.headers.get('content-length', '')
+                if not (length.isdigit() and int(length) <= REDIRECT_DRAIN_SIZE):
+                    return self.stop()
+            elif self.status >= 200 and self.policy and not self.policy.should_download(self.headers):
+                self.skipped = True
+                return self.stop()
+
+    def write(self, data):
+        if self.redirect_url:
+            return
+
+        self.size += len(data)
+        if self.max_body_size is not None and self.size > self.max_body_size:
+            self.buff.write(data[:len(data) - (self.size - self.max_body_size)])
+            self.truncated = True
+            return self.stop()
+
+        self.buff.write(data)
+        if not self.head_checked and self.check_head():
+            return self.stop()
+
+    def check_head(self):
+        """
+        Ищет мета-редирект, когда <head> страницы загружен целиком
+        :return: найден ли мета-редирект
+        """
+        head = self.buff.getvalue()[:HEAD_SIZE]
+        end = HEAD_END.search(head)
+        if end is None:
+            self.head_checked = len(head) >= HEAD_SIZE
+            return False
+
+        self.head_checked = True
+        return check_for_meta(head[:end.start()], self.url) is not None
+
+
+def setup_curl(curl, url, timeout, useragent=None, policy=None, head=False, connect_timeout=None):
+    """Настраивает curl-хэндл на запрос урла (без перехода по редиректам)
+    :param timeout: таймаут всего запроса в секундах (может быть дробным)
+    :param policy: FetchPolicy, по умолчанию загружается любой ответ целиком
+    :param head: делать HEAD запрос вместо GET
+    :param connect_timeout: таймаут соединения в секундах, не больше timeout
+    :return: ResponseStream, в который будет записан ответ
 
     """
-    prepared_url = to_str(prepare_url(url), 'ignore')
-    buff = StringIO()
-    curl = pycurl.Curl()
+    prepared_url = normalize_url(url)[1]
+    stream = ResponseStream(prepared_url, policy, head)
     curl.setopt(curl.URL, prepared_url)
+    if head:
+        curl.setopt(curl.NOBODY, True)
     if useragent:
         curl.setopt(curl.USERAGENT, useragent)
-    curl.setopt(curl.WRITEDATA, buff)
+    curl.setopt(curl.HEADERFUNCTION, stream.header)
+    curl.setopt(curl.WRITEFUNCTION, stream.write)
     curl.setopt(curl.FOLLOWLOCATION, False)
-    # curl.setopt(curl.CONNECTTIMEOUT, timeout)
-    curl.setopt(curl.TIMEOUT, timeout)
-    curl.perform()
-    content = buff.getvalue()
-    redirect_url = curl.getinfo(curl.REDIRECT_URL)
-    curl.close()
+    # rounding up, so the request never times out before the chain deadline
+    if connect_timeout:
+        curl.setopt(curl.CONNECTTIMEOUT_MS, int(ceil(min(connect_timeout, timeout) * 1000)))
+    curl.setopt(curl.TIMEOUT_MS, int(ceil(timeout * 1000)))
+    return stream
+
+
+def read_response(curl, stream):
+    """Достает из выполненного curl-хэндла контент ответа и возможный редирект
+    :return: содержимое ответа, урл редиректа
+
+    """
+    content = stream.getvalue()
+    # curl doesn't report the redirect of a transfer stopped on headers
+    redirect_url = curl.getinfo(curl.REDIRECT_URL) or stream.redirect_url
     if redirect_url is not None:
         redirect_url = to_unicode(redirect_url, 'ignore')
     return content, redirect_url
 
 
-def get_url(url, timeout, user_agent=None):
+def read_timings(curl, stream, error=None):
     """
-    :return: урл, тип редиректа, содержимое страницы (если есть)
+    Достает из выполненного (в том числе с ошибкой) curl-хэндла времена запроса
+
+    :param error: pycurl.error, которым завершился запрос
+    :return: урл, метод, код ответа, код ошибки curl (0 - без ошибки),
+        размер загруженного тела и HOP_TIMINGS
+    """
+    timings = {
+        'url': stream.url,
+        'method': 'HEAD' if stream.head else 'GET',
+        'code': curl.getinfo(curl.RESPONSE_CODE),
+        'error': error.args[0] if error is not None else 0,
+        'size': int(curl.getinfo(curl.SIZE_DOWNLOAD)),
+    }
+    for name, info in HOP_TIMINGS:
+        timings[name] = curl.getinfo(getattr(curl, info))
+    return timings
+
+
+def classify_error(error, status=None):
+    """
+    :param error: код ошибки curl, 0 - запрос выполнен
+    :param status: код ответа
+    :return: вид ошибки запроса: dns, connect, timeout, tls (см. ERROR_KINDS)
+        или http (в том числе ответ 5xx), None - запрос успешен
+    """
+    if not error:
+        return 'http' if status >= 500 else None
+    for kind, errors in ERROR_KINDS:
+        if error in errors:
+            return kind
+    return 'http'
+
+
+def is_transient_error(error, status=None):
+    """
+    :param error: код ошибки curl, 0 - запрос выполнен
+    :param status: код ответа
+    :return: может ли повтор запроса быть успешным (TRANSIENT_ERRORS, TRANSIENT_STATUSES)
+    """
+    if error:
+        return error in TRANSIENT_ERRORS
+    return status in TRANSIENT_STATUSES
+
+
+def get_cached_redirect(hop_cache, url):
     """
-    content = None
+    :return: урл редиректа из кэша хопов (HopCache) или None
+    """
+    if hop_cache is None:
+        return None
+    hop = hop_cache.get(normalize_url(url)[1])
+    return hop[0] if hop else None
+
+
+def cache_redirect(hop_cache, stream, redirect_url):
+    """Сохраняет http редирект в кэш хопов на время, разрешенное заголовками ответа"""
+    if hop_cache is not None and redirect_url and stream.status in REDIRECT_STATUSES:
+        hop_cache.put_response(stream.url, redirect_url, REDIRECT_HTTP, stream.status, stream.headers)
+
+
+def perform(curl, stream, timings=None):
+    """Выполняет запрос, остановленная ResponseStream загрузка ошибкой не считается
+    Если передан список timings, в него добавляются времена запроса (read_timings)
+
+    """
+    error = None
     try:
-        content, new_redirect_url = make_pycurl_request(url, timeout, user_agent)
-    except (pycurl.error, ValueError) as e:
-        logger.error(u'error in url {} {}'.format(url, e))
-        return url, 'ERROR', content  # TODO add exception in ERROR
+        curl.perform()
+    except pycurl.error as e:
+        if not stream.stopped:
+            error = e
+            raise
+    finally:
+        if timings is not None:
+            timings.append(read_timings(curl, stream, error))
+
+
+def make_pycurl_request(url, timeout, useragent=None, curl_pool=None, policy=None, hop_cache=None,
+                        rate_limiter=None, connect_timeout=None, timings=None):
+    """Делает http запрос (без перехода по редиректам)
+    Возвращает контент ответа и возможный редирект
+    Если передан curl_pool, хэндл берется из пула и возвращается в него
+    Если передан policy (FetchPolicy), загрузка ответа следует его правилам,
+    содержимое не-html ответов не загружается (None)
+    Если передан hop_cache (HopCache), http редиректы берутся из него без запроса
+    и сохраняются в него
+    Если передан rate_limiter (TokenBucket), запрос ждет разрешения на отправку
+    Если передан connect_timeout, соединение устанавливается не дольше connect_timeout секунд
+    Если передан список timings, в него добавляются времена каждого запроса (read_timings)
+    :return: содержимое ответа, урл редиректа
+
+    """
+    redirect_url = get_cached_redirect(hop_cache, url)
+    if redirect_url:
+        return '', redirect_url
 
+    if rate_limiter:
+        rate_limiter.wait()
+
+    curl = curl_pool.acquire() if curl_pool else pycurl.Curl()
+    try:
+        if policy and policy.head_first(url):
+            stream = setup_curl(curl, url, timeout, useragent, policy, True, connect_timeout)
+            try:
+                perform(curl, stream, timings)
+            except pycurl.error as e:
+                logger.info(u'HEAD request to {} failed: {}'.format(url, e))
+            else:
+                if not stream.needs_body:
+                    content, redirect_url = read_response(curl, stream)
+                    cache_redirect(hop_cache, stream, redirect_url)
+                    return content, redirect_url
+            curl.reset()
+
+        stream = setup_curl(curl, url, timeout, useragent, policy, False, connect_timeout)
+        perform(curl, stream, timings)
+        content, redirect_url = read_response(curl, stream)
+        cache_redirect(hop_cache, stream, redirect_url)
+        return content, redirect_url
+    finally:
+        if curl_pool:
+            curl_pool.release(curl)
+        else:
+            curl.close()
+
+
+def hop_error(url, error):
+    """
+    :return: результат запроса урла, завершившегося ошибкой
+    """
+    logger.error(u'error in url {} {}'.format(url, error))
+    return url, 'ERROR', None  # TODO add exception in ERROR
+
+
+def process_response(url, content, new_redirect_url):
+    """
+    Определяет по ответу на запрос урла следующий урл цепочки
+    :return: урл, тип редиректа, содержимое страницы (если есть)
+    """
     redirect_type = None
 
     # ignoring ok login redirects
@@ -119,7 +435,7 @@ def get_url(url, timeout, user_agent=None):
 
     if new_redirect_url:
         redirect_type = REDIRECT_HTTP
-    else:
+    elif content:
         new_redirect_url = check_for_meta(content, url)
         if new_redirect_url:
             redirect_type = REDIRECT_META
@@ -130,61 +446,307 @@ def get_url(url, timeout, user_agent=None):
     return prepare_url(new_redirect_url), redirect_type, content
 
 
-def get_redirect_history(url, timeout, max_redirects=30, user_agent=None):
+def deadline_hop(url):
     """
-    Входные параметры:
+    :return: результат урла, до запроса которого закончился бюджет времени цепочки
+    """
+    logger.info(u'chain deadline exceeded on url {}'.format(url))
+    return url, DEADLINE_EXCEEDED, None
+
+
+def get_url(url, timeout, user_agent=None, curl_pool=None, policy=None, hop_cache=None, rate_limiter=None,
+            connect_timeout=None, timings=None):
+    """
+    :return: урл, тип редиректа, содержимое страницы (если есть)
+    """
+    try:
+        content, new_redirect_url = make_pycurl_request(
+            url, timeout, user_agent, curl_pool, policy, hop_cache, rate_limiter, connect_timeout, timings
+        )
+    except (pycurl.error, ValueError) as e:
+        return hop_error(url, e)
+
+    return process_response(url, content, new_redirect_url)
+
+
+def is_resumable(url, history_types, history_urls):
+    """
+    :param url: нормализованный урл задачи
+    :return: можно ли продолжить проверку url с конца истории предыдущей проверки
+    """
+    if not history_types or len(history_urls) != len(history_types) + 1:
+        return False
+    if prepare_url(history_urls[0]) != url:
+        return False
+    # the chain stopped there in the previous check
+    return not any(redirect_type in ('ERROR', DEADLINE_EXCEEDED) for redirect_type in history_types)
+
+
+class RedirectChain(object):
+    """
+    Состояние проверки цепочки редиректов одного урла.
+
+    Не делает запросов сам: очередной урл для проверки лежит в redirect_url,
+    результат его запроса передается в add_hop.
+
+    Если передан budget, вся цепочка должна быть пройдена за budget секунд:
+    таймаут каждого хопа ограничивается оставшимся временем (hop_timeout),
+    а ошибка запроса после истечения бюджета записывается как DEADLINE_EXCEEDED.
+
+    Запрос урла, завершившийся временной ошибкой (is_transient_error),
+    повторяется до retries раз (см. retry_after).
+
+    Если передан resume (типы и урлы начала цепочки из предыдущей проверки,
+    урлов на один больше, чем типов), проверка продолжается с последнего урла
+    resume. Если verify_first_hop, сначала запрашивается урл задачи, и resume
+    используется, только если первый хоп совпал с первым хопом resume,
+    иначе цепочка проверяется заново.
+    """
+
+    def __init__(self, url, max_redirects=30, counter_scanner=None, budget=None, retries=0, retry_delay=0.5,
+                 resume=None, verify_first_hop=False):
+        url = prepare_url(url)
+        self.max_redirects = max_redirects
+        self.counter_scanner = counter_scanner
+        self.deadline = time() + budget if budget else None
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # repeated requests of the current url
+        self.attempts = 0
+        self.history_types = []
+        self.history_urls = [url]
+        self.redirect_url = url
+        self.content = None
+        # read_timings of every request made for the chain
+        self.timings = []
+
+        # ignore mm / ok domains
+        self.finished = bool(re.match(MM_URL, url) or re.match(OK_URL, url))
+
+        # partial history to resume from after the first hop is verified
+        self.resume = None
+        if resume is not None and not self.finished and is_resumable(url, *resume):
+            if not verify_first_hop:
+                self._resume(*resume)
+            elif len(resume[0]) > 1:
+                self.resume = resume
+
+    def _resume(self, history_types, history_urls):
+        """Продолжает цепочку с последнего урла истории предыдущей проверки"""
+        logger.info(u'Url {} is resumed from hop {} ({})'.format(
+            self.history_urls[0], len(history_types), history_urls[-1]
+        ))
+        self.history_types = list(history_types)
+        self.history_urls = [self.history_urls[0]] + list(history_urls[1:])
+        self.redirect_url = self.history_urls[-1]
+        if len(self.history_urls) > self.max_redirects:
+            self.finished = True
+
+    def add_hop(self, redirect_url, redirect_type, content):
+        """Добавляет в историю результат запроса очередного урла цепочки"""
+        self.attempts = 0
+        self.content = content
+        if self.resume is not None:
+            resume, self.resume = self.resume, None
+            if redirect_url and (redirect_type, redirect_url) == (resume[0][0], resume[1][1]):
+                self._resume(*resume)
+                return
+            logger.info(u'First hop of url {} is changed, the chain is checked again'.format(self.history_urls[0]))
+
+        if not redirect_url:
+            self.finished = True
+            return
+
+        if redirect_type == 'ERROR' and self.out_of_budget():
+            # the request was cut by the chain budget
+            redirect_type = DEADLINE_EXCEEDED
+
+        self.history_types.append(redirect_type)
+        self.history_urls.append(redirect_url)
+        self.redirect_url = redirect_url
+
+        if redirect_type in ('ERROR', DEADLINE_EXCEEDED):
+            self.finished = True
+
+        if len(self.history_urls) > self.max_redirects or (redirect_url in self.history_urls[:-1]):
+            self.finished = True
+
+    def retry_after(self, error, status=None):
+        """
+        Решает, повторить ли запрос очередного урла. Повторяются только запросы
+        с временными ошибками, задержка перед каждым следующим повтором вдвое
+        больше, и повтор должен начаться до конца бюджета цепочки.
+
+        :param error: код ошибки curl запроса, 0 - запрос выполнен
+        :param status: код ответа
+        :return: через сколько секунд повторить запрос, None - не повторять
+        """
+        if self.attempts >= self.retries or not is_transient_error(error, status):
+            return None
+        delay = self.retry_delay * 2 ** self.attempts
+        if self.deadline is not None and time() + delay >= self.deadline:
+            return None
+
+        self.attempts += 1
+        logger.info(u'{} error in url {} (error={} status={}), retry {} in {}s'.format(
+            classify_error(error, status), self.redirect_url, error, status, self.attempts, delay
+        ))
+        return delay
+
+    def out_of_budget(self):
+        """
+        :return: истек ли бюджет цепочки (ошибка запроса тогда записывается как DEADLINE_EXCEEDED)
+        """
+        return self.deadline is not None and time() >= self.deadline
+
+    def hop_timeout(self, timeout):
+        """
+        :return: таймаут запроса очередного урла: timeout, но не больше
+            оставшегося бюджета цепочки (0 или меньше - бюджет исчерпан)
+        """
+        if self.deadline is None:
+            return timeout
+        return min(timeout, self.deadline - time())
+
+    def result(self, extended=False):
+        """
+        :param extended: добавить к результату времена запросов
+        :return: типы редиректов, урлы редиректов, счетчики на конечном урле
+            (и времена запросов, если extended)
+        """
+        counters = get_counters(self.content, self.counter_scanner) if self.content else []
+        if extended:
+            return self.history_types, self.history_urls, counters, self.timings
+        return self.history_types, self.history_urls, counters
+
+
+class CheckSettings(object):
+    """
+    Настройки проверки цепочек и помощники, общие для всех цепочек обработчика
+    (см. get_redirect_history и engine.RedirectEngine):
 
-    + url - урл для которого необходимо получить редиректы
     + timeout - таймаут на проверку *одного* урла
     + max_redirects - максимальное количество редиректов, после превышения проверка останавливается
     + user_agent - юзер-агент, если не передает, то будет дефолтный из pycurl
+    + curl_pool - пул curl-хэндлов (CurlPool), если не передан, на каждый запрос создается новый хэндл
+    + counter_scanner - CounterScanner для поиска счетчиков, если не передан, ищутся COUNTER_TYPES
+    + policy - правила загрузки ответов (FetchPolicy), по умолчанию ответы загружаются целиком
+    + hop_cache - кэш http редиректов (HopCache), по умолчанию все хопы запрашиваются
+    + rate_limiter - ограничитель частоты запросов (TokenBucket), по умолчанию без ограничения
+    + budget - время на проверку всей цепочки в секундах, по умолчанию не ограничено
+    + connect_timeout - таймаут соединения при проверке одного урла, по умолчанию равен timeout
+    + retries - сколько раз повторять запрос урла после временной ошибки, по умолчанию не повторяется
+    + retry_delay - задержка перед первым повтором в секундах, каждый следующий ждет вдвое дольше
+    + verify_first_hop - продолжать предыдущую проверку, только если первый хоп урла не изменился
+    """
+
+    def __init__(self, timeout, max_redirects=30, user_agent=None, curl_pool=None, counter_scanner=None,
+                 policy=None, hop_cache=None, rate_limiter=None, budget=None, connect_timeout=None, retries=0,
+                 retry_delay=0.5, verify_first_hop=False):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.user_agent = user_agent
+        self.curl_pool = curl_pool
+        self.counter_scanner = counter_scanner
+        self.policy = policy
+        self.hop_cache = hop_cache
+        self.rate_limiter = rate_limiter
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.verify_first_hop = verify_first_hop
+
+    def new_chain(self, url, resume=None):
+        """:return: RedirectChain урла с этими настройками"""
+        return RedirectChain(
+            url,
+            max_redirects=self.max_redirects,
+            counter_scanner=self.counter_scanner,
+            budget=self.budget,
+            retries=self.retries,
+            retry_delay=self.retry_delay,
+            resume=resume,
+            verify_first_hop=self.verify_first_hop
+        )
+
+
+def get_redirect_history(url, settings, extended=False, resume=None):
+    """
+    Входные параметры:
+
+    + url - урл для которого необходимо получить редиректы
+    + settings - настройки проверки (CheckSettings)
+    + extended - вернуть также времена запросов
+    + resume - типы и урлы начала цепочки из предыдущей проверки, проверка продолжается с последнего урла
 
 
     Выходные параметры:
     Массив из трех элементов
 
-    1. типы найденных редиректов (варианты: meta_tag, http_status, ERROR)
+    1. типы найденных редиректов (варианты: meta_tag, http_status, ERROR, DEADLINE)
     2. урлы редиректов (включая конечный)
     3. установленные счетчики на конечном урле
+    4. если extended, список времен каждого запроса (см. read_timings)
 
     """
-    url = prepare_url(url)
-    history_types = []
-    history_urls = [url]
-    redirect_url = url
-
-    # ignore mm / ok domains
-    if re.match(MM_URL, url) or re.match(OK_URL, url):
-        return history_types, history_urls, []
-
-    content = None
-    while True:
-        redirect_url, redirect_type, content = get_url(
-            url=redirect_url,
-            timeout=timeout,
-            user_agent=user_agent
+    chain = settings.new_chain(url, resume)
+    while not chain.finished:
+        hop_timeout = chain.hop_timeout(settings.timeout)
+        if hop_timeout <= 0:
+            chain.add_hop(*deadline_hop(chain.redirect_url))
+            continue
+
+        requests = len(chain.timings)
+        hop = get_url(
+            url=chain.redirect_url,
+            timeout=hop_timeout,
+            user_agent=settings.user_agent,
+            curl_pool=settings.curl_pool,
+            policy=settings.policy,
+            hop_cache=settings.hop_cache,
+            rate_limiter=settings.rate_limiter,
+            connect_timeout=settings.connect_timeout,
+            timings=chain.timings
         )
-        if not redirect_url:
-            break
-
-        history_types.append(redirect_type)
-        history_urls.append(redirect_url)
+        if len(chain.timings) > requests:
+            request = chain.timings[-1]
+            delay = chain.retry_after(request.get('error', 0), request.get('code'))
+            if delay is not None:
+                sleep(delay)
+                continue
+        chain.add_hop(*hop)
 
-        if redirect_type == 'ERROR':
-            break
+    return chain.result(extended)
 
-        if len(history_urls) > max_redirects or (redirect_url in history_urls[:-1]):
-            break
 
-    counters = get_counters(content) if content else []
+def normalize_url(url):
+    """
+    Нормализует урл, результат запоминается для PREPARED_URLS_CACHE_SIZE урлов
 
-    return history_types, history_urls, counters
+    :return: нормализованный урл в unicode и в utf8
+    """
+    prepared = _prepared_urls.get(url)
+    if prepared is None:
+        if len(_prepared_urls) >= PREPARED_URLS_CACHE_SIZE:
+            _prepared_urls.clear()
+        unicode_url = _prepare_url(url)
+        prepared = _prepared_urls[url] = (unicode_url, to_str(unicode_url, 'ignore'))
+    return prepared
 
 
 def prepare_url(url):
     """Нормализация урла"""
     if url is None:
         return url
+    return normalize_url(url)[0]
+
+
+def _prepare_url(url):
+    if NORMALIZED_URL.match(url):
+        # nothing to quote or encode
+        return to_unicode(url)
+
     scheme, netloc, path, qs, anchor, fragments = urlparse(
         to_unicode(url),
         allow_fragments=False
@@ -0,0 +1,159 @@
+# coding: utf-8
+from logging import getLogger
+from multiprocessing import cpu_count
+import os
+from time import time
+
+from tarantool.error import DatabaseError
+
+from utils import get_tube
+
+logger = getLogger('redirect_checker')
+
+
+def get_available_memory(meminfo='/proc/meminfo'):
+    """
+    :return: сколько памяти можно занять без свопа, байт; None - неизвестно
+    """
+    try:
+        with open(meminfo) as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    # kilobytes
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+def get_cpu_load():
+    """
+    :return: средняя загрузка за минуту на одно ядро
+    """
+    return os.getloadavg()[0] / cpu_count()
+
+
+class Autoscaler(object):
+    """
+    Подбирает размер пула обработчиков по очереди задач.
+
+    По статистике очереди (queue.statistics) считается, сколько секунд
+    готовые задачи будут ждать при текущей скорости их взятия. Если дольше
+    up_backlog, пул растет на step обработчиков, если меньше down_backlog -
+    уменьшается. Пул не растет, а уменьшается, если средняя загрузка
+    процессора на ядро больше max_load или свободной памяти меньше
+    min_free_memory.
+
+    Чтобы размер не скакал, пороги роста и уменьшения разнесены, а после
+    изменения размер не меняется cooldown секунд: за это время успевают
+    запуститься или остановиться обработчики и обновиться загрузка.
+
+    :param tube: входная очередь (lib.tube.BatchTube)
+    :param min_size: наименьший размер пула
+    :param max_size: наибольший размер пула
+    :param step: на сколько обработчиков меняется пул за раз
+    :param up_backlog: секунд ожидания задач, после которых пул растет
+    :param down_backlog: секунд ожидания задач, до которых пул уменьшается
+    :param cooldown: секунд между изменениями размера
+    :param max_load: допустимая средняя загрузка на ядро
+    :param min_free_memory: сколько байт памяти должно оставаться свободными
+    """
+
+    def __init__(self, tube, min_size, max_size, step=1, up_backlog=30, down_backlog=5, cooldown=60,
+                 max_load=0.9, min_free_memory=0):
+        self.tube = tube
+        self.min_size = min_size
+        self.max_size = max_size
+        self.step = step
+        self.up_backlog = up_backlog
+        self.down_backlog = down_backlog
+        self.cooldown = cooldown
+        self.max_load = max_load
+        self.min_free_memory = min_free_memory
+        # (take counter of the queue, time it was read)
+        self.taken = None
+        self.changed_at = None
+
+    def get_backlog(self):
+        """
+        Читает статистику очереди
+
+        :return: сколько секунд готовые задачи будут ждать, None - пока неизвестно
+        """
+        stat = self.tube.statistics()
+        ready = int(stat['tasks']['ready'])
+        taken = (int(stat.get('take', 0)), time())
+
+        previous, self.taken = self.taken, taken
+        if previous is None or taken[1] <= previous[1]:
+            return None
+        if not ready:
+            return 0.0
+        # the counter starts from zero when the queue server restarts
+        rate = max(0, taken[0] - previous[0]) / (taken[1] - previous[1])
+        return ready / rate if rate else float('inf')
+
+    def is_overloaded(self):
+        if get_cpu_load() > self.max_load:
+            return True
+        available = get_available_memory()
+        return available is not None and available < self.min_free_memory
+
+    def update(self, size):
+        """
+        :param size: текущий размер пула
+        :return: новый размер пула
+        """
+        try:
+            backlog = self.get_backlog()
+        except (DatabaseError, KeyError) as e:
+            logger.info('Queue statistics are not available')
+            logger.exception(e)
+            return size
+        if backlog is None:
+            return size
+
+        if self.is_overloaded():
+            new_size = size - self.step
+        elif backlog > self.up_backlog:
+            new_size = size + self.step
+        elif backlog < self.down_backlog:
+            new_size = size - self.step
+        else:
+            new_size = size
+        new_size = min(self.max_size, max(self.min_size, new_size))
+
+        if new_size == size:
+            return size
+        if self.changed_at is not None and time() - self.changed_at < self.cooldown:
+            return size
+
+        logger.info('Worker pool size {} -> {}, queue backlog {:.1f}s'.format(size, new_size, backlog))
+        self.changed_at = time()
+        return new_size
+
+
+def get_autoscaler(config):
+    """
+    :return: Autoscaler для входной очереди, None - размер пула не меняется
+    """
+    if not config.WORKER_POOL_MAX_SIZE:
+        return None
+
+    tube = get_tube(
+        host=config.INPUT_QUEUE_HOST,
+        port=config.INPUT_QUEUE_PORT,
+        space=config.INPUT_QUEUE_SPACE,
+        name=config.INPUT_QUEUE_TUBE
+    )
+    return Autoscaler(
+        tube,
+        min_size=config.WORKER_POOL_SIZE,
+        max_size=config.WORKER_POOL_MAX_SIZE,
+        step=config.AUTOSCALE_STEP,
+        up_backlog=config.AUTOSCALE_UP_BACKLOG,
+        down_backlog=config.AUTOSCALE_DOWN_BACKLOG,
+        cooldown=config.AUTOSCALE_COOLDOWN,
+        max_load=config.AUTOSCALE_MAX_LOAD,
+        min_free_memory=config.AUTOSCALE_MIN_FREE_MEMORY
+    )
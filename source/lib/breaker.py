@@ -0,0 +1,213 @@
+# coding: utf-8
+from logging import getLogger
+import struct
+from time import time
+
+from . import DEADLINE_EXCEEDED, classify_error
+from shared_state import SharedState
+
+logger = getLogger('redirect_checker')
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+STATE_NAMES = {CLOSED: 'closed', OPEN: 'open', HALF_OPEN: 'half-open'}
+
+NETWORK_ERROR_KINDS = ('dns', 'timeout')
+"""
+Виды ошибок (см. lib.classify_error), которые говорят о проблемах с сетью узла,
+а не с проверяемым сайтом (таймаут - только если соединение не установлено)
+"""
+
+HALF_OPEN_POLL = 1.0
+"""Как часто (секунд) обработчики без пробных задач проверяют, не началась ли следующая ступень"""
+
+STATE = struct.Struct('iddiiii')
+"""
+Состояние в общем файле: режим, время смены режима, начало окна, проверено
+цепочек, из них оборвано сетевой ошибкой, ступень, осталось пробных задач
+"""
+
+
+def is_network_failure(timings, history_types=()):
+    """
+    :param timings: времена хопов цепочки (см. lib.read_timings)
+    :param history_types: типы редиректов цепочки
+    :return: оборвалась ли цепочка ошибкой из NETWORK_ERROR_KINDS; цепочка,
+        не уложившаяся в бюджет времени (DEADLINE_EXCEEDED), проверяет медленный сайт и не считается
+    """
+    if not timings or DEADLINE_EXCEEDED in history_types[-1:]:
+        return False
+    kind = classify_error(timings[-1].get('error', 0))
+    if kind == 'timeout' and timings[-1].get('connect'):
+        # the site is reachable, it is just slow
+        return False
+    return kind in NETWORK_ERROR_KINDS
+
+
+class CircuitBreaker(object):
+    """
+    Приостанавливает взятие задач, когда у обработчиков пропадает сеть.
+
+    Обработчики сообщают о каждой пройденной цепочке (add_chain). Если за
+    window секунд пройдено не меньше min_chains цепочек и доля оборванных
+    таймаутом соединения или ошибкой резолва (is_network_failure) не меньше
+    threshold, цепь размыкается: acquire не разрешает брать задачи. Начатые
+    цепочки доделываются, обработчики не останавливаются, а ждут wait_time.
+
+    Через open_timeout секунд цепь полуоткрывается: acquire разрешает взять
+    probes пробных задач. Если доля сетевых ошибок в них меньше threshold,
+    разрешается вдвое больше задач, и так steps раз, после чего цепь
+    замыкается. Иначе цепь снова размыкается.
+
+    Если передан path, состояние хранится в отображенном в память файле
+    и разделяется всеми процессами, использующими этот файл (см. SharedState).
+
+    :param path: файл общего состояния, None - состояние только в этом процессе
+    :param window: секунд, за которые считается доля сетевых ошибок
+    :param min_chains: сколько цепочек нужно, чтобы разомкнуть цепь
+    :param threshold: доля цепочек с сетевыми ошибками, при которой цепь размыкается
+    :param open_timeout: секунд до пробных задач
+    :param probes: пробных задач на первой ступени
+    :param steps: ступеней пробных задач до замыкания цепи
+    """
+
+    def __init__(self, path=None, window=30, min_chains=20, threshold=0.5, open_timeout=30, probes=5, steps=3):
+        self.window = window
+        self.min_chains = min_chains
+        self.threshold = threshold
+        self.open_timeout = open_timeout
+        self.probes = probes
+        self.steps = steps
+        # a new file is zeroed: closed, no chains
+        self.state = SharedState(STATE, path)
+
+    def _update(self, change, *args):
+        """
+        Меняет состояние под блокировкой файла
+
+        :param change: функция (состояние, время, *args) -> (новое состояние, результат)
+        :return: результат change
+        """
+        def change_now(state):
+            # the time is taken under the lock, after the other processes' changes
+            now = time()
+            return change(self._advance(state, now), now, *args)
+
+        return self.state.update(change_now)
+
+    def _round_size(self, step):
+        return self.probes * 2 ** (step - 1)
+
+    def _switch(self, mode, now, step=0):
+        """:return: состояние в режиме mode с пустой статистикой"""
+        logger.info('Circuit breaker is {}{}'.format(STATE_NAMES[mode], ', step {}'.format(step) if step else ''))
+        return mode, now, now, 0, 0, step, self._round_size(step) if mode == HALF_OPEN else 0
+
+    def _advance(self, state, now):
+        """Меняет состояние по прошедшему времени"""
+        mode, changed_at, window_started, chains, failures, step, quota = state
+        if mode == OPEN and now - changed_at >= self.open_timeout:
+            return self._switch(HALF_OPEN, now, 1)
+        if mode == CLOSED and now - window_started >= self.window:
+            return mode, changed_at, now, 0, 0, step, quota
+        if mode == HALF_OPEN and not quota and now - changed_at >= self.open_timeout:
+            # probe tasks were not taken or their results are lost, give them again
+            return mode, now, window_started, chains, failures, step, max(0, self._round_size(step) - chains)
+        return state
+
+    def _acquire(self, state, now, count):
+        mode, changed_at, window_started, chains, failures, step, quota = state
+        if mode == CLOSED:
+            return state, count
+        if mode == OPEN:
+            return state, 0
+        count = min(count, quota)
+        return (mode, changed_at, window_started, chains, failures, step, quota - count), count
+
+    def _release(self, state, now, count):
+        mode, changed_at, window_started, chains, failures, step, quota = state
+        if mode != HALF_OPEN:
+            return state, None
+        quota = min(self._round_size(step) - chains, quota + count)
+        return (mode, changed_at, window_started, chains, failures, step, quota), None
+
+    def _add_chain(self, state, now, failed):
+        mode, changed_at, window_started, chains, failures, step, quota = state
+        if mode == OPEN:
+            # chains started before the circuit was opened
+            return state, None
+
+        chains += 1
+        failures += failed
+        if mode == CLOSED:
+            if chains >= self.min_chains and failures >= self.threshold * chains:
+                return self._switch(OPEN, now), None
+        elif failures >= self.threshold * self._round_size(step):
+            return self._switch(OPEN, now), None
+        elif chains >= self._round_size(step):
+            if step >= self.steps:
+                return self._switch(CLOSED, now), None
+            return self._switch(HALF_OPEN, now, step + 1), None
+        return (mode, changed_at, window_started, chains, failures, step, quota), None
+
+    def acquire(self, count):
+        """
+        :param count: сколько задач обработчик хочет взять
+        :return: сколько задач можно взять, 0 - пока нельзя брать задачи
+        """
+        return self._update(self._acquire, count)
+
+    def _wait_time(self, state, now):
+        mode, changed_at, window_started, chains, failures, step, quota = state
+        if mode == CLOSED or (mode == HALF_OPEN and quota):
+            return state, 0
+        wait = max(0, changed_at + self.open_timeout - now)
+        if mode == HALF_OPEN:
+            # the next step may start as soon as the probe chains are checked
+            wait = min(wait, HALF_OPEN_POLL)
+        return state, wait
+
+    def wait_time(self):
+        """
+        :return: через сколько секунд acquire может разрешить взять задачи:
+            до пробных задач, если цепь разомкнута
+        """
+        return self._update(self._wait_time)
+
+    def release(self, count):
+        """Возвращает разрешение на count задач, которые не удалось взять"""
+        if count > 0:
+            self._update(self._release, count)
+
+    def add_chain(self, timings, history_types=()):
+        """
+        :param timings: времена хопов пройденной цепочки (см. lib.read_timings)
+        :param history_types: типы редиректов цепочки
+        """
+        self._update(self._add_chain, int(is_network_failure(timings, history_types)))
+
+    def is_closed(self):
+        """:return: работают ли обработчики в обычном режиме"""
+        return self._update(lambda state, now: (state, state[0] == CLOSED))
+
+    def close(self):
+        self.state.close()
+
+
+def get_breaker(config):
+    """
+    :return: CircuitBreaker, общий для обработчиков через config.BREAKER_FILE,
+        или None, если взятие задач не приостанавливается
+    """
+    if not config.BREAKER_FILE:
+        return None
+    return CircuitBreaker(
+        config.BREAKER_FILE,
+        config.BREAKER_WINDOW,
+        config.BREAKER_MIN_CHAINS,
+        config.BREAKER_THRESHOLD,
+        config.BREAKER_OPEN_TIMEOUT,
+        config.BREAKER_PROBES,
+        config.BREAKER_STEPS
+    )
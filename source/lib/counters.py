@@ -0,0 +1,65 @@
+# coding: utf-8
+import re
+import sre_constants
+import sre_parse
+
+
+def strip_pattern(pattern):
+    """Убирает из правила обрамляющие '.*', нужные только для re.match"""
+    if pattern.startswith('.*'):
+        pattern = pattern[2:]
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pattern = pattern[:-2]
+    return pattern
+
+
+def required_literal(pattern):
+    """
+    Находит самую длинную строку, которая обязательно входит в любое совпадение
+    с регулярным выражением.
+
+    :return: строка в нижнем регистре и признак того, что выражение целиком
+        состоит из этой строки
+    """
+    to_char = unichr if isinstance(pattern, unicode) else chr
+    runs = [[]]
+    for op, av in sre_parse.parse(pattern, re.I):
+        if op == sre_constants.LITERAL:
+            runs[-1].append(to_char(av))
+        else:
+            runs.append([])
+
+    literal = max((''.join(run) for run in runs), key=len).lower()
+    return literal, len(runs) == 1
+
+
+class CounterScanner(object):
+    """
+    Ищет на странице счетчики по списку правил (имя, регулярное выражение).
+
+    Страница приводится к нижнему регистру один раз, после чего правило-строка
+    проверяется поиском подстроки. Для остальных правил сначала ищется
+    обязательная подстрока, и только при ее наличии запускается регулярное
+    выражение. Правила вида '.*pattern.*' (для re.match) тоже поддерживаются.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        for name, pattern in rules:
+            pattern = strip_pattern(getattr(pattern, 'pattern', pattern))
+            literal, is_literal = required_literal(pattern)
+            regexp = None if is_literal else re.compile(pattern, re.I + re.S)
+            self.rules.append((name, literal, regexp))
+
+    def scan(self, content):
+        """
+        :return: список имен найденных счетчиков в порядке правил
+        """
+        lowered = content.lower()
+        counters = []
+        for name, literal, regexp in self.rules:
+            if literal not in lowered:
+                continue
+            if regexp is None or regexp.search(content):
+                counters.append(name)
+        return counters
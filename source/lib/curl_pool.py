@@ -0,0 +1,70 @@
+# coding: utf-8
+from collections import deque
+from time import time
+
+import pycurl
+
+SHARED_DATA = ('LOCK_DATA_DNS', 'LOCK_DATA_SSL_SESSION', 'LOCK_DATA_CONNECT')
+"""Данные, общие для всех хэндлов пула (если поддерживаются версией pycurl)"""
+
+
+class CurlPool(object):
+    """
+    Пул переиспользуемых curl-хэндлов.
+
+    Хэндлы не закрываются после запроса, поэтому keep-alive соединения
+    переживают переход между хопами и задачами. Кэш DNS и TLS-сессий
+    (и соединений, если позволяет pycurl) общий для всех хэндлов пула.
+
+    :param max_size: сколько свободных хэндлов держать в пуле
+    :param max_idle: через сколько секунд простоя хэндл закрывается
+    """
+
+    def __init__(self, max_size=10, max_idle=60):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.idle = deque()
+
+        self.share = pycurl.CurlShare()
+        for name in SHARED_DATA:
+            if hasattr(pycurl, name):
+                self.share.setopt(pycurl.SH_SHARE, getattr(pycurl, name))
+
+    def __len__(self):
+        return len(self.idle)
+
+    def acquire(self):
+        """
+        :return: свободный хэндл из пула или новый, если свободных нет
+        """
+        self.expire()
+        if self.idle:
+            curl, released_at = self.idle.pop()
+            return curl
+
+        curl = pycurl.Curl()
+        curl.setopt(pycurl.SHARE, self.share)
+        return curl
+
+    def release(self, curl):
+        """Возвращает хэндл в пул, сбрасывая настройки запроса"""
+        if len(self.idle) >= self.max_size:
+            curl.close()
+            return
+
+        # reset keeps live connections, caches and the share
+        curl.reset()
+        self.idle.append((curl, time()))
+
+    def expire(self):
+        """Закрывает хэндлы, простаивающие дольше max_idle секунд"""
+        deadline = time() - self.max_idle
+        while self.idle and self.idle[0][1] < deadline:
+            curl, released_at = self.idle.popleft()
+            curl.close()
+
+    def close(self):
+        while self.idle:
+            curl, released_at = self.idle.pop()
+            curl.close()
+        self.share.close()
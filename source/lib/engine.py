@@ -0,0 +1,339 @@
+# coding: utf-8
+from collections import defaultdict, deque
+from heapq import heappop, heappush
+from itertools import count
+from time import sleep, time
+from urlparse import urlsplit
+
+import pycurl
+
+from . import DEADLINE_EXCEEDED, CheckSettings, cache_redirect, deadline_hop, get_cached_redirect, hop_error, \
+    process_response, read_response, read_timings, setup_curl
+from curl_pool import CurlPool
+
+
+class RedirectEngine(object):
+    """
+    Проверяет цепочки редиректов многих урлов одновременно в одном процессе.
+
+    Запросы выполняются через pycurl.CurlMulti: пока один урл ждет ответа,
+    остальные цепочки продвигаются дальше. Одновременно выполняется не больше
+    max_chains запросов, остальные цепочки ждут своей очереди.
+
+    Настройки проверки и общие помощники передаются в settings (CheckSettings).
+    Хэндлы берутся из settings.curl_pool, если он не передан, движок создает свой пул.
+    Ответы загружаются по правилам policy (FetchPolicy): урлы head_first доменов
+    сначала запрашиваются HEAD запросом, и GET делается только для html-страниц.
+    Http редиректы из hop_cache (HopCache) проходятся без запросов.
+
+    Если урл уже запрашивается другой цепочкой (или ждет в ней своей очереди),
+    второй запрос не делается: цепочка ждет завершения первого запроса и
+    получает тот же результат.
+
+    К одному хосту одновременно делается не больше max_per_host запросов,
+    хопы на занятые хосты ждут в очереди хоста, не мешая остальным цепочкам.
+    Если передан rate_limiter (TokenBucket), запросы начинаются не чаще, чем
+    он разрешает.
+
+    Если передан budget, каждая цепочка должна быть пройдена за budget секунд
+    с момента добавления (см. RedirectChain).
+
+    Если extended, результат цепочки дополняется временами запросов
+    (как в get_redirect_history).
+
+    Запрос, завершившийся временной ошибкой, повторяется до retries раз через
+    retry_delay, 2 * retry_delay, ... секунд (см. RedirectChain.retry_after),
+    цепочка в это время не занимает места запроса.
+
+    Цепочка может продолжить предыдущую проверку урла (resume в add),
+    если verify_first_hop, только при неизменном первом хопе (см. RedirectChain).
+
+    Если передан select (функция как select.select, например gevent.select.select),
+    движок ждет сокеты curl через нее, а не внутри libcurl, и может работать
+    в greenlet, не блокируя остальные.
+    """
+
+    def __init__(self, settings, max_chains=100, max_per_host=None, extended=False, select=None):
+        self.settings = settings
+        self.max_chains = max_chains
+        self.max_per_host = max_per_host
+        self.extended = extended
+        self.select = select
+
+        self.own_pool = settings.curl_pool is None
+        self.curl_pool = CurlPool(max_size=max_chains) if self.own_pool else settings.curl_pool
+
+        self.multi = pycurl.CurlMulti()
+        self.active = {}
+        self.pending = deque()
+        # requested url -> chains waiting for its result, the chain that requests it (even if queued)
+        self.inflight = {}
+        self.leaders = {}
+        # host -> number of requests in progress, chains waiting for the host
+        self.host_active = defaultdict(int)
+        self.host_pending = {}
+        # no requests are started until this time because of the rate limit
+        self.throttled_until = 0
+        # heap of (time to retry, sequence number, chain, callback, head)
+        self.retrying = []
+        self.retry_sequence = count()
+
+    def __len__(self):
+        """Количество непройденных цепочек"""
+        waiting = sum(len(waiters) for waiters in self.inflight.itervalues())
+        waiting += sum(len(chains) for chains in self.host_pending.itervalues())
+        return len(self.active) + len(self.pending) + len(self.retrying) + waiting
+
+    def add(self, url, callback, resume=None):
+        """
+        Добавляет урл на проверку.
+
+        :param url: урл, для которого нужно получить редиректы
+        :param callback: функция, которая будет вызвана с результатом
+            get_redirect_history (history_types, history_urls, counters),
+            когда цепочка будет пройдена
+        :param resume: типы и урлы начала цепочки из предыдущей проверки, с конца которых продолжить
+        """
+        self._start(self.settings.new_chain(url, resume), callback)
+
+    def perform(self, timeout=1.0):
+        """
+        Продвигает все цепочки: выполняет готовые к обмену запросы, обрабатывает
+        завершенные и ждет сетевой активности не дольше timeout секунд.
+
+        :return: количество непройденных цепочек
+        """
+        self._start_pending()
+
+        while self.multi.perform()[0] == pycurl.E_CALL_MULTI_PERFORM:
+            pass
+
+        if not self._read_info():
+            if self.pending:
+                # wake up when the rate limit lets pending chains start
+                timeout = min(timeout, max(0, self.throttled_until - time()))
+            if self.retrying:
+                timeout = min(timeout, max(0, self.retrying[0][0] - time()))
+            if self.active:
+                # libcurl may need to be called earlier, e.g. for connect timeouts
+                curl_timeout = self.multi.timeout()
+                if curl_timeout >= 0:
+                    timeout = min(timeout, curl_timeout / 1000.0)
+                self._wait(timeout)
+            elif self.pending or self.retrying:
+                self._wait(timeout)
+
+        return len(self)
+
+    def _wait(self, timeout):
+        """Ждет сетевой активности запросов или timeout секунд, если запросов нет"""
+        if self.select is not None:
+            read, write, error = self.multi.fdset()
+            self.select(read, write, error, timeout)
+        elif self.active:
+            self.multi.select(timeout)
+        else:
+            sleep(timeout)
+
+    def run(self):
+        """Работает, пока не будут пройдены все добавленные цепочки"""
+        while self.perform():
+            pass
+
+    def close(self):
+        for curl in self.active.keys():
+            self.multi.remove_handle(curl)
+            curl.close()
+        self.active.clear()
+        self.pending.clear()
+        del self.retrying[:]
+        self.inflight.clear()
+        self.leaders.clear()
+        self.host_active.clear()
+        self.host_pending.clear()
+        if self.own_pool:
+            self.curl_pool.close()
+        self.multi.close()
+
+    def _start(self, chain, callback, head=None):
+        """
+        :param head: делать HEAD запрос, по умолчанию по policy.head_first,
+            явно передается только при повторном запросе урла цепочкой
+        """
+        if chain.finished:
+            callback(chain.result(self.extended))
+            return
+
+        leader = self.leaders.get(chain.redirect_url)
+        if leader is not None and leader is not chain:
+            self.inflight[chain.redirect_url].append((chain, callback))
+            return
+
+        cached_url = get_cached_redirect(self.settings.hop_cache, chain.redirect_url)
+        if cached_url:
+            self._add_hop(chain, callback, process_response(chain.redirect_url, '', cached_url))
+            return
+
+        if leader is None:
+            # chains added while this one waits in a queue get its result too
+            self.leaders[chain.redirect_url] = chain
+            self.inflight[chain.redirect_url] = []
+
+        host = urlsplit(chain.redirect_url).hostname or ''
+        if self.max_per_host and self.host_active.get(host, 0) >= self.max_per_host:
+            self.host_pending.setdefault(host, deque()).append((chain, callback, head))
+            return
+
+        if len(self.active) >= self.max_chains or time() < self.throttled_until:
+            self.pending.append((chain, callback, head))
+            return
+
+        if self.settings.rate_limiter:
+            delay = self.settings.rate_limiter.acquire()
+            if delay:
+                self.throttled_until = time() + delay
+                self.pending.append((chain, callback, head))
+                return
+
+        timeout = chain.hop_timeout(self.settings.timeout)
+        if timeout <= 0:
+            self._add_hop(chain, callback, deadline_hop(chain.redirect_url))
+            return
+
+        policy = self.settings.policy
+        if head is None:
+            head = bool(policy and policy.head_first(chain.redirect_url))
+
+        curl = self.curl_pool.acquire()
+        try:
+            stream = setup_curl(
+                curl, chain.redirect_url, timeout, self.settings.user_agent, policy, head, self.settings.connect_timeout
+            )
+        except ValueError as e:
+            self.curl_pool.release(curl)
+            self._add_hop(chain, callback, hop_error(chain.redirect_url, e))
+            return
+
+        self.host_active[host] += 1
+        self.active[curl] = (chain, callback, stream)
+        self.multi.add_handle(curl)
+
+    def _start_pending(self):
+        """Начинает ждущие цепочки, пока есть свободные места и позволяет ограничение частоты"""
+        for host in [host for host in self.host_pending if self.host_active.get(host, 0) < self.max_per_host]:
+            self._start_host(host)
+
+        now = time()
+        while self.retrying and self.retrying[0][0] <= now:
+            self.pending.append(heappop(self.retrying)[2:])
+        while self.pending and len(self.active) < self.max_chains and time() >= self.throttled_until:
+            self._start(*self.pending.popleft())
+
+    def _release_host(self, url):
+        """Освобождает место хоста и начинает ждущие этот хост хопы"""
+        host = urlsplit(url).hostname or ''
+        self.host_active[host] -= 1
+        if not self.host_active[host]:
+            del self.host_active[host]
+        self._start_host(host)
+
+    def _start_host(self, host):
+        """
+        Начинает ждущие хост хопы, пока у хоста есть свободные места: хоп может
+        и не занять место (пройден по кэшу, исчерпан бюджет цепочки, ждет урл
+        другой цепочки), тогда начинается следующий
+        """
+        waiting = self.host_pending.get(host)
+        while waiting and self.host_active.get(host, 0) < self.max_per_host:
+            chain_args = waiting.popleft()
+            if not waiting:
+                del self.host_pending[host]
+            self._start(*chain_args)
+            waiting = self.host_pending.get(host)
+
+    def _add_hop(self, chain, callback, hop):
+        """
+        Передает результат запроса урла цепочке и всем цепочкам, ждущим этот урл.
+
+        Ошибка запроса, прерванного бюджетом цепочки (или не начатого из-за него),
+        относится только к этой цепочке: ждущие цепочки начинаются заново
+        со своими таймаутами, и первая из них запрашивает урл для остальных.
+        """
+        self.leaders.pop(chain.redirect_url, None)
+        waiters = self.inflight.pop(chain.redirect_url, [])
+        if hop[1] == DEADLINE_EXCEEDED or (hop[1] == 'ERROR' and chain.out_of_budget()):
+            chain.add_hop(*hop)
+            self._start(chain, callback)
+            for waiter_chain, waiter_callback in waiters:
+                self._start(waiter_chain, waiter_callback)
+            return
+
+        for waiter_chain, waiter_callback in [(chain, callback)] + waiters:
+            waiter_chain.add_hop(*hop)
+            self._start(waiter_chain, waiter_callback)
+
+    def _read_info(self):
+        finished = 0
+        while True:
+            queued, ok_list, error_list = self.multi.info_read()
+            for curl in ok_list:
+                self._finish(curl)
+            for curl, errno, message in error_list:
+                self._finish(curl, pycurl.error(errno, message))
+            finished += len(ok_list) + len(error_list)
+            if not queued:
+                return finished
+
+    def _finish(self, curl, error=None):
+        chain, callback, stream = self.active.pop(curl)
+        self.multi.remove_handle(curl)
+        self._release_host(chain.redirect_url)
+        if self.extended:
+            chain.timings.append(read_timings(curl, stream, None if stream.stopped else error))
+
+        if stream.head and (stream.needs_body or not (error is None or stream.stopped)):
+            # html page or failed HEAD request, get the page itself
+            self.curl_pool.release(curl)
+            self._start(chain, callback, head=False)
+            return
+
+        delay = chain.retry_after(0 if error is None or stream.stopped else error.args[0], stream.status)
+        if delay is not None:
+            # the url stays in inflight, chains waiting for it get the result of the retry
+            self.curl_pool.release(curl)
+            heappush(self.retrying, (time() + delay, next(self.retry_sequence), chain, callback, stream.head))
+            self._start_pending()
+            return
+
+        if error is None or stream.stopped:
+            content, redirect_url = read_response(curl, stream)
+            cache_redirect(self.settings.hop_cache, stream, redirect_url)
+            hop = process_response(chain.redirect_url, content, redirect_url)
+        else:
+            hop = hop_error(chain.redirect_url, error)
+        self.curl_pool.release(curl)
+
+        self._add_hop(chain, callback, hop)
+        self._start_pending()
+
+
+def get_redirect_histories(urls, timeout, max_redirects=30, user_agent=None, max_chains=100, curl_pool=None):
+    """
+    Параллельный аналог get_redirect_history для списка урлов.
+
+    :return: список результатов get_redirect_history в порядке урлов
+    """
+    results = [None] * len(urls)
+
+    def save_result(index, result):
+        results[index] = result
+
+    engine = RedirectEngine(CheckSettings(timeout, max_redirects, user_agent, curl_pool), max_chains)
+    try:
+        for index, url in enumerate(urls):
+            engine.add(url, lambda result, index=index: save_result(index, result))
+        engine.run()
+    finally:
+        engine.close()
+
+    return results
@@ -0,0 +1,199 @@
+# coding: utf-8
+from collections import OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+import json
+from logging import getLogger
+import os
+import re
+from time import time
+
+logger = getLogger('redirect_checker')
+
+PERMANENT_STATUSES = (301, 308)
+
+ENTRY_OVERHEAD = 200
+"""Примерный размер записи кэша в памяти без учета длины урлов, байт"""
+
+CACHE_CONTROL_DIRECTIVE = re.compile(r'([a-z-]+)\s*(?:=\s*"?(\d+)"?)?', re.I)
+
+
+def parse_http_date(value):
+    """
+    :return: unix timestamp или None, если дата некорректна
+    """
+    parsed = parsedate_tz(value) if value else None
+    if parsed is None:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def response_ttl(status, headers, permanent_ttl, default_ttl):
+    """
+    Вычисляет время жизни ответа в кэше по правилам HTTP кэширования:
+    Cache-Control (no-store, no-cache, max-age) важнее Expires, без них
+    постоянные редиректы (301, 308) хранятся permanent_ttl секунд, остальные
+    default_ttl секунд.
+
+    :param headers: заголовки ответа (имена в нижнем регистре)
+    :return: время жизни в секундах, 0 - не кэшировать
+    """
+    directives = dict(
+        (name.lower(), value) for name, value in CACHE_CONTROL_DIRECTIVE.findall(headers.get('cache-control', ''))
+    )
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    if directives.get('max-age'):
+        return int(directives['max-age'])
+
+    if 'expires' in headers:
+        expires = parse_http_date(headers['expires'])
+        if expires is None:
+            # invalid Expires means already expired
+            return 0
+        date = parse_http_date(headers.get('date')) or time()
+        return max(0, int(expires - date))
+
+    return permanent_ttl if status in PERMANENT_STATUSES else default_ttl
+
+
+class HopCache(object):
+    """
+    LRU кэш хопов цепочек редиректов: урл -> (следующий урл, тип редиректа).
+
+    Записи живут столько, сколько разрешают заголовки ответа (response_ttl),
+    при превышении max_entries записей или max_memory байт вытесняются давно
+    не использованные. Кэш можно сохранять на диск (save) и загружать при
+    старте обработчика (load), чтобы перезапущенный обработчик начинал с
+    заполненным кэшем.
+
+    :param max_entries: максимальное количество записей
+    :param max_memory: примерный максимальный объем записей в байтах, None - без ограничения
+    :param permanent_ttl: время жизни 301/308 редиректов без заголовков кэширования, секунд
+    :param default_ttl: время жизни остальных редиректов без заголовков кэширования, секунд
+    :param snapshot_path: файл для сохранения кэша, None - кэш не сохраняется
+    :param snapshot_interval: как часто сохранять кэш в maybe_save, секунд
+    """
+
+    def __init__(self, max_entries=10000, max_memory=None, permanent_ttl=24 * 60 * 60, default_ttl=0,
+                 snapshot_path=None, snapshot_interval=300):
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.permanent_ttl = permanent_ttl
+        self.default_ttl = default_ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.saved_at = time()
+        self.entries = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def entry_size(url, next_url):
+        return ENTRY_OVERHEAD + len(url) + len(next_url)
+
+    def get(self, url):
+        """
+        :return: следующий урл и тип редиректа или None, если урла нет в кэше
+        """
+        entry = self.entries.pop(url, None)
+        if entry is None or entry[2] <= time():
+            if entry is not None:
+                self.memory -= self.entry_size(url, entry[0])
+            self.misses += 1
+            return None
+
+        # most recently used entries are kept at the end
+        self.entries[url] = entry
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, url, next_url, redirect_type, ttl):
+        """Сохраняет хоп на ttl секунд"""
+        if ttl <= 0:
+            return
+        self._put(url, next_url, redirect_type, time() + ttl)
+
+    def put_response(self, url, next_url, redirect_type, status, headers):
+        """Сохраняет хоп на время, разрешенное заголовками ответа"""
+        self.put(url, next_url, redirect_type, response_ttl(status, headers, self.permanent_ttl, self.default_ttl))
+
+    def _put(self, url, next_url, redirect_type, expires):
+        old = self.entries.pop(url, None)
+        if old is not None:
+            self.memory -= self.entry_size(url, old[0])
+
+        self.entries[url] = (next_url, redirect_type, expires)
+        self.memory += self.entry_size(url, next_url)
+
+        while self.entries and (len(self.entries) > self.max_entries or
+                                (self.max_memory is not None and self.memory > self.max_memory)):
+            old_url, old = self.entries.popitem(last=False)
+            self.memory -= self.entry_size(old_url, old[0])
+
+    def clear(self):
+        self.entries.clear()
+        self.memory = 0
+
+    def save(self, path=None):
+        """
+        Сохраняет непросроченные записи в файл (атомарно, через временный файл)
+
+        :param path: файл, по умолчанию snapshot_path
+        """
+        path = path or self.snapshot_path
+        if not path:
+            return
+
+        now = time()
+        self.saved_at = now
+        entries = [
+            [url, next_url, redirect_type, expires]
+            for url, (next_url, redirect_type, expires) in self.entries.iteritems()
+            if expires > now
+        ]
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as snapshot:
+            json.dump(entries, snapshot)
+        os.rename(tmp_path, path)
+
+    def maybe_save(self):
+        """Сохраняет кэш, если с прошлого сохранения прошло snapshot_interval секунд"""
+        if self.snapshot_path and time() - self.saved_at >= self.snapshot_interval:
+            try:
+                self.save()
+            except (IOError, OSError) as e:
+                logger.exception(e)
+
+    def load(self, path=None):
+        """
+        Загружает записи, сохраненные save. Отсутствующий или поврежденный файл
+        игнорируется.
+
+        :param path: файл, по умолчанию snapshot_path
+        :return: количество загруженных записей
+        """
+        path = path or self.snapshot_path
+        if not path:
+            return 0
+
+        try:
+            with open(path) as snapshot:
+                entries = json.load(snapshot)
+        except (IOError, ValueError) as e:
+            logger.info(u'Hop cache snapshot {} is not loaded: {}'.format(path, e))
+            return 0
+
+        now = time()
+        loaded = 0
+        for url, next_url, redirect_type, expires in entries:
+            if expires > now:
+                self._put(url.encode('utf8'), next_url, redirect_type, expires)
+                loaded += 1
+        return loaded
@@ -0,0 +1,76 @@
+# coding: utf-8
+from HTMLParser import HTMLParser
+import re
+
+TOKENS = re.compile(
+    r'(?P<comment><!--.*?-->)'
+    r'|(?P<raw><(?P<raw_tag>script|style)\b.*?</(?P=raw_tag)\s*>)'
+    r'|<meta\b(?P<meta>(?:[^>"\']|"[^"]*"|\'[^\']*\')*)>'
+    r'|(?P<head_end></head\s*>|<body\b)'
+    r'|(?P<tag></?[a-z](?:[^>"\']|"[^"]*"|\'[^\']*\')*>)'
+    r'|(?P<tag_start></?[a-z])',
+    re.I | re.S
+)
+
+META_START = re.compile(r'<meta\b', re.I)
+
+ATTRIBUTE = re.compile(r'([^\s"\'=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?', re.S)
+
+
+class MarkupError(ValueError):
+    """Разметку не удалось разобрать без полноценного html-парсера"""
+    pass
+
+
+def parse_attributes(text):
+    """
+    Разбирает атрибуты тега так же, как BeautifulSoup с html.parser:
+    имена приводятся к нижнему регистру, html-сущности в значениях раскрываются,
+    при повторе атрибута остается последнее значение.
+    """
+    attrs = {}
+    for name, double_quoted, single_quoted, unquoted in ATTRIBUTE.findall(text):
+        value = double_quoted or single_quoted or unquoted
+        if '&' in value:
+            value = HTMLParser().unescape(value.decode('utf8', 'ignore') if isinstance(value, str) else value)
+        attrs[name.lower()] = value
+    return attrs
+
+
+def find_first_meta(content):
+    """
+    Ищет первый тег <meta> документа, просматривая страницу только до конца <head>.
+    Комментарии, содержимое <script>/<style> и значения атрибутов других тегов пропускаются.
+
+    :return: атрибуты тега или None, если в документе нет тега <meta>
+    :raise MarkupError: если первый <meta> нельзя надежно найти без
+        полного разбора документа (например, тег не закрыт, находится
+        после <head> или внутри другого тега)
+    """
+    position = 0
+    for match in TOKENS.finditer(content):
+        # text between tokens must not contain a tag the regexp could not parse
+        if META_START.search(content, position, match.start()):
+            raise MarkupError('unparsed <meta>')
+        position = match.end()
+
+        if match.group('tag') is not None:
+            # <meta> in an attribute value or a tag name, html.parser may split such a tag differently
+            if META_START.search(match.group('tag')):
+                raise MarkupError('<meta> inside a tag')
+            continue
+        if match.group('tag_start') is not None:
+            # an unclosed tag or unbalanced quotes, the rest can't be split into tags reliably
+            if META_START.search(content, match.start()):
+                raise MarkupError('unparsed tag before <meta>')
+            return None
+        if match.group('meta') is not None:
+            return parse_attributes(match.group('meta'))
+        if match.group('head_end') is not None:
+            if META_START.search(content, position):
+                raise MarkupError('<meta> after <head>')
+            return None
+
+    if META_START.search(content, position):
+        raise MarkupError('unparsed <meta>')
+    return None
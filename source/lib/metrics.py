@@ -0,0 +1,276 @@
+# coding: utf-8
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from bisect import bisect_left
+import errno
+from logging import getLogger
+import os
+import signal
+import struct
+
+from . import ERROR_KINDS, classify_error
+from shared_state import SharedState
+from utils import set_parent_death_signal
+
+logger = getLogger('redirect_checker')
+
+PREFIX = 'redirect_checker_'
+SUFFIX = '.metrics'
+
+ERROR_LABELS = tuple(kind for kind, _ in ERROR_KINDS) + ('http',)
+"""Виды ошибок запросов (см. lib.classify_error)"""
+
+METRICS = (
+    ('tasks_total', 'counter', 'Tasks taken from the input queue', ()),
+    ('rechecks_total', 'counter', 'Tasks returned to the input queue to be rechecked', ()),
+    ('hop_errors_total', 'counter', 'Failed requests by error kind', ERROR_LABELS),
+    ('chain_hops', 'histogram', 'Redirects in a checked chain', (0, 1, 2, 3, 5, 10, 20, 30)),
+    ('hop_seconds', 'histogram', 'Request time', (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    ('take_seconds', 'histogram', 'Time to take a batch of tasks from the input queue',
+     (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)),
+    ('put_seconds', 'histogram', 'Time to put a batch of results to the queues',
+     (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)),
+)
+"""
+Метрики: имя, тип, описание, метки счетчика или границы корзин гистограммы.
+Счетчик занимает по значению на метку (одно без меток), гистограмма -
+по значению на корзину, одно на значения больше последней границы и сумму.
+"""
+
+
+def _layout():
+    offsets = {}
+    size = 0
+    for name, kind, _, labels in METRICS:
+        offsets[name] = size
+        if kind == 'histogram':
+            size += len(labels) + 2
+        else:
+            size += len(labels) or 1
+    return offsets, size
+
+
+OFFSETS, SIZE = _layout()
+SLOT = struct.Struct('d')
+VALUES = struct.Struct('{}d'.format(SIZE))
+"""Значения всех метрик в файле обработчика"""
+
+_SPECS = dict((name, (kind, labels)) for name, kind, _, labels in METRICS)
+
+
+class Metrics(object):
+    """
+    Метрики одного обработчика.
+
+    Значения хранятся в отображенном в память файле path, в который пишет
+    только этот процесс, поэтому запись не требует блокировок и обмена
+    сообщениями: файлы всех обработчиков читает и суммирует MetricsCollector
+    в основном процессе. Файл открывается при первом обращении, если он уже
+    есть (от завершенного обработчика с тем же pid), значения продолжаются.
+
+    :param path: файл значений, None - значения только в памяти процесса
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.values = SharedState(VALUES, path)
+
+    def _add(self, index, value):
+        # only this process writes the file, no lock is needed
+        values = self.values.buffer
+        offset = index * SLOT.size
+        SLOT.pack_into(values, offset, SLOT.unpack_from(values, offset)[0] + value)
+
+    def inc(self, name, value=1, label=None):
+        """Увеличивает счетчик name (с меткой label) на value"""
+        index = OFFSETS[name]
+        if label is not None:
+            index += _SPECS[name][1].index(label)
+        self._add(index, value)
+
+    def observe(self, name, value):
+        """Добавляет значение в гистограмму name"""
+        buckets = _SPECS[name][1]
+        self._add(OFFSETS[name] + bisect_left(buckets, value), 1)
+        self._add(OFFSETS[name] + len(buckets) + 1, value)
+
+    def add_chain(self, history_types, timings):
+        """
+        :param history_types: типы редиректов пройденной цепочки
+        :param timings: времена хопов цепочки (см. lib.read_timings)
+        """
+        self.observe('chain_hops', len(history_types))
+        for hop in timings:
+            self.observe('hop_seconds', hop['total'])
+            kind = classify_error(hop.get('error', 0), hop['code'])
+            if kind:
+                self.inc('hop_errors_total', label=kind)
+
+    def read(self):
+        """:return: значения всех метрик"""
+        return self.values.read()
+
+    def close(self):
+        self.values.close()
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def read_values(path):
+    """:return: значения метрик из файла обработчика, None - файла нет или он еще не создан"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(VALUES.size)
+    except IOError:
+        return None
+    if len(data) < VALUES.size:
+        return None
+    return VALUES.unpack(data)
+
+
+def format_metrics(values):
+    """
+    :param values: значения всех метрик
+    :return: метрики в текстовом формате Prometheus
+    """
+    lines = []
+    for name, kind, description, labels in METRICS:
+        full_name = PREFIX + name
+        offset = OFFSETS[name]
+        lines.append('# HELP {} {}'.format(full_name, description))
+        lines.append('# TYPE {} {}'.format(full_name, kind))
+        if kind == 'histogram':
+            cumulative = 0
+            for i, bound in enumerate(labels + ('+Inf',)):
+                cumulative += values[offset + i]
+                lines.append('{}_bucket{{le="{}"}} {!r}'.format(full_name, bound, float(cumulative)))
+            lines.append('{}_sum {!r}'.format(full_name, float(values[offset + len(labels) + 1])))
+            lines.append('{}_count {!r}'.format(full_name, float(cumulative)))
+        elif labels:
+            for i, label in enumerate(labels):
+                lines.append('{}{{kind="{}"}} {!r}'.format(full_name, label, float(values[offset + i])))
+        else:
+            lines.append('{} {!r}'.format(full_name, float(values[offset])))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsCollector(object):
+    """
+    Суммирует метрики обработчиков из файлов <pid>.metrics в directory.
+
+    Значения завершившихся обработчиков переносятся в retired, а их файлы
+    удаляются, так что счетчики не уменьшаются при перезапуске обработчиков.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.retired = [0.0] * SIZE
+
+    def clear(self):
+        """Создает directory и удаляет файлы, оставшиеся от прошлого запуска"""
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+
+    def collect(self):
+        """:return: суммы значений метрик всех обработчиков"""
+        total = list(self.retired)
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX) or not name[:-len(SUFFIX)].isdigit():
+                continue
+            path = os.path.join(self.directory, name)
+            # values of a finished worker are read after it has exited, so they are final
+            alive = is_alive(int(name[:-len(SUFFIX)]))
+            values = read_values(path)
+            if values is None:
+                continue
+            if not alive:
+                self.retired = [a + b for a, b in zip(self.retired, values)]
+                os.remove(path)
+            total = [a + b for a, b in zip(total, values)]
+        return total
+
+    def render(self):
+        return format_metrics(self.collect())
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Отдает метрики server.collector (MetricsCollector) по GET /metrics"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.collector.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(u'Metrics request: ' + format % args)
+
+
+def get_metrics(config):
+    """
+    :return: Metrics обработчика в config.METRICS_DIR, None - метрики не собираются
+    """
+    if not config.METRICS_PORT:
+        return None
+    return Metrics(os.path.join(config.METRICS_DIR, '{}{}'.format(os.getpid(), SUFFIX)))
+
+
+def serve_metrics(config):
+    """
+    Запускает http сервер метрик обработчиков на config.METRICS_HOST:config.METRICS_PORT
+    в отдельном процессе, вызывается до запуска обработчиков.
+
+    Сервер не работает в потоке основного процесса: fork копирует только
+    вызвавший его поток, и блокировки, взятые другими потоками (например,
+    блокировка логирования), остались бы взятыми в обработчиках навсегда.
+    Сокет сервера открывается только в его процессе и не наследуется обработчиками.
+
+    :return: pid процесса сервера, None - метрики не собираются
+    """
+    if not config.METRICS_PORT:
+        return None
+
+    collector = MetricsCollector(config.METRICS_DIR)
+    collector.clear()
+    pid = os.fork()
+    if pid:
+        logger.info(u'Metrics are served on {}:{}/metrics by pid={}'.format(
+            config.METRICS_HOST, config.METRICS_PORT, pid
+        ))
+        return pid
+
+    try:
+        # the server stops with the checker, even if it is killed
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        set_parent_death_signal(signal.SIGTERM)
+        server = HTTPServer((config.METRICS_HOST, config.METRICS_PORT), MetricsHandler)
+        server.collector = collector
+        server.serve_forever()
+    except Exception as e:
+        logger.exception(e)
+    finally:
+        # serve_forever does not return; don't run the cleanup of the checker process copied by fork
+        os._exit(1)
+
+
+def stop_metrics_server(pid):
+    """Останавливает процесс сервера метрик, запущенный serve_metrics"""
+    try:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    except OSError as e:
+        if e.errno not in (errno.ESRCH, errno.ECHILD):
+            raise
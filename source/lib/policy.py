@@ -0,0 +1,61 @@
+# coding: utf-8
+from urlparse import urlsplit
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+"""Типы страниц, в которых ищутся мета-редиректы и счетчики"""
+
+
+class FetchPolicy(object):
+    """
+    Правила загрузки ответов по их заголовкам.
+
+    Тело ответа загружается, только если это html-страница (или Content-Type
+    не указан) и Content-Length не больше max_content_length. Для остальных
+    ответов (apk, картинки, видео, pdf) загрузка останавливается сразу после
+    заголовков, мета-редиректы и счетчики в них не ищутся.
+
+    :param max_body_size: сколько байт тела страницы загружать, None - без ограничения
+    :param max_content_length: ответы с большим Content-Length не загружаются, None - без ограничения
+    :param head_first_domains: домены (вместе с поддоменами), урлы которых сначала
+        запрашиваются HEAD запросом, а GET делается только для html-страниц
+    :param html_types: Content-Type html-страниц
+    """
+
+    def __init__(self, max_body_size=None, max_content_length=None, head_first_domains=(),
+                 html_types=HTML_CONTENT_TYPES):
+        self.max_body_size = max_body_size
+        self.max_content_length = max_content_length
+        self.head_first_domains = tuple(domain.lower().strip('.') for domain in head_first_domains)
+        self.html_types = tuple(html_types)
+
+    def is_html(self, headers):
+        """
+        :param headers: заголовки ответа (имена в нижнем регистре)
+        """
+        content_type = headers.get('content-type')
+        if not content_type:
+            return True
+        return content_type.split(';', 1)[0].strip().lower() in self.html_types
+
+    def should_download(self, headers):
+        """
+        :param headers: заголовки ответа (имена в нижнем регистре)
+        :return: нужно ли загружать тело ответа
+        """
+        if not self.is_html(headers):
+            return False
+
+        length = headers.get('content-length', '')
+        if self.max_content_length is not None and length.isdigit():
+            return int(length) <= self.max_content_length
+        return True
+
+    def head_first(self, url):
+        """
+        :return: нужно ли запрашивать урл сначала HEAD запросом
+        """
+        if not self.head_first_domains:
+            return False
+
+        host = (urlsplit(url).hostname or '').lower()
+        return any(host == domain or host.endswith('.' + domain) for domain in self.head_first_domains)
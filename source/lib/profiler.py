@@ -0,0 +1,147 @@
+# coding: utf-8
+from collections import Counter
+import cProfile
+from logging import getLogger
+import os
+import signal
+from time import time
+
+logger = getLogger('redirect_checker')
+
+PROFILE_SIGNAL = signal.SIGUSR2
+"""Сигнал, по которому основной процесс и обработчики начинают профилирование"""
+
+SAMPLE = 'sample'
+CPROFILE = 'cprofile'
+
+
+def collapse_stack(frame):
+    """
+    :return: стек вызовов frame в формате collapsed stacks (flamegraph.pl):
+        файл:функция через ';', начиная с корня
+    """
+    functions = []
+    while frame is not None:
+        code = frame.f_code
+        functions.append('{}:{}'.format(code.co_filename, code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(functions))
+
+
+def write_collapsed(path, stacks):
+    """
+    :param stacks: сколько раз встретился каждый стек (collapse_stack)
+    """
+    with open(path, 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write('{} {}\n'.format(stack, count))
+
+
+class Profiler(object):
+    """
+    Профилирование работающего обработчика по сигналу PROFILE_SIGNAL.
+
+    После install обработчик ждет сигнала, пока его нет, профилировщик ничего
+    не делает. По сигналу профилирование идет duration секунд:
+
+    + sample - каждые interval секунд процессорного времени (ITIMER_PROF)
+      запоминается стек, результат пишется в <pid>.<время>.collapsed;
+    + cprofile - процесс выполняется под cProfile, результат пишется
+      в <pid>.<время>.pstats.
+
+    Сигналы таймеров не прерывают системные вызовы (siginterrupt), поэтому
+    запросы и работа с очередями не получают EINTR.
+
+    :param directory: каталог для результатов
+    :param mode: SAMPLE или CPROFILE
+    :param duration: сколько секунд профилировать
+    :param interval: секунд процессорного времени между снимками стека в режиме SAMPLE
+    """
+
+    def __init__(self, directory, mode=SAMPLE, duration=30, interval=0.005):
+        self.directory = directory
+        self.mode = mode
+        self.duration = duration
+        self.interval = interval
+        self.started_at = None
+        self.profile = None
+        self.stacks = None
+
+    def install(self):
+        """Начинает ждать сигнала PROFILE_SIGNAL"""
+        set_handler(PROFILE_SIGNAL, self.on_start)
+
+    def on_start(self, signum, frame):
+        if self.started_at is not None:
+            # already profiling
+            return
+        self.start()
+
+    def on_sample(self, signum, frame):
+        # a signal delivered right after stop is ignored
+        if self.stacks is not None:
+            self.stacks[collapse_stack(frame)] += 1
+
+    def on_stop(self, signum, frame):
+        self.stop()
+
+    def start(self):
+        self.started_at = time()
+        set_handler(signal.SIGALRM, self.on_stop)
+        if self.mode == CPROFILE:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.stacks = Counter()
+            set_handler(signal.SIGPROF, self.on_sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        signal.setitimer(signal.ITIMER_REAL, self.duration)
+        logger.info(u'Profiling ({}) for {}s'.format(self.mode, self.duration))
+
+    def stop(self):
+        """
+        Останавливает профилирование и записывает результат
+
+        :return: файл результата, None - профилирование не шло или результат не записан
+        """
+        if self.started_at is None:
+            return None
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        path = os.path.join(self.directory, '{}.{}'.format(os.getpid(), int(self.started_at)))
+        self.started_at = None
+
+        if self.mode == CPROFILE:
+            profile, self.profile = self.profile, None
+            profile.disable()
+            path += '.pstats'
+            write = profile.dump_stats
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            stacks, self.stacks = self.stacks, None
+            path += '.collapsed'
+            write = lambda path: write_collapsed(path, stacks)
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            write(path)
+        except (IOError, OSError) as e:
+            logger.exception(e)
+            return None
+
+        logger.info(u'Profile is written to {}'.format(path))
+        return path
+
+
+def set_handler(signum, handler):
+    signal.signal(signum, handler)
+    signal.siginterrupt(signum, False)
+
+
+def get_profiler(config):
+    """
+    :return: Profiler с результатами в config.PROFILE_DIR, None - профилирование выключено
+    """
+    if not config.PROFILE_DIR:
+        return None
+    return Profiler(config.PROFILE_DIR, config.PROFILE_MODE, config.PROFILE_DURATION, config.PROFILE_INTERVAL)
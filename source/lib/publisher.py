@@ -0,0 +1,120 @@
+# coding: utf-8
+from logging import getLogger
+from time import time
+
+from tarantool.error import DatabaseError
+
+logger = getLogger('redirect_checker')
+
+
+class ResultPublisher(object):
+    """
+    Отложенная отправка результатов задач в очереди.
+
+    Результаты копятся в буфере и отправляются пачками: результаты проверок
+    в выходную очередь, задачи на перепроверку во входную (с задержкой
+    recheck_delay и приоритетом, с которым задача была взята). Буфер
+    отправляется, когда в нем max_size результатов или самый старый из них
+    ждет max_delay секунд (см. maybe_flush).
+
+    Выполнение задач подтверждается только после того, как их результаты
+    записаны в очереди. Если записать не удалось, задачи не подтверждаются
+    и возвращаются в очередь; задачи, результаты которых уже записаны
+    (например, перепроверки, если не удалось записать выходную очередь),
+    подтверждаются, чтобы их результаты не записывались повторно.
+
+    :param input_tube: входная очередь (lib.tube.BatchTube)
+    :param output_tube: выходная очередь (lib.tube.BatchTube)
+    :param recheck_delay: задержка перепроверки, секунд
+    :param max_size: сколько результатов копить до отправки
+    :param max_delay: сколько секунд результат может ждать отправки
+    :param metrics: Metrics, в который добавляются время отправки и количество перепроверок
+    """
+
+    def __init__(self, input_tube, output_tube, recheck_delay, max_size=100, max_delay=0.5, metrics=None):
+        self.input_tube = input_tube
+        self.output_tube = output_tube
+        self.recheck_delay = recheck_delay
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.metrics = metrics
+        # (task, result of make_task_result or None)
+        self.results = []
+        self.first_added_at = None
+
+    def __len__(self):
+        return len(self.results)
+
+    def add(self, task, result):
+        """
+        Добавляет результат задачи в буфер и отправляет буфер, если он заполнен
+
+        :param result: результат make_task_result, None - задача просто подтверждается
+        """
+        if not self.results:
+            self.first_added_at = time()
+        self.results.append((task, result))
+        if len(self.results) >= self.max_size:
+            self.flush()
+
+    def maybe_flush(self):
+        """Отправляет буфер, если самый старый результат ждет max_delay секунд"""
+        if self.results and time() - self.first_added_at >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        """Отправляет результаты и подтверждает выполнение их задач"""
+        if not self.results:
+            return
+        results, self.results = self.results, []
+
+        # tasks whose results are written (or have no results) and can be acked
+        written = []
+        recheck_tasks, rechecks = [], []
+        output_tasks, outputs = [], []
+        for task, result in results:
+            if not result:
+                written.append(task)
+                continue
+            is_input, data = result
+            if is_input:
+                recheck_tasks.append(task)
+                rechecks.append((data, task.pri))
+            else:
+                output_tasks.append(task)
+                outputs.append((data, None))
+            logger.debug(u'Task id={} data:{}'.format(task.task_id, data))
+
+        started_at = time()
+        try:
+            self.input_tube.put_batch(rechecks, delay=self.recheck_delay)
+            written.extend(recheck_tasks)
+            self.output_tube.put_batch(outputs)
+            written.extend(output_tasks)
+        except DatabaseError as e:
+            logger.info(u'Results of {} tasks are not sent'.format(len(results) - len(written)))
+            logger.exception(e)
+            if written:
+                # the rest of the tasks return to the queue, the written results must not be repeated
+                self.ack(written)
+            return
+        if self.metrics is not None:
+            self.metrics.observe('put_seconds', time() - started_at)
+            self.metrics.inc('rechecks_total', len(rechecks))
+
+        self.ack(written)
+
+    def ack(self, tasks):
+        """Подтверждает выполнение задач одним запросом к очереди"""
+        try:
+            acked = self.input_tube.ack_batch(tasks)
+        except DatabaseError as e:
+            logger.info('Task ack fail')
+            logger.exception(e)
+            return
+
+        for task in tasks:
+            if task.task_id in acked:
+                logger.info(u'Task id={} done'.format(task.task_id))
+            else:
+                logger.info(u'Task id={} ack fail'.format(task.task_id))
@@ -0,0 +1,61 @@
+# coding: utf-8
+import struct
+from time import sleep, time
+
+from shared_state import SharedState
+
+STATE = struct.Struct('dd')
+"""Состояние ведра в общем файле: количество токенов, время обновления"""
+
+
+class TokenBucket(object):
+    """
+    Ограничитель частоты запросов: не больше rate запросов в секунду
+    с всплесками до burst запросов.
+
+    Если передан path, состояние хранится в отображенном в память файле
+    и разделяется всеми процессами, использующими этот файл (например, всеми
+    обработчиками на сервере, см. SharedState). Файл открывается при первом
+    обращении, поэтому объект можно создать до запуска обработчиков.
+
+    :param rate: запросов в секунду
+    :param burst: размер ведра, по умолчанию rate (но не меньше одного запроса)
+    :param path: файл общего состояния, None - состояние только в этом процессе
+    """
+
+    def __init__(self, rate, burst=None, path=None):
+        self.rate = float(rate)
+        self.burst = float(max(1, burst or rate))
+        self.state = SharedState(STATE, path, (self.burst, time()))
+
+    def acquire(self):
+        """
+        Забирает токен, если он есть
+
+        :return: сколько секунд ждать следующего токена, 0 - токен получен
+        """
+        return self.state.update(self._take)
+
+    def _take(self, state):
+        """
+        Пополняет ведро по прошедшему времени и забирает токен, если он есть
+
+        :return: новое состояние, сколько секунд ждать токена
+        """
+        tokens, updated_at = state
+        now = time()
+        tokens = min(self.burst, tokens + max(0.0, now - updated_at) * self.rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0
+        return (tokens, now), (1 - tokens) / self.rate
+
+    def wait(self):
+        """Ждет и забирает токен"""
+        while True:
+            delay = self.acquire()
+            if not delay:
+                return
+            sleep(delay)
+
+    def close(self):
+        self.state.close()
@@ -0,0 +1,99 @@
+# coding: utf-8
+import json
+from logging import getLogger
+import sqlite3
+from time import time
+
+from . import DEADLINE_EXCEEDED, prepare_url, to_unicode
+
+logger = getLogger('redirect_checker')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    url TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    expires REAL NOT NULL
+)
+'''
+
+
+class ResultCache(object):
+    """
+    Кэш результатов проверки цепочек, общий для всех обработчиков на сервере.
+
+    Хранит результат get_redirect_history (history_types, history_urls,
+    counters) по нормализованному урлу в sqlite базе, поэтому одинаковые урлы
+    разных задач проверяются один раз за ttl секунд, в каком бы процессе
+    они ни обрабатывались. Результаты с ошибками и прерванные по бюджету
+    времени не сохраняются, их проверка будет повторена.
+
+    Ошибки базы не прерывают обработку задач: результат просто не берется
+    из кэша и не сохраняется в него. Соединение открывается при первом
+    обращении, поэтому объект можно создать до запуска обработчиков.
+
+    :param path: файл базы
+    :param ttl: сколько секунд хранить результат
+    :param lock_timeout: сколько секунд ждать блокировку базы другим процессом
+    :param cleanup_interval: как часто удалять просроченные результаты, секунд
+    """
+
+    def __init__(self, path, ttl=300, lock_timeout=0.1, cleanup_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.cleanup_interval = cleanup_interval
+        self.cleaned_at = time()
+        self.connection = None
+
+    @staticmethod
+    def key(url):
+        return to_unicode(prepare_url(url), 'ignore')
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            # readers don't block the writer and vice versa
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(SCHEMA)
+        return self.connection
+
+    def get(self, url):
+        """
+        :return: результат get_redirect_history или None, если урла нет в кэше
+        """
+        try:
+            row = self.connect().execute(
+                'SELECT result FROM results WHERE url = ? AND expires > ?',
+                (self.key(url), time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.info(u'Result cache get failed: {}'.format(e))
+            return None
+
+        if row is None:
+            return None
+        return tuple(json.loads(row[0]))
+
+    def put(self, url, history):
+        """Сохраняет результат get_redirect_history на ttl секунд"""
+        history_types = history[0]
+        if 'ERROR' in history_types or DEADLINE_EXCEEDED in history_types or self.ttl <= 0:
+            return
+
+        now = time()
+        try:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO results (url, result, expires) VALUES (?, ?, ?)',
+                (self.key(url), json.dumps(history), now + self.ttl)
+            )
+            if now - self.cleaned_at >= self.cleanup_interval:
+                self.cleaned_at = now
+                connection.execute('DELETE FROM results WHERE expires <= ?', (now,))
+        except sqlite3.Error as e:
+            logger.info(u'Result cache put failed: {}'.format(e))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
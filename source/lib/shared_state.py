@@ -0,0 +1,75 @@
+# coding: utf-8
+import fcntl
+import mmap
+import os
+
+
+class SharedState(object):
+    """
+    Состояние фиксированного размера, разделяемое процессами через
+    отображенный в память файл path (например, всеми обработчиками на сервере).
+
+    Файл открывается при первом обращении, поэтому объект можно создать до
+    запуска обработчиков. Новый файл заполнен нулями. Без path состояние
+    хранится только в памяти этого процесса и начинается с initial.
+
+    update меняет состояние под блокировкой файла. Если файл пишет только
+    один процесс, блокировка не нужна, и можно менять buffer напрямую.
+
+    :param layout: struct.Struct состояния
+    :param path: файл общего состояния, None - состояние только в этом процессе
+    :param initial: начальное состояние в памяти процесса, None - нули
+    """
+
+    def __init__(self, layout, path=None, initial=None):
+        self.layout = layout
+        self.path = path
+        self.initial = initial
+        self.fd = None
+        self._buffer = None
+
+    def _open(self):
+        if self.path is None:
+            self._buffer = bytearray(self.layout.size)
+            if self.initial is not None:
+                self.layout.pack_into(self._buffer, 0, *self.initial)
+            return
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0644)
+        if os.fstat(self.fd).st_size < self.layout.size:
+            os.ftruncate(self.fd, self.layout.size)
+        self._buffer = mmap.mmap(self.fd, self.layout.size)
+
+    @property
+    def buffer(self):
+        """Отображенный в память файл (или bytearray без path)"""
+        if self._buffer is None:
+            self._open()
+        return self._buffer
+
+    def read(self):
+        """:return: состояние"""
+        return self.layout.unpack_from(self.buffer)
+
+    def update(self, change, *args):
+        """
+        Меняет состояние под блокировкой файла
+
+        :param change: функция (состояние, *args) -> (новое состояние, результат)
+        :return: результат change
+        """
+        buffer = self.buffer
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            state, result = change(self.layout.unpack_from(buffer), *args)
+            self.layout.pack_into(buffer, 0, *state)
+        finally:
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return result
+
+    def close(self):
+        if self.fd is not None:
+            self._buffer.close()
+            os.close(self.fd)
+            self._buffer = self.fd = None
@@ -0,0 +1,105 @@
+# coding: utf-8
+from collections import Counter
+from logging import getLogger
+from time import time
+
+from . import classify_error
+
+logger = getLogger('redirect_checker')
+
+PHASES = ('dns', 'connect', 'tls', 'wait', 'transfer', 'total')
+"""Этапы запроса: резолв, tcp соединение, tls, ожидание ответа, загрузка, весь запрос"""
+
+
+def hop_phases(timings):
+    """
+    Переводит накопительные времена curl (от начала запроса) в длительности этапов
+
+    :param timings: времена хопа (см. lib.read_timings)
+    :return: длительность каждого из PHASES в секундах
+    """
+    connected = max(timings['connect'], timings['appconnect'])
+    started = timings['starttransfer']
+    return {
+        'dns': timings['namelookup'],
+        'connect': max(0.0, timings['connect'] - timings['namelookup']) if timings['connect'] else 0.0,
+        'tls': max(0.0, timings['appconnect'] - timings['connect']) if timings['appconnect'] else 0.0,
+        'wait': max(0.0, started - connected) if started else 0.0,
+        'transfer': max(0.0, timings['total'] - started) if started else 0.0,
+        'total': timings['total'],
+    }
+
+
+class HopStats(object):
+    """
+    Статистика запросов обработчика: среднее и максимальное время этапов
+    запросов, коды ответов, виды ошибок (см. lib.classify_error), объем
+    загруженных данных.
+
+    Показывает, что ограничивает скорость проверки: резолв, установка
+    соединений, tls или медленные сайты.
+
+    :param interval: как часто писать статистику в лог в maybe_log, секунд
+    """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.started_at = time()
+        self.chains = 0
+        self.hops = 0
+        self.size = 0
+        self.codes = Counter()
+        self.errors = Counter()
+        self.sums = dict.fromkeys(PHASES, 0.0)
+        self.maximums = dict.fromkeys(PHASES, 0.0)
+
+    def add_chain(self, timings):
+        """
+        :param timings: времена хопов цепочки (см. lib.read_timings)
+        """
+        self.chains += 1
+        for hop in timings:
+            self.add_hop(hop)
+
+    def add_hop(self, timings):
+        self.hops += 1
+        self.size += timings['size']
+        self.codes[timings['code']] += 1
+        kind = classify_error(timings.get('error', 0), timings['code'])
+        if kind:
+            self.errors[kind] += 1
+        for phase, duration in hop_phases(timings).iteritems():
+            self.sums[phase] += duration
+            self.maximums[phase] = max(self.maximums[phase], duration)
+
+    def summary(self):
+        """
+        :return: статистика с момента последнего сброса, времена в миллисекундах
+        """
+        hops = self.hops or 1
+        return {
+            'seconds': time() - self.started_at,
+            'chains': self.chains,
+            'hops': self.hops,
+            'size': self.size,
+            'codes': dict(self.codes),
+            'errors': dict(self.errors),
+            'avg': dict((phase, 1000 * total / hops) for phase, total in self.sums.iteritems()),
+            'max': dict((phase, 1000 * duration) for phase, duration in self.maximums.iteritems()),
+        }
+
+    def maybe_log(self):
+        """Пишет статистику в лог и сбрасывает ее, если прошло interval секунд"""
+        if time() - self.started_at < self.interval:
+            return
+
+        summary = self.summary()
+        logger.info(u'Hop stats for {seconds:.0f}s: chains={chains} hops={hops} bytes={size} codes={codes} '
+                    u'errors={errors}'.format(**summary))
+        logger.info(u'Hop phases avg/max ms: {}'.format(', '.join(
+            '{}={:.1f}/{:.1f}'.format(phase, summary['avg'][phase], summary['max'][phase]) for phase in PHASES
+        )))
+        self.reset()
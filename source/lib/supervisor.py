@@ -0,0 +1,107 @@
+# coding: utf-8
+from logging import getLogger
+from multiprocessing import active_children
+import os
+import signal
+from time import time
+
+from utils import spawn_workers
+
+logger = getLogger('redirect_checker')
+
+
+class Supervisor(object):
+    """
+    Пул процессов-обработчиков.
+
+    fill запускает недостающих обработчиков или останавливает лишних (если
+    size уменьшили), его стоит вызывать сразу после завершения любого
+    обработчика (например, по SIGCHLD): обработчики сами завершаются, чтобы
+    перезапуститься (см. lib.worker.should_recycle).
+
+    drain останавливает обработчиков мягко (при остановке основного процесса):
+    обработчик получает SIGTERM (см. lib.utils.ParentWatcher), перестает брать
+    задачи, доделывает начатые, отправляет их результаты и завершается.
+    Не завершившиеся за drain_timeout секунд обработчики убиваются, drain
+    стоит вызывать, пока он не вернет 0.
+
+    :param target: функция обработчика (target(*args, parent_pid=...))
+    :param args: аргументы обработчика
+    :param size: количество обработчиков
+    :param drain_timeout: сколько секунд ждать завершения остановленного обработчика
+    """
+
+    def __init__(self, target, args, size, drain_timeout=60):
+        self.target = target
+        self.args = args
+        self.size = size
+        self.drain_timeout = drain_timeout
+        self.parent_pid = os.getpid()
+        # pid of a draining worker -> time to kill it
+        self.draining = {}
+
+    def fill(self):
+        """
+        Запускает недостающих обработчиков и останавливает лишних.
+        Останавливаемые обработчики считаются, пока не завершатся.
+
+        :return: количество запущенных обработчиков
+        """
+        workers = active_children()
+        self.kill_stuck(workers)
+
+        running = [worker for worker in workers if worker.pid not in self.draining]
+        if len(running) > self.size:
+            logger.info('Stopping {} workers'.format(len(running) - self.size))
+            self.stop(running[self.size:])
+
+        required_workers_count = self.size - len(workers)
+        if required_workers_count <= 0:
+            return 0
+
+        logger.info('Spawning {} workers'.format(required_workers_count))
+        spawn_workers(
+            num=required_workers_count,
+            target=self.target,
+            args=self.args,
+            parent_pid=self.parent_pid
+        )
+        return required_workers_count
+
+    def drain(self):
+        """
+        Просит всех обработчиков доделать начатые задачи и завершиться
+
+        :return: количество еще не завершившихся обработчиков
+        """
+        workers = active_children()
+        self.kill_stuck(workers)
+        self.stop(workers)
+        return len(workers)
+
+    def stop(self, workers):
+        """Просит обработчиков доделать начатые задачи и завершиться"""
+        for worker in workers:
+            if worker.pid not in self.draining:
+                worker.terminate()
+                self.draining[worker.pid] = time() + self.drain_timeout
+
+    def signal_workers(self, signum):
+        """Посылает сигнал signum работающим (не останавливаемым) обработчикам"""
+        for worker in active_children():
+            if worker.pid not in self.draining:
+                os.kill(worker.pid, signum)
+
+    def kill_stuck(self, workers):
+        """Убивает обработчиков, не завершившихся за drain_timeout секунд после drain"""
+        now = time()
+        draining = {}
+        for worker in workers:
+            kill_at = self.draining.get(worker.pid)
+            if kill_at is None:
+                continue
+            if now >= kill_at:
+                logger.info('Worker pid={} is not stopped in {}s, killing'.format(worker.pid, self.drain_timeout))
+                os.kill(worker.pid, signal.SIGKILL)
+            draining[worker.pid] = kill_at
+        self.draining = draining
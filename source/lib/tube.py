@@ -0,0 +1,91 @@
+# coding: utf-8
+from tarantool_queue import tarantool_queue
+
+
+class BatchTube(object):
+    """
+    Очередь tarantool_queue.Tube с пакетными операциями: несколько задач
+    берутся, подтверждаются и хоронятся одним запросом к серверу
+    (процедуры queue.take_batch, queue.put_batch, queue.ack_batch,
+    queue.bury_batch из provision/init.lua).
+
+    Остальные атрибуты и методы берутся из tarantool_queue.Tube.
+    """
+
+    def __init__(self, tube):
+        self.tube = tube
+
+    def __getattr__(self, name):
+        return getattr(self.tube, name)
+
+    def take_batch(self, count, timeout=0):
+        """
+        Ждет готовую задачу не дольше timeout секунд (0 - не ждет, None - без
+        ограничения) и забирает ее вместе с остальными готовыми задачами,
+        всего не больше count задач.
+
+        :return: список задач, пустой, если задач не было; у задач есть атрибут pri -
+            приоритет, с которым задачу можно снова положить в очередь
+        """
+        if count < 1:
+            return []
+
+        queue = self.tube.queue
+        args = [str(queue.space), str(self.tube.opt['tube']), str(count)]
+        if timeout is not None:
+            args.append(str(timeout))
+        response = queue.tnt.call('queue.take_batch', tuple(args))
+        return [self._make_task(row) for row in response]
+
+    def _make_task(self, row):
+        queue = self.tube.queue
+        task = tarantool_queue.Task(queue, space=queue.space, task_id=row[0], tube=row[1], status=row[2],
+                                    raw_data=row[4])
+        task.pri = int(row[3])
+        return task
+
+    def put_batch(self, items, **kwargs):
+        """
+        Кладет задачи в очередь одним запросом
+
+        :param items: пары (данные задачи, приоритет), приоритет None - приоритет очереди
+        :param kwargs: delay, ttl, ttr, как в tarantool_queue.Tube.put
+        :return: количество положенных задач
+        """
+        if not items:
+            return 0
+
+        opt = dict(self.tube.opt, **kwargs)
+        args = [str(self.tube.queue.space), str(opt['tube']), str(opt['delay']), str(opt['ttl']), str(opt['ttr'])]
+        for data, pri in items:
+            args.append(str(opt['pri'] if pri is None else pri))
+            args.append(self.tube.serialize(data))
+        self.tube.queue.tnt.call('queue.put_batch', tuple(args))
+        return len(items)
+
+    def ack_batch(self, tasks):
+        """
+        Подтверждает выполнение задач
+
+        :return: множество id подтвержденных задач
+        """
+        return self._call_batch('queue.ack_batch', tasks)
+
+    def bury_batch(self, tasks):
+        """
+        Хоронит задачи
+
+        :return: множество id похороненных задач
+        """
+        return self._call_batch('queue.bury_batch', tasks)
+
+    def _call_batch(self, procedure, tasks):
+        if not tasks:
+            return set()
+
+        for task in tasks:
+            # don't release the task when it is garbage collected
+            task.modified = True
+        queue = self.tube.queue
+        response = queue.tnt.call(procedure, (str(queue.space),) + tuple(task.task_id for task in tasks))
+        return set(row[0] for row in response)
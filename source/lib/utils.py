@@ -1,12 +1,15 @@
 # coding: utf-8
 import argparse
+import ctypes
+import ctypes.util
 from multiprocessing import Process
 import os
-import socket
-import urllib2
+import signal
 
 from tarantool_queue import tarantool_queue
 
+from tube import BatchTube
+
 
 def try_fork():
     try:
@@ -99,10 +102,13 @@ def parse_cmd_args(args, app_description=''):
 
 
 def get_tube(host, port, space, name):
+    """
+    :return: BatchTube для очереди name
+    """
     queue = tarantool_queue.Queue(
         host=host, port=port, space=space
     )
-    return queue.tube(name)
+    return BatchTube(queue.tube(name))
 
 
 class Config(object):
@@ -119,12 +125,58 @@ def spawn_workers(num, target, args, parent_pid):
         p.start()
 
 
-def check_network_status(check_url, timeout):
+PR_SET_PDEATHSIG = 1
+"""Опция prctl: сигнал, который процесс получит при смерти родителя (только Linux)"""
+
+
+def set_parent_death_signal(signum):
+    """
+    Просит ядро прислать процессу signum, когда завершится родительский процесс
+
+    :return: удалось ли установить сигнал
+    """
     try:
-        urllib2.urlopen(
-            url=check_url,
-            timeout=timeout,
-        )
-        return True
-    except (urllib2.URLError, socket.error, ValueError):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc.prctl(PR_SET_PDEATHSIG, signum, 0, 0, 0) == 0
+    except (OSError, AttributeError):
         return False
+
+
+class ParentWatcher(object):
+    """
+    Следит, жив ли родительский процесс обработчика.
+
+    Где возможно, о смерти родителя сообщает ядро сигналом signum
+    (PR_SET_PDEATHSIG), и alive не делает системных вызовов. Иначе alive
+    проверяет /proc/<parent_pid>.
+
+    Тем же сигналом родитель останавливает обработчик (см. Supervisor.drain),
+    поэтому alive возвращает False и после него.
+
+    Сигнал не прерывает ожидающие системные вызовы (например, ожидание
+    задачи из очереди), обработчик замечает смерть родителя после них.
+
+    :param parent_pid: pid родительского процесса
+    :param signum: сигнал о смерти родителя, его обработчик заменяется
+    """
+
+    def __init__(self, parent_pid, signum=signal.SIGTERM):
+        self.parent_pid = parent_pid
+        self.parent_alive = True
+
+        signal.signal(signum, self.on_parent_death)
+        signal.siginterrupt(signum, False)
+        self.notified = set_parent_death_signal(signum)
+        if not self.notified:
+            signal.signal(signum, signal.SIG_DFL)
+        elif os.getppid() != parent_pid:
+            # parent died before the signal was requested
+            self.parent_alive = False
+
+    def on_parent_death(self, signum, frame):
+        self.parent_alive = False
+
+    def alive(self):
+        if self.notified:
+            return self.parent_alive
+        return os.path.exists('/proc/{}'.format(self.parent_pid))
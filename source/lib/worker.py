@@ -1,28 +1,57 @@
 # coding: utf-8
 from logging import getLogger
-import os.path
+import resource
+from time import sleep, time
 
-from tarantool.error import DatabaseError
-from . import to_unicode, get_redirect_history
+import gevent
+from gevent import spawn
+from gevent.event import AsyncResult, Event
+from gevent.lock import Semaphore
+from gevent.monkey import patch_socket
+from gevent.pool import Pool
+from gevent.select import select
+from . import COUNTER_TYPES, DEADLINE_EXCEEDED, CheckSettings, get_counter_scanner, get_redirect_history, to_unicode
+from breaker import get_breaker
+from curl_pool import CurlPool
+from engine import RedirectEngine
+from hop_cache import HopCache
+from metrics import get_metrics
+from policy import FetchPolicy
+from profiler import get_profiler
+from publisher import ResultPublisher
+from rate_limit import TokenBucket
+from result_cache import ResultCache
+from stats import HopStats
 
-from utils import get_tube
+from utils import ParentWatcher, get_tube
 
 logger = getLogger('redirect_checker')
 
 
-def get_redirect_history_from_task(task, timeout, max_redirects=30, user_agent=None):
+def get_task_url(task):
     url = to_unicode(task.data['url'], 'ignore')
-    is_recheck = bool(task.data.get('recheck'))
 
     logger.info(u'Task id={} url={} url_id={} is_recheck={}'.format(
-        task.task_id, url, task.data["url_id"], is_recheck
+        task.task_id, url, task.data["url_id"], bool(task.data.get('recheck'))
     ))
 
-    history_types, history_urls, counters = get_redirect_history(
-        url, timeout, max_redirects, user_agent
-    )
-    if 'ERROR' in history_types and not is_recheck:
+    return url
+
+
+def make_task_result(task, history_types, history_urls, counters):
+    """
+    Формирует по результату проверки урла задачи данные для очереди
+
+    :return: нужно ли вернуть задачу во входную очередь, данные
+    """
+    is_recheck = bool(task.data.get('recheck'))
+    is_failed = 'ERROR' in history_types or DEADLINE_EXCEEDED in history_types
+
+    if is_failed and not is_recheck:
         task.data['recheck'] = True
+        history = get_partial_history(history_types, history_urls)
+        if history is not None:
+            task.data['history'] = history
         data = task.data
         is_input = True
     else:
@@ -38,7 +67,85 @@ def get_redirect_history_from_task(task, timeout, max_redirects=30, user_agent=N
     return is_input, data
 
 
-def worker(config, parent_pid):
+def get_partial_history(history_types, history_urls):
+    """
+    :return: типы и урлы цепочки до первого оборвавшегося хопа,
+        с которых можно продолжить перепроверку; None - продолжать не с чего
+    """
+    for i, redirect_type in enumerate(history_types):
+        if redirect_type in ('ERROR', DEADLINE_EXCEEDED):
+            break
+    else:
+        return None
+    if not i:
+        return None
+    return [history_types[:i], history_urls[:i + 1]]
+
+
+def get_task_resume(task):
+    """
+    :return: типы и урлы начала цепочки из предыдущей проверки урла задачи, None - их нет
+    """
+    history = task.data.get('history')
+    if not history:
+        return None
+    history_types, history_urls = history
+    return history_types, history_urls
+
+
+def report_chain(history, stats=None, breaker=None, metrics=None):
+    """
+    Передает времена запросов цепочки в stats (HopStats), breaker (CircuitBreaker)
+    и metrics (Metrics)
+
+    :param history: результат get_redirect_history, с временами запросов, если передан stats, breaker или metrics
+    :return: результат без времен запросов
+    """
+    if stats is None and breaker is None and metrics is None:
+        return history
+    if stats is not None:
+        stats.add_chain(history[3])
+    if breaker is not None:
+        breaker.add_chain(history[3], history[0])
+    if metrics is not None:
+        metrics.add_chain(history[0], history[3])
+    return history[:3]
+
+
+def get_redirect_history_from_task(task, settings, result_cache=None, stats=None, breaker=None, metrics=None):
+    """
+    Проверяет урл задачи с настройками settings (CheckSettings)
+    Результат берется из result_cache (ResultCache), если он там есть
+    Перепроверка продолжается с конца сохраненной в задаче истории (см. get_task_resume)
+    Если передан stats (HopStats), в него добавляются времена запросов
+    Если передан breaker (CircuitBreaker), ему сообщается о пройденной цепочке
+    Если передан metrics (Metrics), в него добавляются хопы и времена запросов
+    Запросы с временными ошибками повторяются до settings.retries раз (см. get_redirect_history)
+    """
+    url = get_task_url(task)
+
+    history = result_cache.get(url) if result_cache else None
+    if history is None:
+        history = get_redirect_history(
+            url, settings, extended=stats is not None or breaker is not None or metrics is not None,
+            resume=get_task_resume(task)
+        )
+        history = report_chain(history, stats, breaker, metrics)
+        if result_cache:
+            result_cache.put(url, history)
+    else:
+        logger.info(u'Task id={} result is taken from cache'.format(task.task_id))
+
+    history_types, history_urls, counters = history
+    return make_task_result(task, history_types, history_urls, counters)
+
+
+def get_tubes(config):
+    """
+    Подключается к входной и выходной очередям
+
+    :return: входная очередь, выходная очередь
+    """
     input_tube = get_tube(
         host=config.INPUT_QUEUE_HOST,
         port=config.INPUT_QUEUE_PORT,
@@ -65,35 +172,410 @@ def worker(config, parent_pid):
         name=output_tube.opt['tube']
     ))
 
-    parent_proc = '/proc/{}'.format(parent_pid)
+    return input_tube, output_tube
+
+
+def get_worker_counter_scanner(config):
+    """
+    :return: CounterScanner для COUNTER_TYPES и config.EXTRA_COUNTER_TYPES
+    """
+    return get_counter_scanner(COUNTER_TYPES + tuple(config.EXTRA_COUNTER_TYPES))
+
+
+def get_worker_fetch_policy(config):
+    """
+    :return: FetchPolicy по настройкам MAX_BODY_SIZE, MAX_CONTENT_LENGTH, HEAD_FIRST_DOMAINS
+    """
+    return FetchPolicy(config.MAX_BODY_SIZE, config.MAX_CONTENT_LENGTH, config.HEAD_FIRST_DOMAINS)
+
+
+def get_worker_hop_cache(config):
+    """
+    :return: HopCache, заполненный из config.HOP_CACHE_SNAPSHOT, или None,
+        если кэш выключен (HOP_CACHE_SIZE = 0)
+    """
+    if not config.HOP_CACHE_SIZE:
+        return None
+
+    hop_cache = HopCache(
+        config.HOP_CACHE_SIZE,
+        config.HOP_CACHE_MAX_MEMORY,
+        config.HOP_CACHE_PERMANENT_TTL,
+        config.HOP_CACHE_DEFAULT_TTL,
+        config.HOP_CACHE_SNAPSHOT,
+        config.HOP_CACHE_SNAPSHOT_INTERVAL
+    )
+    loaded = hop_cache.load()
+    logger.info(u'Hop cache loaded with {} entries'.format(loaded))
+    return hop_cache
+
+
+def get_worker_result_cache(config):
+    """
+    :return: ResultCache в файле config.RESULT_CACHE_PATH или None, если кэш выключен
+    """
+    if not config.RESULT_CACHE_PATH:
+        return None
+    return ResultCache(config.RESULT_CACHE_PATH, config.RESULT_CACHE_TTL)
+
+
+def get_worker_rate_limiter(config):
+    """
+    :return: TokenBucket, общий для обработчиков через config.RATE_LIMIT_FILE,
+        или None, если частота запросов не ограничена
+    """
+    if not config.RATE_LIMIT:
+        return None
+    return TokenBucket(config.RATE_LIMIT, config.RATE_LIMIT_BURST, config.RATE_LIMIT_FILE)
+
+
+def get_worker_stats(config):
+    """
+    :return: HopStats, который пишется в лог раз в config.STATS_INTERVAL секунд,
+        или None, если статистика выключена
+    """
+    if not config.STATS_INTERVAL:
+        return None
+    return HopStats(config.STATS_INTERVAL)
+
+
+def get_worker_publisher(config, input_tube, output_tube, metrics=None):
+    """
+    :return: ResultPublisher, отправляющий результаты пачками по config.RESULT_BATCH_SIZE
+        не реже раза в config.RESULT_FLUSH_INTERVAL секунд
+    """
+    return ResultPublisher(
+        input_tube, output_tube, config.RECHECK_DELAY, config.RESULT_BATCH_SIZE, config.RESULT_FLUSH_INTERVAL,
+        metrics
+    )
+
+
+def get_take_timeout(config, busy):
+    """
+    Очередь отдает задачу, как только она появляется, поэтому простаивающий
+    обработчик ждет задачу долго, а занятой - недолго, чтобы вернуться к работе.
+
+    :param busy: есть ли у обработчика незавершенная работа
+    :return: сколько секунд ждать задачу
+    """
+    return config.QUEUE_TAKE_TIMEOUT if busy else config.QUEUE_IDLE_TAKE_TIMEOUT
+
+
+def take_tasks(input_tube, count, timeout, breaker=None, metrics=None):
+    """
+    Берет до count задач, если breaker (CircuitBreaker) разрешает
+    Если передан metrics (Metrics), в него добавляются время взятия и количество задач
+
+    :return: список задач, None - брать задачи сейчас нельзя
+    """
+    if breaker is not None:
+        count = breaker.acquire(count)
+        if not count:
+            return None
+
+    started_at = time()
+    tasks = input_tube.take_batch(count, timeout)
+    if metrics is not None:
+        metrics.observe('take_seconds', time() - started_at)
+        metrics.inc('tasks_total', len(tasks))
+
+    if breaker is not None:
+        breaker.release(count - len(tasks))
+    return tasks
+
+
+def should_recycle(config, tasks_count):
+    """
+    Обработчик перезапускается (завершается, и Supervisor запускает новый),
+    чтобы не копить утечки памяти и фрагментацию.
+
+    :param tasks_count: сколько задач взял обработчик
+    :return: взял ли обработчик config.WORKER_MAX_TASKS задач или занял
+        больше config.WORKER_MAX_RSS байт памяти
+    """
+    if config.WORKER_MAX_TASKS and tasks_count >= config.WORKER_MAX_TASKS:
+        return True
+    if not config.WORKER_MAX_RSS:
+        return False
+    # peak resident set size, kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 > config.WORKER_MAX_RSS
+
+
+def close_hop_cache(hop_cache):
+    """Сохраняет кэш хопов перед выходом обработчика"""
+    if hop_cache is None:
+        return
+    try:
+        hop_cache.save()
+    except (IOError, OSError) as e:
+        logger.exception(e)
+
+
+class WorkerContext(object):
+    """
+    Окружение обработчика, общее для всех бэкендов (см. WORKER_BACKENDS):
+    соединения с очередями, отправка результатов, метрики, профилировщик
+    и помощники проверки цепочек. close отправляет оставшиеся результаты
+    и освобождает все это при завершении обработчика.
+
+    :param config: настройки
+    :param parent_pid: pid основного процесса
+    :param curl_pool_size: сколько curl хэндлов держит обработчик
+    """
+
+    def __init__(self, config, parent_pid, curl_pool_size):
+        self.config = config
+        self.parent = ParentWatcher(parent_pid)
+        self.input_tube, self.output_tube = get_tubes(config)
+        self.metrics = get_metrics(config)
+        self.publisher = get_worker_publisher(config, self.input_tube, self.output_tube, self.metrics)
+        self.profiler = get_profiler(config)
+        if self.profiler is not None:
+            self.profiler.install()
+
+        self.curl_pool = CurlPool(curl_pool_size, config.CURL_POOL_MAX_IDLE)
+        self.counter_scanner = get_worker_counter_scanner(config)
+        self.policy = get_worker_fetch_policy(config)
+        self.hop_cache = get_worker_hop_cache(config)
+        self.result_cache = get_worker_result_cache(config)
+        self.rate_limiter = get_worker_rate_limiter(config)
+        self.stats = get_worker_stats(config)
+        self.breaker = get_breaker(config)
+        self.settings = CheckSettings(
+            config.HTTP_TIMEOUT,
+            max_redirects=config.MAX_REDIRECTS,
+            user_agent=config.USER_AGENT,
+            curl_pool=self.curl_pool,
+            counter_scanner=self.counter_scanner,
+            policy=self.policy,
+            hop_cache=self.hop_cache,
+            rate_limiter=self.rate_limiter,
+            budget=config.CHAIN_TIMEOUT,
+            connect_timeout=config.CONNECT_TIMEOUT,
+            retries=config.HOP_RETRIES,
+            retry_delay=config.HOP_RETRY_DELAY,
+            verify_first_hop=config.RECHECK_VERIFY_FIRST_HOP
+        )
+        # tasks taken by the worker
+        self.tasks_count = 0
+
+    @property
+    def extended(self):
+        """:return: нужны ли времена запросов цепочек (см. report_chain)"""
+        return self.stats is not None or self.breaker is not None or self.metrics is not None
+
+    def running(self):
+        """:return: жив ли основной процесс и не пора ли обработчику перезапуститься"""
+        return self.parent.alive() and not should_recycle(self.config, self.tasks_count)
+
+    def take_tasks(self, count, timeout):
+        """Берет до count задач, см. take_tasks"""
+        tasks = take_tasks(self.input_tube, count, timeout, self.breaker, self.metrics)
+        if tasks is not None:
+            self.tasks_count += len(tasks)
+        return tasks
+
+    def report_chain(self, history):
+        """См. report_chain"""
+        return report_chain(history, self.stats, self.breaker, self.metrics)
+
+    def maybe_save(self):
+        """Сохраняет кэш хопов и пишет статистику запросов в лог, если пора"""
+        if self.hop_cache is not None:
+            self.hop_cache.maybe_save()
+        if self.stats is not None:
+            self.stats.maybe_log()
+
+    def close(self):
+        """Отправляет оставшиеся результаты и освобождает ресурсы обработчика"""
+        logger.info('Worker is stopping after {} tasks'.format(self.tasks_count))
+        self.publisher.flush()
+        self.curl_pool.close()
+        close_hop_cache(self.hop_cache)
+        if self.result_cache:
+            self.result_cache.close()
+        if self.breaker is not None:
+            self.breaker.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.profiler is not None:
+            self.profiler.stop()
+
+
+def worker(config, parent_pid):
+    context = WorkerContext(config, parent_pid, config.CURL_POOL_SIZE)
+    publisher = context.publisher
 
     # run while parent is alive
-    while os.path.exists(parent_proc):
-        task = input_tube.take(config.QUEUE_TAKE_TIMEOUT)
-        if task:
+    while context.running():
+        # one task at a time: taken tasks wait for the chains before them and could outlive the queue ttr
+        tasks = context.take_tasks(1, get_take_timeout(config, len(publisher)))
+        if tasks is None:
+            # the network is down, wait for the circuit breaker to let tasks in
+            publisher.flush()
+            sleep(context.breaker.wait_time())
+            continue
+        for task in tasks:
+            if not context.parent.alive():
+                # stopping: the tasks left are not acked and return to the queue, results are sent below
+                break
             logger.info(u'Starting task id={}.'.format(task.task_id))
             result = get_redirect_history_from_task(
-                task,
-                config.HTTP_TIMEOUT,
-                config.MAX_REDIRECTS,
-                config.USER_AGENT
+                task, context.settings, context.result_cache, context.stats, context.breaker, context.metrics
             )
-            if result:
-                is_input, data = result
-                if is_input:
-                    input_tube.put(
-                        data,
-                        delay=config.RECHECK_DELAY,
-                        pri=task.meta()['pri']
-                    )
-                else:
-                    output_tube.put(data)
-                logger.debug(u'Task id={} data:{}'.format(task.task_id, data))
-            try:
-                task.ack()
-                logger.info(u'Task id={} done'.format(task.task_id))
-            except DatabaseError as e:
-                logger.info('Task ack fail')
-                logger.exception(e)
+            publisher.add(task, result)
+            publisher.maybe_flush()
+        if not tasks:
+            # the queue is empty, don't keep results until the next task
+            publisher.flush()
+        context.maybe_save()
     else:
-        logger.info('Parent is dead. exiting')
+        context.close()
+
+
+def multi_worker(config, parent_pid):
+    """
+    Обработчик задач, проверяющий до config.MULTI_MAX_CHAINS урлов одновременно.
+    """
+    context = WorkerContext(config, parent_pid, config.MULTI_MAX_CHAINS)
+    publisher, result_cache = context.publisher, context.result_cache
+    engine = RedirectEngine(
+        context.settings,
+        max_chains=config.MULTI_MAX_CHAINS,
+        max_per_host=config.MAX_REQUESTS_PER_HOST,
+        extended=context.extended
+    )
+
+    def on_history(task, url, history):
+        history = context.report_chain(history)
+        if result_cache:
+            result_cache.put(url, history)
+        publisher.add(task, make_task_result(task, *history))
+
+    # run while parent is alive
+    while context.running():
+        free = config.MULTI_MAX_CHAINS - len(engine)
+        if free > 0:
+            # don't wait for tasks while some chains are in progress
+            tasks = context.take_tasks(
+                min(free, config.QUEUE_TAKE_BATCH),
+                0 if len(engine) else get_take_timeout(config, len(publisher))
+            )
+            if tasks is None:
+                # the network is down, wait for the circuit breaker to let tasks in
+                tasks = []
+                if not len(engine):
+                    sleep(context.breaker.wait_time())
+            for task in tasks:
+                logger.info(u'Starting task id={}.'.format(task.task_id))
+                url = get_task_url(task)
+                history = result_cache.get(url) if result_cache else None
+                if history is not None:
+                    logger.info(u'Task id={} result is taken from cache'.format(task.task_id))
+                    publisher.add(task, make_task_result(task, *history))
+                    continue
+                engine.add(
+                    url,
+                    lambda history, task=task, url=url: on_history(task, url, history),
+                    get_task_resume(task)
+                )
+
+        engine.perform(config.QUEUE_TAKE_TIMEOUT)
+        if len(engine):
+            publisher.maybe_flush()
+        else:
+            # no chains in progress, don't keep results until the next task
+            publisher.flush()
+        context.maybe_save()
+    else:
+        # chains in progress are finished and their tasks acked
+        engine.run()
+        engine.close()
+        context.close()
+
+
+def gevent_worker(config, parent_pid):
+    """
+    Обработчик задач, проверяющий урлы в config.GEVENT_POOL_SIZE greenlet'ах.
+
+    Каждая задача проверяется в своем greenlet, greenlet'ы используют общие
+    соединения с очередями и общий RedirectEngine, который ждет сокеты curl
+    через gevent и не блокирует остальные greenlet'ы.
+    """
+    # tarantool connections are created after this and don't block the other greenlets
+    patch_socket()
+    context = WorkerContext(config, parent_pid, config.GEVENT_POOL_SIZE)
+    publisher, result_cache = context.publisher, context.result_cache
+    # one request at a time over a shared tarantool connection
+    tube_lock = Semaphore()
+
+    engine = RedirectEngine(
+        context.settings,
+        max_chains=config.GEVENT_POOL_SIZE,
+        max_per_host=config.MAX_REQUESTS_PER_HOST,
+        extended=context.extended,
+        select=select
+    )
+    # set when a chain is added to the idle engine
+    wakeup = Event()
+
+    def run_engine():
+        while True:
+            if not engine.perform(config.QUEUE_TAKE_TIMEOUT):
+                wakeup.clear()
+                wakeup.wait()
+
+    def check_task(task):
+        url = get_task_url(task)
+        history = result_cache.get(url) if result_cache else None
+        if history is None:
+            result = AsyncResult()
+            engine.add(url, result.set, get_task_resume(task))
+            wakeup.set()
+            history = context.report_chain(result.get())
+            if result_cache:
+                result_cache.put(url, history)
+        else:
+            logger.info(u'Task id={} result is taken from cache'.format(task.task_id))
+
+        with tube_lock:
+            publisher.add(task, make_task_result(task, *history))
+
+    engine_greenlet = spawn(run_engine)
+    pool = Pool(config.GEVENT_POOL_SIZE)
+    # run while parent is alive
+    while context.running():
+        pool.wait_available()
+        with tube_lock:
+            tasks = context.take_tasks(
+                min(pool.free_count(), config.QUEUE_TAKE_BATCH),
+                get_take_timeout(config, len(pool) or len(publisher))
+            )
+            if len(pool):
+                publisher.maybe_flush()
+            else:
+                # no chains in progress, don't keep results until the next task
+                publisher.flush()
+        if tasks is None:
+            # the network is down, wait for the circuit breaker to let tasks in,
+            # results of chains in progress are sent meanwhile
+            gevent.sleep(config.QUEUE_TAKE_TIMEOUT if len(pool) else context.breaker.wait_time())
+            continue
+        for task in tasks:
+            logger.info(u'Starting task id={}.'.format(task.task_id))
+            pool.spawn(check_task, task)
+        context.maybe_save()
+    else:
+        # chains in progress are finished and their tasks acked
+        pool.join()
+        engine_greenlet.kill()
+        engine.close()
+        context.close()
+
+
+WORKER_BACKENDS = {
+    'process': worker,
+    'multi': multi_worker,
+    'gevent': gevent_worker,
+}
+"""Обработчики задач по значению config.WORKER_BACKEND"""
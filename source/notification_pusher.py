@@ -18,8 +18,7 @@ from gevent.monkey import patch_all
 from gevent.pool import Pool
 import requests
 import tarantool
-import tarantool_queue
-from lib.utils import create_pidfile, parse_cmd_args, load_config_from_pyfile, daemonize
+from lib.utils import create_pidfile, get_tube, parse_cmd_args, load_config_from_pyfile, daemonize
 
 SIGNAL_EXIT_CODE_OFFSET = 128
 """Коды выхода рассчитываются как 128 + номер сигнала"""
@@ -68,14 +67,18 @@ def notification_worker(task, task_queue, *args, **kwargs):
         task_queue.put((task, 'bury'))
 
 
-def done_with_processed_tasks(task_queue):
+def done_with_processed_tasks(tube, task_queue):
     """
-    Удаляет завешенные задачи.
+    Удаляет завешенные задачи: задачи с одинаковым действием
+    обрабатываются одним запросом к очереди.
 
+    :param tube: очередь задач
+    :type tube: lib.tube.BatchTube
     :param task_queue: очередь, хранящая кортежи (объект задачи, имя действия)
     """
     logger.debug('Send info about finished tasks to queue.')
 
+    tasks_by_action = {}
     for _ in xrange(task_queue.qsize()):
         try:
             task, action_name = task_queue.get_nowait()
@@ -85,13 +88,16 @@ def done_with_processed_tasks(task_queue):
                 task_id=task.task_id
             ))
 
-            try:
-                getattr(task, action_name)()
-            except tarantool.DatabaseError as exc:
-                logger.exception(exc)
+            tasks_by_action.setdefault(action_name, []).append(task)
         except gevent_queue.Empty:
             break
 
+    for action_name, tasks in tasks_by_action.iteritems():
+        try:
+            getattr(tube, '{}_batch'.format(action_name))(tasks)
+        except tarantool.DatabaseError as exc:
+            logger.exception(exc)
+
 
 def stop_handler(signum):
     """
@@ -122,24 +128,22 @@ def main_loop(config):
      * Открываем соединение с tarantool.queue, использую config.QUEUE_* настройки.
      * Создаем пул обработчиков.
      * Создаем очередь куда обработчики будут помещать выполненные задачи.
-     * Пока количество обработчиков <= config.WORKER_POOL_SIZE, берем задачу из tarantool.queue
-       и запускаем greenlet для ее обработки.
+     * Берем из tarantool.queue одним запросом столько задач, сколько в пуле свободных
+       обработчиков, и для каждой запускаем greenlet.
      * Посылаем уведомления о том, что задачи завершены в tarantool.queue.
      * Спим config.SLEEP секунд.
     """
     logger.info('Connect to queue server on {host}:{port} space #{space}.'.format(
         host=config.QUEUE_HOST, port=config.QUEUE_PORT, space=config.QUEUE_SPACE
     ))
-    queue = tarantool_queue.Queue(
-        host=config.QUEUE_HOST, port=config.QUEUE_PORT, space=config.QUEUE_SPACE
-    )
-
     logger.info('Use tube [{tube}], take timeout={take_timeout}.'.format(
         tube=config.QUEUE_TUBE,
         take_timeout=config.QUEUE_TAKE_TIMEOUT
     ))
 
-    tube = queue.tube(config.QUEUE_TUBE)
+    tube = get_tube(
+        host=config.QUEUE_HOST, port=config.QUEUE_PORT, space=config.QUEUE_SPACE, name=config.QUEUE_TUBE
+    )
 
     logger.info('Create worker pool[{size}].'.format(size=config.WORKER_POOL_SIZE))
     worker_pool = Pool(config.WORKER_POOL_SIZE)
@@ -155,27 +159,24 @@ def main_loop(config):
 
         logger.debug('Pool has {count} free workers.'.format(count=free_workers_count))
 
-        for number in xrange(free_workers_count):
-            logger.debug('Get task from tube for worker#{number}.'.format(number=number))
-
-            task = tube.take(config.QUEUE_TAKE_TIMEOUT)
+        logger.debug('Get up to {count} tasks from tube.'.format(count=free_workers_count))
 
-            if task:
-                logger.info('Start worker#{number} for task id={task_id}.'.format(
-                    task_id=task.task_id, number=number
-                ))
+        for number, task in enumerate(tube.take_batch(free_workers_count, config.QUEUE_TAKE_TIMEOUT)):
+            logger.info('Start worker#{number} for task id={task_id}.'.format(
+                task_id=task.task_id, number=number
+            ))
 
-                worker = Greenlet(
-                    notification_worker,
-                    task,
-                    processed_task_queue,
-                    timeout=config.HTTP_CONNECTION_TIMEOUT,
-                    verify=False
-                )
-                worker_pool.add(worker)
-                worker.start()
+            worker = Greenlet(
+                notification_worker,
+                task,
+                processed_task_queue,
+                timeout=config.HTTP_CONNECTION_TIMEOUT,
+                verify=False
+            )
+            worker_pool.add(worker)
+            worker.start()
 
-        done_with_processed_tasks(processed_task_queue)
+        done_with_processed_tasks(tube, processed_task_queue)
 
         sleep(config.SLEEP)
     else:
@@ -2,43 +2,75 @@
 # coding: utf-8
 import logging
 import os
+import signal
 import sys
 from logging.config import dictConfig
-from multiprocessing import active_children
-from time import sleep
+from time import sleep, time
 
-from lib.utils import (check_network_status, create_pidfile, daemonize,
-                       load_config_from_pyfile, parse_cmd_args, spawn_workers)
-from lib.worker import worker
+from lib.autoscale import get_autoscaler
+from lib.breaker import get_breaker
+from lib.metrics import serve_metrics, stop_metrics_server
+from lib.profiler import PROFILE_SIGNAL
+from lib.supervisor import Supervisor
+from lib.utils import (create_pidfile, daemonize, load_config_from_pyfile,
+                       parse_cmd_args)
+from lib.worker import WORKER_BACKENDS
 
 logger = logging.getLogger('redirect_checker')
 
 
 def main_loop(config):
+    if config.WORKER_BACKEND not in WORKER_BACKENDS:
+        raise ValueError(u'Unknown WORKER_BACKEND {!r}, expected one of: {}'.format(
+            config.WORKER_BACKEND, ', '.join(sorted(WORKER_BACKENDS))
+        ))
     logger.info(
         u'Run main loop. Worker pool size={}. Sleep time is {}.'.format(
             config.WORKER_POOL_SIZE, config.SLEEP
         ))
-    parent_pid = os.getpid()
-    while True:
-        if check_network_status(config.CHECK_URL, config.HTTP_TIMEOUT):
-            required_workers_count = config.WORKER_POOL_SIZE - len(
-                active_children())
-            if required_workers_count > 0:
-                logger.info(
-                    'Spawning {} workers'.format(required_workers_count))
-                spawn_workers(
-                    num=required_workers_count,
-                    target=worker,
-                    args=(config,),
-                    parent_pid=parent_pid
-                )
-        else:
-            logger.critical('Network is down. stopping workers')
-            for c in active_children():
-                c.terminate()
-
-        sleep(config.SLEEP)
+    supervisor = Supervisor(
+        WORKER_BACKENDS[config.WORKER_BACKEND],
+        (config,),
+        config.WORKER_POOL_SIZE,
+        config.WORKER_DRAIN_TIMEOUT
+    )
+    autoscaler = get_autoscaler(config)
+    # metric files of the workers are summed up on each request by a separate process,
+    # so that no threads are running when workers are forked
+    metrics_pid = serve_metrics(config)
+    # workers stop taking tasks by themselves while the network is down
+    breaker = get_breaker(config)
+    # a finished worker interrupts the sleep below and is replaced at once
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.siginterrupt(signal.SIGCHLD, False)
+    # kill <pid> stops the checker after the workers finish their tasks
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.siginterrupt(signal.SIGTERM, False)
+    if config.PROFILE_DIR:
+        # kill -USR2 <pid> starts profiling of all workers (see lib.profiler.Profiler)
+        signal.signal(PROFILE_SIGNAL, lambda signum, frame: supervisor.signal_workers(signum))
+        signal.siginterrupt(PROFILE_SIGNAL, False)
+
+    scaled_at = None
+    while not stopping:
+        if scaled_at is None or time() - scaled_at >= config.SLEEP:
+            scaled_at = time()
+            # the queue is not drained while the circuit is open, its backlog is meaningless
+            if autoscaler is not None and (breaker is None or breaker.is_closed()):
+                supervisor.size = autoscaler.update(supervisor.size)
+
+        supervisor.fill()
+
+        sleep(max(0, scaled_at + config.SLEEP - time()))
+
+    logger.info(u'Stopping workers')
+    while supervisor.drain():
+        # workers are killed after WORKER_DRAIN_TIMEOUT, a finished worker interrupts the sleep
+        sleep(1)
+    logger.info(u'All workers are stopped')
+    if metrics_pid is not None:
+        stop_metrics_server(metrics_pid)
 
 
 def main(argv):
@@ -0,0 +1,121 @@
+from tempfile import NamedTemporaryFile
+from unittest import TestCase
+from mock import Mock, patch
+import tarantool
+import lib.autoscale
+from lib.autoscale import Autoscaler, get_autoscaler, get_available_memory
+
+
+def statistics(ready, take):
+    return {'take': str(take), 'tasks': {'ready': str(ready), 'taken': '0'}}
+
+
+class LibAutoscaleTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.autoscale.logger
+        lib.autoscale.logger = Mock()
+        self.tube = Mock()
+
+    def tearDown(self):
+        lib.autoscale.logger = self.original_logger
+
+    def make_autoscaler(self, *stats, **kwargs):
+        self.tube.statistics = Mock(side_effect=stats)
+        kwargs.setdefault('step', 2)
+        return Autoscaler(self.tube, 2, 10, up_backlog=30, down_backlog=5, cooldown=60, **kwargs)
+
+    def update(self, autoscaler, size, times, load=0.1, memory=None):
+        with patch('lib.autoscale.time', Mock(side_effect=times)):
+            with patch('lib.autoscale.get_cpu_load', Mock(return_value=load)):
+                with patch('lib.autoscale.get_available_memory', Mock(return_value=memory)):
+                    return autoscaler.update(size)
+
+    def test_update_first_sample(self):
+        autoscaler = self.make_autoscaler(statistics(1000, 0))
+
+        assert self.update(autoscaler, 4, [100]) == 4
+
+    def test_update_grow(self):
+        # 10 tasks per second, 1000 ready tasks wait 100s
+        autoscaler = self.make_autoscaler(statistics(1000, 0), statistics(1000, 100))
+
+        assert self.update(autoscaler, 4, [100]) == 4
+        assert self.update(autoscaler, 4, [110, 110]) == 6
+
+    def test_update_shrink(self):
+        autoscaler = self.make_autoscaler(statistics(0, 0), statistics(0, 100))
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110, 110]) == 2
+
+    def test_update_hysteresis(self):
+        # 20s backlog is between the thresholds
+        autoscaler = self.make_autoscaler(statistics(200, 0), statistics(200, 100))
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110]) == 4
+
+    def test_update_nothing_taken(self):
+        autoscaler = self.make_autoscaler(statistics(10, 100), statistics(10, 100))
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110, 110]) == 6
+
+    def test_update_bounds(self):
+        autoscaler = self.make_autoscaler(statistics(1000, 0), statistics(1000, 100))
+
+        self.update(autoscaler, 10, [100])
+        assert self.update(autoscaler, 10, [110]) == 10
+
+    def test_update_cooldown(self):
+        autoscaler = self.make_autoscaler(
+            statistics(1000, 0), statistics(1000, 100), statistics(1000, 200), statistics(1000, 300)
+        )
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110, 110]) == 6
+        assert self.update(autoscaler, 6, [120, 120]) == 6
+        assert self.update(autoscaler, 6, [170, 170, 170]) == 8
+
+    def test_update_overloaded(self):
+        autoscaler = self.make_autoscaler(statistics(1000, 0), statistics(1000, 100), max_load=0.9)
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110, 110], load=1.5) == 2
+
+    def test_update_low_memory(self):
+        autoscaler = self.make_autoscaler(statistics(1000, 0), statistics(1000, 100), min_free_memory=1024)
+
+        self.update(autoscaler, 4, [100])
+        assert self.update(autoscaler, 4, [110, 110], memory=512) == 2
+
+    def test_update_queue_error(self):
+        autoscaler = self.make_autoscaler(tarantool.DatabaseError)
+
+        assert self.update(autoscaler, 4, [100]) == 4
+
+    def test_get_available_memory(self):
+        with NamedTemporaryFile() as meminfo:
+            meminfo.write('MemTotal:        2048 kB\nMemAvailable:    1024 kB\n')
+            meminfo.flush()
+            assert get_available_memory(meminfo.name) == 1024 * 1024
+
+    def test_get_available_memory_no_procfs(self):
+        assert get_available_memory('/nonexistent/meminfo') is None
+
+    def test_get_autoscaler_disabled(self):
+        config = Mock()
+        config.WORKER_POOL_MAX_SIZE = None
+
+        assert get_autoscaler(config) is None
+
+    def test_get_autoscaler(self):
+        config = Mock()
+        config.WORKER_POOL_SIZE = 2
+        config.WORKER_POOL_MAX_SIZE = 10
+
+        with patch('lib.autoscale.get_tube', Mock(return_value=self.tube)):
+            autoscaler = get_autoscaler(config)
+
+        assert autoscaler.tube is self.tube
+        assert (autoscaler.min_size, autoscaler.max_size) == (2, 10)
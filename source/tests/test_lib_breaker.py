@@ -0,0 +1,198 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+import lib.breaker
+from lib import DEADLINE_EXCEEDED
+from lib.breaker import CircuitBreaker, get_breaker, is_network_failure
+
+OK = [{'error': 0}]
+TIMEOUT = [{'error': 28}]
+REFUSED = [{'error': 7}]
+
+
+class LibBreakerTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.breaker.logger
+        lib.breaker.logger = Mock()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'breaker')
+
+    def tearDown(self):
+        lib.breaker.logger = self.original_logger
+        shutil.rmtree(self.directory)
+
+    def at(self, now):
+        return patch('lib.breaker.time', Mock(return_value=now))
+
+    def open_breaker(self, breaker, now=1000):
+        with self.at(now):
+            for _ in range(breaker.min_chains):
+                breaker.add_chain(TIMEOUT)
+            assert breaker.acquire(10) == 0
+
+    def test_is_network_failure(self):
+        assert is_network_failure(TIMEOUT)
+        assert is_network_failure([{'error': 6}])
+        assert is_network_failure(OK + TIMEOUT)
+        assert not is_network_failure(REFUSED)
+        assert not is_network_failure(TIMEOUT + OK)
+        assert not is_network_failure([])
+
+    def test_is_network_failure_slow_site(self):
+        # the connection is established, the response is slow
+        assert not is_network_failure([{'error': 28, 'connect': 0.05}])
+        assert not is_network_failure(TIMEOUT, ['http_status', DEADLINE_EXCEEDED])
+        assert is_network_failure(TIMEOUT, ['http_status', 'ERROR'])
+
+    def test_closed(self):
+        breaker = CircuitBreaker(min_chains=4, threshold=0.5)
+
+        with self.at(1000):
+            for timings in (OK, TIMEOUT, REFUSED, OK, TIMEOUT):
+                breaker.add_chain(timings)
+
+            assert breaker.acquire(10) == 10
+            assert breaker.is_closed()
+
+    def test_open(self):
+        breaker = CircuitBreaker(min_chains=4, threshold=0.5)
+
+        with self.at(1000):
+            for timings in (OK, TIMEOUT, OK, TIMEOUT):
+                breaker.add_chain(timings)
+
+            assert breaker.acquire(10) == 0
+            assert not breaker.is_closed()
+
+    def test_open_needs_min_chains(self):
+        breaker = CircuitBreaker(min_chains=4, threshold=0.5)
+
+        with self.at(1000):
+            for _ in range(3):
+                breaker.add_chain(TIMEOUT)
+
+            assert breaker.acquire(10) == 10
+
+    def test_window(self):
+        breaker = CircuitBreaker(window=30, min_chains=4, threshold=0.5)
+
+        with self.at(1000):
+            for _ in range(3):
+                breaker.add_chain(TIMEOUT)
+        with self.at(1030):
+            breaker.add_chain(TIMEOUT)
+
+            assert breaker.acquire(10) == 10
+
+    def test_half_open_probes(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2, steps=2)
+        self.open_breaker(breaker)
+
+        with self.at(1029):
+            assert breaker.acquire(10) == 0
+        with self.at(1030):
+            assert breaker.acquire(1) == 1
+            assert breaker.acquire(10) == 1
+            assert breaker.acquire(10) == 0
+            assert not breaker.is_closed()
+
+    def test_half_open_steps_close(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2, steps=2, threshold=0.5)
+        self.open_breaker(breaker)
+
+        with self.at(1030):
+            assert breaker.acquire(10) == 2
+            breaker.add_chain(OK)
+            breaker.add_chain(OK)
+            # twice as many tasks on the next step
+            assert breaker.acquire(10) == 4
+            for timings in (OK, TIMEOUT, OK, OK):
+                breaker.add_chain(timings)
+
+            assert breaker.is_closed()
+            assert breaker.acquire(10) == 10
+
+    def test_half_open_reopens(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2, steps=2, threshold=0.5)
+        self.open_breaker(breaker)
+
+        with self.at(1030):
+            assert breaker.acquire(10) == 2
+            breaker.add_chain(TIMEOUT)
+
+            assert breaker.acquire(10) == 0
+        with self.at(1059):
+            assert breaker.acquire(10) == 0
+
+    def test_half_open_release(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2)
+        self.open_breaker(breaker)
+
+        with self.at(1030):
+            assert breaker.acquire(10) == 2
+            breaker.release(2)
+
+            assert breaker.acquire(10) == 2
+
+    def test_half_open_lost_probes(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2)
+        self.open_breaker(breaker)
+
+        with self.at(1030):
+            assert breaker.acquire(10) == 2
+            breaker.add_chain(OK)
+        with self.at(1060):
+            assert breaker.acquire(10) == 1
+
+    def test_wait_time(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2)
+        with self.at(1000):
+            assert breaker.wait_time() == 0
+        self.open_breaker(breaker)
+
+        with self.at(1010):
+            assert breaker.wait_time() == 20
+        with self.at(1030):
+            assert breaker.wait_time() == 0
+            assert breaker.acquire(10) == 2
+            # probes are taken, the next step may begin any moment
+            assert breaker.wait_time() == lib.breaker.HALF_OPEN_POLL
+
+    def test_open_ignores_chains(self):
+        breaker = CircuitBreaker(min_chains=4, open_timeout=30, probes=2)
+        self.open_breaker(breaker)
+
+        with self.at(1010):
+            for _ in range(10):
+                breaker.add_chain(OK)
+
+            assert breaker.acquire(10) == 0
+
+    def test_shared_between_breakers(self):
+        first = CircuitBreaker(self.path, min_chains=4)
+        second = CircuitBreaker(self.path, min_chains=4)
+
+        self.open_breaker(first)
+        with self.at(1000):
+            assert second.acquire(10) == 0
+
+        first.close()
+        second.close()
+
+    def test_get_breaker_disabled(self):
+        config = Mock()
+        config.BREAKER_FILE = None
+
+        assert get_breaker(config) is None
+
+    def test_get_breaker(self):
+        config = Mock()
+        config.BREAKER_FILE = self.path
+        config.BREAKER_PROBES = 3
+
+        breaker = get_breaker(config)
+
+        assert breaker.state.path == self.path
+        assert breaker.probes == 3
@@ -0,0 +1,52 @@
+import re
+from unittest import TestCase
+from lib.counters import CounterScanner, required_literal, strip_pattern
+
+
+class LibCountersTestCase(TestCase):
+    def test_strip_pattern(self):
+        assert strip_pattern(r'.*mc\.yandex\.ru.*') == r'mc\.yandex\.ru'
+        assert strip_pattern(r'mc\.yandex\.ru') == r'mc\.yandex\.ru'
+        assert strip_pattern(r'yandex\.*') == r'yandex\.*'
+
+    def test_required_literal_of_literal_pattern(self):
+        assert required_literal(r'mc\.Yandex\.ru/watch') == ('mc.yandex.ru/watch', True)
+
+    def test_required_literal_of_regexp(self):
+        assert required_literal(r'top\d+\.mail\.ru/counter') == ('.mail.ru/counter', False)
+
+    def test_scan_literal_rules(self):
+        scanner = CounterScanner((
+            ('GOOGLE_ANALYTICS', r'google-analytics\.com/ga\.js'),
+            ('YA_METRICA', r'mc\.yandex\.ru/metrika/watch\.js'),
+        ))
+
+        counters = scanner.scan('<script src="//MC.Yandex.ru/metrika/watch.js"></script>')
+
+        assert counters == ['YA_METRICA']
+
+    def test_scan_regexp_rules(self):
+        scanner = CounterScanner((
+            ('TOP', r'top\d+\.mail\.ru/counter'),
+        ))
+
+        assert scanner.scan('top100.mail.ru/counter') == ['TOP']
+        assert scanner.scan('topx.mail.ru/counter') == []
+
+    def test_scan_keeps_rule_order_and_duplicates(self):
+        scanner = CounterScanner((
+            ('TOP_MAIL_RU', r'top-fwz1\.mail\.ru/counter'),
+            ('LI_RU', r'/counter\.yadro\.ru/hit'),
+            ('TOP_MAIL_RU', r'top\.mail\.ru/jump\?from'),
+        ))
+
+        counters = scanner.scan('top.mail.ru/jump?from=1 //counter.yadro.ru/hit top-fwz1.mail.ru/counter')
+
+        assert counters == ['TOP_MAIL_RU', 'LI_RU', 'TOP_MAIL_RU']
+
+    def test_scan_compiled_match_rules(self):
+        scanner = CounterScanner((
+            ('YA_METRICA', re.compile(r'.*mc\.yandex\.ru/metrika/watch\.js.*', re.I + re.S)),
+        ))
+
+        assert scanner.scan('a\nmc.yandex.ru/metrika/watch.js\nb') == ['YA_METRICA']
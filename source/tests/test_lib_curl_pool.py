@@ -0,0 +1,59 @@
+from unittest import TestCase
+from mock import Mock, patch
+import pycurl
+from lib.curl_pool import CurlPool
+
+
+class LibCurlPoolTestCase(TestCase):
+    def test_acquire_creates_shared_handle(self):
+        curl = Mock()
+
+        with patch('pycurl.Curl', Mock(return_value=curl)):
+            pool = CurlPool()
+
+            assert pool.acquire() is curl
+            curl.setopt.assert_called_once_with(pycurl.SHARE, pool.share)
+
+    def test_release_reuses_handle(self):
+        curl = Mock()
+        pool = CurlPool()
+
+        pool.release(curl)
+
+        curl.reset.assert_called_once_with()
+        assert len(pool) == 1
+        assert pool.acquire() is curl
+        assert len(pool) == 0
+
+    def test_release_closes_handle_when_pool_is_full(self):
+        curl1 = Mock()
+        curl2 = Mock()
+        pool = CurlPool(max_size=1)
+
+        pool.release(curl1)
+        pool.release(curl2)
+
+        curl2.close.assert_called_once_with()
+        assert len(pool) == 1
+
+    def test_idle_handles_expire(self):
+        curl = Mock()
+        pool = CurlPool(max_idle=60)
+
+        with patch('lib.curl_pool.time', Mock(return_value=100)):
+            pool.release(curl)
+
+        with patch('lib.curl_pool.time', Mock(return_value=161)):
+            pool.expire()
+
+        curl.close.assert_called_once_with()
+        assert len(pool) == 0
+
+    def test_close(self):
+        curl = Mock()
+        pool = CurlPool()
+        pool.release(curl)
+
+        pool.close()
+
+        curl.close.assert_called_once_with()
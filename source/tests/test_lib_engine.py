@@ -0,0 +1,610 @@
+from collections import deque
+from unittest import TestCase
+from mock import Mock, patch
+import pycurl
+import lib
+from lib import REDIRECT_HTTP, DEADLINE_EXCEEDED, CheckSettings, RedirectChain
+from lib.engine import RedirectEngine, get_redirect_histories
+from lib.hop_cache import HopCache
+from lib.policy import FetchPolicy
+
+
+class FakeMulti(object):
+    """CurlMulti that finishes every added handle within a single perform"""
+
+    def __init__(self, errors=()):
+        self.errors = set(errors)
+        self.handles = []
+        self.done = []
+        self.requested = []
+
+    def add_handle(self, curl):
+        self.handles.append(curl)
+        self.requested.append(curl.url)
+
+    def remove_handle(self, curl):
+        self.handles.remove(curl)
+
+    def perform(self):
+        self.done = list(self.handles)
+        return 0, len(self.handles)
+
+    def info_read(self):
+        done, self.done = self.done, []
+        ok_list = [c for c in done if c.url not in self.errors]
+        error_list = [(c, 7, 'error') for c in done if c.url in self.errors]
+        return 0, ok_list, error_list
+
+    def select(self, timeout):
+        return 0
+
+    def timeout(self):
+        return -1
+
+    def close(self):
+        pass
+
+
+class FlakyMulti(FakeMulti):
+    """FakeMulti where the first request of every url fails with a connection reset"""
+
+    def info_read(self):
+        done, self.done = self.done, []
+        ok_list = [c for c in done if self.requested.count(c.url) > 1]
+        error_list = [(c, pycurl.E_RECV_ERROR, 'reset') for c in done if self.requested.count(c.url) == 1]
+        return 0, ok_list, error_list
+
+
+class FakeCurl(Mock):
+    def __init__(self, *args, **kwargs):
+        super(FakeCurl, self).__init__(*args, **kwargs)
+        self.url = None
+
+
+class FakeStream(object):
+    def __init__(self, url, stopped=False, head=False, needs_body=False, status=200):
+        self.url = url
+        self.stopped = stopped
+        self.head = head
+        self.needs_body = needs_body
+        self.status = status
+
+
+def fake_setup_curl(curl, url, timeout, useragent=None, policy=None, head=False, connect_timeout=None):
+    curl.url = url
+    return FakeStream(url)
+
+
+class LibEngineTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.logger
+        lib.logger = Mock()
+
+    def tearDown(self):
+        lib.logger = self.original_logger
+
+    def run_engine(self, urls, responses, errors=(), max_chains=100):
+        results = {}
+        multi = FakeMulti(errors)
+
+        def read_response(curl, stream):
+            return responses[stream.url]
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=read_response)):
+                        engine = RedirectEngine(CheckSettings(11, max_redirects=5), max_chains=max_chains)
+                        for url in urls:
+                            engine.add(url, lambda result, url=url: results.__setitem__(url, result))
+                        engine.run()
+        return engine, results
+
+    def test_chains_are_resolved(self):
+        responses = {
+            'http://a.ru/': ('', 'http://b.ru/'),
+            'http://b.ru/': ('final', None),
+            'http://c.ru/': ('other', None),
+        }
+
+        engine, results = self.run_engine(['http://a.ru/', 'http://c.ru/'], responses)
+
+        assert results['http://a.ru/'] == ([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'], [])
+        assert results['http://c.ru/'] == ([], ['http://c.ru/'], [])
+        assert len(engine) == 0
+
+    def test_error_hop(self):
+        responses = {
+            'http://a.ru/': ('', 'http://b.ru/'),
+        }
+
+        engine, results = self.run_engine(['http://a.ru/'], responses, errors=['http://b.ru/'])
+
+        assert results['http://a.ru/'] == ([REDIRECT_HTTP, 'ERROR'], ['http://a.ru/', 'http://b.ru/', 'http://b.ru/'], [])
+
+    def test_resume(self):
+        responses = {
+            'http://b.ru/': ('', 'http://c.ru/'),
+            'http://c.ru/': ('final', None),
+        }
+        resume = ([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'])
+        multi = FakeMulti()
+
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11))
+                        engine.add('http://a.ru/', results.append, resume)
+                        engine.run()
+
+        assert multi.requested == ['http://b.ru/', 'http://c.ru/']
+        assert results == [([REDIRECT_HTTP] * 2, ['http://a.ru/', 'http://b.ru/', 'http://c.ru/'], [])]
+
+    def test_stopped_transfer_is_not_error(self):
+        responses = {
+            'http://a.ru/': ('', 'http://b.ru/'),
+            'http://b.ru/': ('', None),
+        }
+        multi = FakeMulti(errors=['http://a.ru/'])
+
+        def setup_curl(curl, url, timeout, useragent=None, policy=None, head=False, connect_timeout=None):
+            curl.url = url
+            return FakeStream(url, stopped=True)
+
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11))
+                        engine.add('http://a.ru/', results.append)
+                        engine.run()
+
+        assert results == [([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'], [])]
+
+    def test_head_first_gets_html_page(self):
+        responses = {
+            'http://a.ru/': ('page', None),
+        }
+        multi = FakeMulti()
+        requests = []
+
+        def setup_curl(curl, url, timeout, useragent=None, policy=None, head=False, connect_timeout=None):
+            curl.url = url
+            requests.append((url, head))
+            return FakeStream(url, head=head, needs_body=head)
+
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11, policy=FetchPolicy(head_first_domains=['a.ru'])))
+                        engine.add('http://a.ru/', results.append)
+                        engine.run()
+
+        assert requests == [('http://a.ru/', True), ('http://a.ru/', False)]
+        assert results == [([], ['http://a.ru/'], [])]
+
+    def test_cached_hops_are_not_requested(self):
+        responses = {
+            'http://b.ru/': ('final', None),
+        }
+        hop_cache = HopCache()
+        hop_cache.put('http://a.ru/', u'http://b.ru/', REDIRECT_HTTP, 10)
+        multi = FakeMulti()
+
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)) as setup_curl:
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11, hop_cache=hop_cache))
+                        engine.add('http://a.ru/', results.append)
+                        engine.run()
+
+        assert results == [([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'], [])]
+        assert setup_curl.call_count == 1
+
+    def test_same_url_is_requested_once(self):
+        responses = {
+            'http://a.ru/': ('', 'http://c.ru/'),
+            'http://b.ru/': ('', 'http://c.ru/'),
+            'http://c.ru/': ('final', None),
+        }
+
+        engine, results = self.run_engine(['http://a.ru/', 'http://b.ru/', 'http://a.ru/'], responses)
+
+        assert sorted(engine.multi.requested) == ['http://a.ru/', 'http://b.ru/', 'http://c.ru/']
+        assert results['http://a.ru/'] == ([REDIRECT_HTTP], ['http://a.ru/', 'http://c.ru/'], [])
+        assert results['http://b.ru/'] == ([REDIRECT_HTTP], ['http://b.ru/', 'http://c.ru/'], [])
+        assert len(engine) == 0
+
+    def test_pending_url_is_requested_once(self):
+        responses = {
+            'http://a.ru/': ('', None),
+            'http://b.ru/': ('', None),
+        }
+
+        engine, results = self.run_engine(['http://a.ru/', 'http://b.ru/', 'http://b.ru/'], responses, max_chains=1)
+
+        assert engine.multi.requested == ['http://a.ru/', 'http://b.ru/']
+        assert len(engine) == 0
+        assert not engine.inflight and not engine.leaders
+
+    def test_host_pending_url_is_requested_once(self):
+        results = []
+        multi = FakeMulti()
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(return_value=('', None))):
+                        engine = RedirectEngine(CheckSettings(11), max_per_host=1)
+                        for url in ['http://a.ru/1', 'http://a.ru/2', 'http://a.ru/2']:
+                            engine.add(url, results.append)
+                        # the second chain waits for the first one, not for the host
+                        assert len(engine.host_pending['a.ru']) == 1
+                        assert len(engine.inflight['http://a.ru/2']) == 1
+                        assert len(engine) == 3
+                        engine.run()
+
+        assert multi.requested == ['http://a.ru/1', 'http://a.ru/2']
+        assert results == [([], ['http://a.ru/1'], [])] + [([], ['http://a.ru/2'], [])] * 2
+
+    def test_retrying_url_is_requested_once(self):
+        results = []
+        multi = FlakyMulti()
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(return_value=('content', None))):
+                        engine = RedirectEngine(CheckSettings(11, retries=1, retry_delay=0.01))
+                        engine.add('http://a.ru/', results.append)
+                        engine.perform(0)
+                        assert len(engine.retrying) == 1
+                        engine.add('http://a.ru/', results.append)
+                        engine.run()
+
+        assert multi.requested == ['http://a.ru/', 'http://a.ru/']
+        assert results == [([], ['http://a.ru/'], [])] * 2
+
+    def test_max_per_host_limit(self):
+        responses = {
+            'http://a.ru/1': ('', None),
+            'http://a.ru/2': ('', None),
+            'http://b.ru/': ('', None),
+        }
+        multi = FakeMulti()
+        active_hosts = []
+
+        def add_handle(curl):
+            FakeMulti.add_handle(multi, curl)
+            active_hosts.append(sorted(c.url for c in multi.handles))
+
+        multi.add_handle = add_handle
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11), max_per_host=1)
+                        for url in ['http://a.ru/1', 'http://a.ru/2', 'http://b.ru/']:
+                            engine.add(url, results.append)
+                        assert len(engine) == 3
+                        engine.run()
+
+        assert active_hosts[:2] == [['http://a.ru/1'], ['http://a.ru/1', 'http://b.ru/']]
+        assert len(results) == 3
+        assert not engine.host_active and not engine.host_pending
+
+    def test_host_waiters_that_do_not_take_host(self):
+        responses = {
+            'http://a.ru/1': ('', None),
+            'http://a.ru/4': ('', None),
+            'http://b.ru/': ('', None),
+        }
+        clock = [1000]
+        hop_cache = HopCache()
+
+        results = {}
+        with patch('lib.time', Mock(side_effect=lambda: clock[0])):
+            with patch('lib.engine.time', Mock(return_value=1000)):
+                with patch('pycurl.CurlMulti', Mock(return_value=FakeMulti())):
+                    with patch('pycurl.Curl', FakeCurl):
+                        with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                            with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                                settings = CheckSettings(11, hop_cache=hop_cache, budget=5)
+                                engine = RedirectEngine(settings, max_per_host=1)
+                                for url, added_at in [('http://a.ru/1', 1000), ('http://a.ru/2', 1000),
+                                                      ('http://a.ru/3', 990), ('http://a.ru/4', 1000)]:
+                                    clock[0] = added_at
+                                    engine.add(url, lambda result, url=url: results.__setitem__(url, result))
+                                assert len(engine.host_pending['a.ru']) == 3
+
+                                # a.ru/2 is answered by the cache, the budget of a.ru/3 is spent
+                                hop_cache.put('http://a.ru/2', u'http://b.ru/', REDIRECT_HTTP, 10)
+                                for _ in xrange(10):
+                                    if not engine.perform(0):
+                                        break
+
+        assert len(engine) == 0
+        assert not engine.host_active and not engine.host_pending
+        assert results == {
+            'http://a.ru/1': ([], ['http://a.ru/1'], []),
+            'http://a.ru/2': ([REDIRECT_HTTP], ['http://a.ru/2', 'http://b.ru/'], []),
+            'http://a.ru/3': ([DEADLINE_EXCEEDED], ['http://a.ru/3', 'http://a.ru/3'], []),
+            'http://a.ru/4': ([], ['http://a.ru/4'], []),
+        }
+
+    def test_perform_starts_host_waiters_of_free_hosts(self):
+        callback = Mock()
+        with patch('pycurl.CurlMulti', Mock(return_value=FakeMulti())):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(return_value=('', None))):
+                        engine = RedirectEngine(CheckSettings(11), max_per_host=1)
+                        engine.host_pending['a.ru'] = deque([(RedirectChain('http://a.ru/'), callback, None)])
+                        assert engine.perform(0) == 0
+
+        callback.assert_called_once_with(([], ['http://a.ru/'], []))
+        assert not engine.host_pending
+
+    def test_rate_limit(self):
+        responses = {
+            'http://a.ru/': ('', None),
+            'http://b.ru/': ('', None),
+        }
+        rate_limiter = Mock()
+        rate_limiter.acquire = Mock(side_effect=(0, 0.5, 0))
+
+        results = []
+        with patch('lib.engine.time', Mock(return_value=1000)):
+            with patch('pycurl.CurlMulti', Mock(return_value=FakeMulti())):
+                with patch('pycurl.Curl', FakeCurl):
+                    with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                        with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                            engine = RedirectEngine(CheckSettings(11, rate_limiter=rate_limiter))
+                            engine.add('http://a.ru/', results.append)
+                            engine.add('http://b.ru/', results.append)
+                            assert len(engine.pending) == 1
+
+                            with patch('lib.engine.sleep', Mock()) as sleep:
+                                engine.perform()
+                                engine.perform()
+                                sleep.assert_called_once_with(0.5)
+
+        assert engine.throttled_until == 1000.5
+        assert len(results) == 1
+
+    def run_flaky_engine(self, urls, responses, **kwargs):
+        results = []
+        multi = FlakyMulti()
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        engine = RedirectEngine(CheckSettings(11, **kwargs))
+                        for url in urls:
+                            engine.add(url, results.append)
+                        engine.run()
+        return multi, results
+
+    def test_retry(self):
+        responses = {'http://a.ru/': ('content', None)}
+
+        multi, results = self.run_flaky_engine(['http://a.ru/', 'http://a.ru/'], responses, retries=1, retry_delay=0)
+
+        # the second chain waits for the retried request
+        assert multi.requested == ['http://a.ru/', 'http://a.ru/']
+        assert results == [([], ['http://a.ru/'], [])] * 2
+
+    def test_retry_waits_for_delay(self):
+        engine = RedirectEngine(CheckSettings(11, retries=1, retry_delay=0.5))
+        engine.retrying.append((1000.5, 0, Mock(), Mock(), False))
+
+        with patch('lib.engine.time', Mock(return_value=1000)):
+            with patch('lib.engine.sleep') as sleep:
+                assert engine.perform(1.0) == 1
+
+        sleep.assert_called_once_with(0.5)
+        assert not engine.pending
+        engine.close()
+
+    def test_no_retry(self):
+        responses = {'http://a.ru/': ('content', None)}
+
+        multi, results = self.run_flaky_engine(['http://a.ru/'], responses)
+
+        assert multi.requested == ['http://a.ru/']
+        assert results == [(['ERROR'], ['http://a.ru/', 'http://a.ru/'], [])]
+
+    def test_chain_deadline(self):
+        responses = {
+            'http://a.ru/': ('', 'http://b.ru/'),
+        }
+        times = iter([1000, 1001, 1006])
+
+        with patch('lib.time', Mock(side_effect=lambda: next(times))):
+            with patch('lib.engine.time', Mock(return_value=1000)):
+                with patch('pycurl.CurlMulti', Mock(return_value=FakeMulti())):
+                    with patch('pycurl.Curl', FakeCurl):
+                        with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)) as setup_curl:
+                            with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                                results = []
+                                engine = RedirectEngine(CheckSettings(3, budget=5))
+                                engine.add('http://a.ru/', results.append)
+                                engine.run()
+
+        assert setup_curl.call_count == 1
+        assert setup_curl.call_args[0][2] == 3
+        assert results == [([REDIRECT_HTTP, DEADLINE_EXCEEDED], ['http://a.ru/', 'http://b.ru/', 'http://b.ru/'], [])]
+
+    def run_deadline_with_waiter(self, retries=0):
+        """
+        The first chain of http://a.ru/ has a budget until 1005 and its first request fails
+        (at 1004 if retries, so the request is retried, otherwise at 1006), the second chain
+        waits for the same url and has a budget until 1009.
+        """
+        clock = [1000]
+        multi = FlakyMulti()
+        results = {}
+
+        with patch('lib.time', Mock(side_effect=lambda: clock[0])):
+            with patch('lib.engine.time', Mock(side_effect=lambda: clock[0])):
+                with patch('lib.engine.sleep', Mock()):
+                    with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+                        with patch('pycurl.Curl', FakeCurl):
+                            with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)) as setup_curl:
+                                with patch('lib.engine.read_response', Mock(return_value=('', None))):
+                                    settings = CheckSettings(11, budget=5, retries=retries, retry_delay=0.5)
+                                    engine = RedirectEngine(settings)
+                                    for name, added_at in [('leader', 1000), ('waiter', 1004)]:
+                                        clock[0] = added_at
+                                        engine.add('http://a.ru/', lambda result, name=name: results.__setitem__(
+                                            name, result
+                                        ))
+                                    if retries:
+                                        engine.perform(0)
+                                    clock[0] = 1006
+                                    engine.run()
+
+        return multi, setup_curl, results
+
+    def test_deadline_of_retried_chain_is_not_shared(self):
+        multi, setup_curl, results = self.run_deadline_with_waiter(retries=1)
+
+        assert multi.requested == ['http://a.ru/', 'http://a.ru/']
+        assert results == {
+            'leader': ([DEADLINE_EXCEEDED], ['http://a.ru/', 'http://a.ru/'], []),
+            'waiter': ([], ['http://a.ru/'], []),
+        }
+        # the url is requested again with the timeout of the waiting chain
+        assert setup_curl.call_args[0][2] == 3
+
+    def test_error_cut_by_budget_is_not_shared(self):
+        multi, setup_curl, results = self.run_deadline_with_waiter()
+
+        assert multi.requested == ['http://a.ru/', 'http://a.ru/']
+        assert results == {
+            'leader': ([DEADLINE_EXCEEDED], ['http://a.ru/', 'http://a.ru/'], []),
+            'waiter': ([], ['http://a.ru/'], []),
+        }
+
+    def test_extended_result(self):
+        responses = {
+            'http://a.ru/': ('', None),
+        }
+        timings = {'url': 'http://a.ru/', 'total': 0.1}
+
+        results = []
+        with patch('pycurl.CurlMulti', Mock(return_value=FakeMulti())):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=fake_setup_curl)):
+                    with patch('lib.engine.read_response', Mock(side_effect=lambda c, s: responses[s.url])):
+                        with patch('lib.engine.read_timings', Mock(return_value=timings)):
+                            engine = RedirectEngine(CheckSettings(11), extended=True)
+                            engine.add('http://a.ru/', results.append)
+                            engine.run()
+
+        assert results == [([], ['http://a.ru/'], [], [timings])]
+
+    def test_max_chains_limit(self):
+        responses = {
+            'http://a.ru/': ('', None),
+            'http://b.ru/': ('', None),
+            'http://c.ru/': ('', None),
+        }
+
+        engine, results = self.run_engine(['http://a.ru/', 'http://b.ru/', 'http://c.ru/'], responses, max_chains=1)
+
+        assert len(results) == 3
+        assert len(engine.curl_pool) == 1
+
+    def test_ignored_domain_finishes_without_request(self):
+        callback = Mock()
+        with patch('pycurl.CurlMulti', Mock()):
+            engine = RedirectEngine(CheckSettings(11))
+            engine.add('http://my.mail.ru/apps/1', callback)
+
+        callback.assert_called_once_with(([], ['http://my.mail.ru/apps/1'], []))
+        assert len(engine) == 0
+
+    def test_setup_error(self):
+        callback = Mock()
+        with patch('pycurl.CurlMulti', Mock()):
+            with patch('pycurl.Curl', FakeCurl):
+                with patch('lib.engine.setup_curl', Mock(side_effect=ValueError)):
+                    engine = RedirectEngine(CheckSettings(11))
+                    engine.add('http://a.ru/', callback)
+
+        callback.assert_called_once_with((['ERROR'], ['http://a.ru/', 'http://a.ru/'], []))
+
+    def test_get_redirect_histories_keeps_order(self):
+        engine = Mock()
+
+        def add(url, callback):
+            callback(url)
+
+        engine.add = Mock(side_effect=add)
+
+        with patch('lib.engine.RedirectEngine', Mock(return_value=engine)):
+            results = get_redirect_histories(['url1', 'url2'], 11)
+
+        assert results == ['url1', 'url2']
+        engine.close.assert_called_once_with()
+
+    def test_perform_waits_when_nothing_finished(self):
+        multi = Mock()
+        multi.perform = Mock(return_value=(0, 1))
+        multi.info_read = Mock(return_value=(0, [], []))
+        multi.timeout = Mock(return_value=-1)
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            engine = RedirectEngine(CheckSettings(11))
+            engine.active[Mock()] = (Mock(), Mock(), Mock())
+
+            assert engine.perform(0.5) == 1
+            multi.select.assert_called_once_with(0.5)
+
+    def test_perform_waits_no_longer_than_curl_timeout(self):
+        multi = Mock()
+        multi.perform = Mock(return_value=(0, 1))
+        multi.info_read = Mock(return_value=(0, [], []))
+        multi.timeout = Mock(return_value=100)
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            engine = RedirectEngine(CheckSettings(11))
+            engine.active[Mock()] = (Mock(), Mock(), Mock())
+            engine.perform(0.5)
+
+            multi.select.assert_called_once_with(0.1)
+
+    def test_perform_waits_with_select(self):
+        multi = Mock()
+        multi.perform = Mock(return_value=(0, 1))
+        multi.info_read = Mock(return_value=(0, [], []))
+        multi.timeout = Mock(return_value=-1)
+        multi.fdset = Mock(return_value=([3], [4], []))
+        select = Mock()
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            engine = RedirectEngine(CheckSettings(11), select=select)
+            engine.active[Mock()] = (Mock(), Mock(), Mock())
+            engine.perform(0.5)
+
+        select.assert_called_once_with([3], [4], [], 0.5)
+        assert not multi.select.called
+
+    def test_perform_repeats_call_multi_perform(self):
+        multi = Mock()
+        multi.perform = Mock(side_effect=((pycurl.E_CALL_MULTI_PERFORM, 1), (0, 0)))
+        multi.info_read = Mock(return_value=(0, [], []))
+
+        with patch('pycurl.CurlMulti', Mock(return_value=multi)):
+            engine = RedirectEngine(CheckSettings(11))
+            engine.perform()
+
+        assert multi.perform.call_count == 2
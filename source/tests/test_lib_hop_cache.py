@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+from lib.hop_cache import HopCache, response_ttl
+import lib.hop_cache
+
+
+class LibHopCacheTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.hop_cache.logger
+        lib.hop_cache.logger = Mock()
+
+    def tearDown(self):
+        lib.hop_cache.logger = self.original_logger
+
+    def test_response_ttl_permanent_redirect(self):
+        assert response_ttl(301, {}, 100, 0) == 100
+        assert response_ttl(308, {}, 100, 0) == 100
+        assert response_ttl(302, {}, 100, 5) == 5
+
+    def test_response_ttl_cache_control(self):
+        assert response_ttl(302, {'cache-control': 'public, max-age=60'}, 100, 0) == 60
+        assert response_ttl(301, {'cache-control': 'max-age=60'}, 100, 0) == 60
+        assert response_ttl(301, {'cache-control': 'no-cache'}, 100, 0) == 0
+        assert response_ttl(301, {'cache-control': 'private, no-store'}, 100, 0) == 0
+
+    def test_response_ttl_expires(self):
+        headers = {
+            'date': 'Tue, 15 Nov 1994 08:12:31 GMT',
+            'expires': 'Tue, 15 Nov 1994 08:13:31 GMT',
+        }
+
+        assert response_ttl(302, headers, 100, 0) == 60
+
+    def test_response_ttl_max_age_overrides_expires(self):
+        headers = {
+            'cache-control': 'max-age=10',
+            'expires': 'Tue, 15 Nov 1994 08:13:31 GMT',
+        }
+
+        assert response_ttl(302, headers, 100, 0) == 10
+
+    def test_response_ttl_invalid_expires(self):
+        assert response_ttl(301, {'expires': '0'}, 100, 0) == 0
+
+    def test_get_put(self):
+        cache = HopCache()
+        cache.put('http://a.ru/', u'http://b.ru/', 'http_status', 10)
+
+        assert cache.get('http://a.ru/') == (u'http://b.ru/', 'http_status')
+        assert cache.get('http://b.ru/') is None
+        assert cache.hits == 1 and cache.misses == 1
+
+    def test_zero_ttl_is_not_stored(self):
+        cache = HopCache()
+        cache.put('http://a.ru/', u'http://b.ru/', 'http_status', 0)
+
+        assert len(cache) == 0
+
+    def test_expired_entry(self):
+        cache = HopCache()
+        with patch('lib.hop_cache.time', Mock(return_value=1000)):
+            cache.put('http://a.ru/', u'http://b.ru/', 'http_status', 10)
+        with patch('lib.hop_cache.time', Mock(return_value=1010)):
+            assert cache.get('http://a.ru/') is None
+
+        assert len(cache) == 0
+        assert cache.memory == 0
+
+    def test_put_response(self):
+        cache = HopCache(permanent_ttl=100, default_ttl=0)
+        cache.put_response('http://a.ru/', u'http://b.ru/', 'http_status', 301, {})
+        cache.put_response('http://c.ru/', u'http://d.ru/', 'http_status', 302, {})
+
+        assert cache.get('http://a.ru/')
+        assert cache.get('http://c.ru/') is None
+
+    def test_lru_eviction(self):
+        cache = HopCache(max_entries=2)
+        cache.put('http://a.ru/', u'http://1.ru/', 'http_status', 10)
+        cache.put('http://b.ru/', u'http://2.ru/', 'http_status', 10)
+        cache.get('http://a.ru/')
+        cache.put('http://c.ru/', u'http://3.ru/', 'http_status', 10)
+
+        assert cache.get('http://b.ru/') is None
+        assert cache.get('http://a.ru/')
+        assert cache.get('http://c.ru/')
+
+    def test_memory_limit(self):
+        size = HopCache.entry_size('http://a.ru/', u'http://1.ru/')
+        cache = HopCache(max_memory=size * 2)
+        for name in 'abc':
+            cache.put('http://{}.ru/'.format(name), u'http://1.ru/', 'http_status', 10)
+
+        assert len(cache) == 2
+        assert cache.memory == size * 2
+        assert cache.get('http://a.ru/') is None
+
+    def test_save_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'hops.json')
+            cache = HopCache(snapshot_path=path)
+            cache.put('http://a.ru/', u'http://b.ru/', 'http_status', 10)
+            cache.save()
+
+            restored = HopCache()
+            assert restored.load(path) == 1
+            assert restored.get('http://a.ru/') == (u'http://b.ru/', 'http_status')
+            assert os.listdir(directory) == ['hops.json']
+        finally:
+            shutil.rmtree(directory)
+
+    def test_load_missing_snapshot(self):
+        cache = HopCache(snapshot_path='/nonexistent/hops.json')
+
+        assert cache.load() == 0
+
+    def test_maybe_save(self):
+        cache = HopCache(snapshot_path='hops.json', snapshot_interval=60)
+        cache.save = Mock()
+        cache.saved_at = 1000
+
+        with patch('lib.hop_cache.time', Mock(return_value=1059)):
+            cache.maybe_save()
+        assert not cache.save.called
+
+        with patch('lib.hop_cache.time', Mock(return_value=1060)):
+            cache.maybe_save()
+        cache.save.assert_called_once_with()
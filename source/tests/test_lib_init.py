@@ -2,7 +2,11 @@ import re
 from unittest import TestCase
 from mock import Mock, patch, call
 from lib import check_for_meta, make_pycurl_request, get_url, REDIRECT_HTTP, get_redirect_history, prepare_url, \
-    REDIRECT_META, fix_market_url, get_counters
+    REDIRECT_META, fix_market_url, get_counters, RedirectChain, ResponseStream, process_response, setup_curl, \
+    DEADLINE_EXCEEDED, classify_error, is_transient_error, is_resumable, CheckSettings
+from lib.hop_cache import HopCache
+from lib.policy import FetchPolicy
+import pycurl
 import lib
 
 
@@ -116,6 +120,30 @@ class LibInitCase(TestCase):
                 assert content == my_content
                 assert not redirect_url
 
+    def test_make_pycurl_request_curl_pool(self):
+        mocked_curl = Mock()
+        mocked_curl.getinfo = Mock(side_effect=self.make_pycurl_request_mocked_getinfo)
+        self.mocked_curl = mocked_curl
+
+        curl_pool = Mock()
+        curl_pool.acquire = Mock(return_value=mocked_curl)
+
+        with patch('lib.StringIO', Mock()):
+            make_pycurl_request('url', 11, curl_pool=curl_pool)
+
+        curl_pool.release.assert_called_once_with(mocked_curl)
+        assert not mocked_curl.close.called
+
+    def test_make_pycurl_request_curl_pool_error(self):
+        mocked_curl = Mock()
+        mocked_curl.perform = Mock(side_effect=ValueError)
+
+        curl_pool = Mock()
+        curl_pool.acquire = Mock(return_value=mocked_curl)
+
+        self.assertRaises(ValueError, make_pycurl_request, 'url', 11, curl_pool=curl_pool)
+        curl_pool.release.assert_called_once_with(mocked_curl)
+
     def mocked_lib_prepare_url(self, url):
         return url
 
@@ -197,7 +225,9 @@ class LibInitCase(TestCase):
 
         with patch('lib.prepare_url', Mock(side_effect=self.mocked_lib_prepare_url)):
             with patch('lib.get_url', Mock(return_value=(redirect_url, redirect_type, content))):
-                history_types, history_urls, counters = get_redirect_history(url, 11, max_redirects=5, user_agent='user_agent')
+                history_types, history_urls, counters = get_redirect_history(
+                    url, CheckSettings(11, max_redirects=5, user_agent='user_agent')
+                )
 
                 assert url in history_urls and redirect_url in history_urls
                 assert redirect_type in history_types
@@ -209,6 +239,35 @@ class LibInitCase(TestCase):
 
         assert new_url == url
 
+    def test_prepare_url_normalized_ascii(self):
+        url = 'https://ad.example.com/r/1?a=b&c=http%3A%2F%2Fsite%2F'
+
+        new_url = prepare_url(url)
+
+        assert new_url == url
+        assert isinstance(new_url, unicode)
+
+    def test_prepare_url_quotes(self):
+        assert prepare_url('http://site/a b/(1)') == u'http://site/a%20b/(1)'
+        assert prepare_url(u'http://\u0441\u0430\u0439\u0442.\u0440\u0444/') == u'http://xn--80aswg.xn--p1ai/'
+
+    def test_normalize_url_is_memoized(self):
+        with patch('lib._prepare_url', Mock(return_value=u'http://site/a%20b')) as mocked_prepare_url:
+            lib._prepared_urls.clear()
+            first = lib.normalize_url('http://site/a b')
+            second = lib.normalize_url('http://site/a b')
+
+        assert first == second == (u'http://site/a%20b', 'http://site/a%20b')
+        assert mocked_prepare_url.call_count == 1
+
+    def test_normalize_url_cache_size(self):
+        with patch('lib.PREPARED_URLS_CACHE_SIZE', 2):
+            lib._prepared_urls.clear()
+            for path in 'abc':
+                lib.normalize_url('http://site/' + path)
+
+            assert len(lib._prepared_urls) == 1
+
     def test_fix_market_url(self):
         market_url = 'market://amarketsdm/'
         my_http_url = 'http://play.google.com/store/apps/amarketsdm/'
@@ -228,4 +287,447 @@ class LibInitCase(TestCase):
         lib.COUNTER_TYPES = ORIGINAL_COUNTER_TYPES
 
         assert 'YA_METRICA' in counters
-        assert 'GOOGLE_ANALYTICS' not in counters
\ No newline at end of file
+        assert 'GOOGLE_ANALYTICS' not in counters
+
+    def test_redirect_chain_ignored_domain(self):
+        chain = RedirectChain('http://odnoklassniki.ru/app', max_redirects=5)
+
+        assert chain.finished
+        assert chain.result() == ([], ['http://odnoklassniki.ru/app'], [])
+
+    def test_redirect_chain_hop_timeout(self):
+        with patch('lib.time', Mock(return_value=1000)):
+            chain = RedirectChain('http://a.ru/', budget=5)
+            assert RedirectChain('http://a.ru/').hop_timeout(3) == 3
+            assert chain.hop_timeout(3) == 3
+        with patch('lib.time', Mock(return_value=1003.5)):
+            assert chain.hop_timeout(3) == 1.5
+
+    def test_redirect_chain_out_of_budget(self):
+        with patch('lib.time', Mock(return_value=1000)):
+            chain = RedirectChain('http://a.ru/', budget=5)
+            assert not RedirectChain('http://a.ru/').out_of_budget()
+            assert not chain.out_of_budget()
+        with patch('lib.time', Mock(return_value=1005)):
+            assert chain.out_of_budget()
+
+    def test_check_settings_new_chain(self):
+        settings = CheckSettings(3, max_redirects=5, budget=10, retries=2, retry_delay=1, verify_first_hop=True)
+        resume = ([REDIRECT_HTTP, REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/', 'http://c.ru/'])
+
+        with patch('lib.time', Mock(return_value=1000)):
+            chain = settings.new_chain('http://a.ru/', resume)
+
+        assert chain.max_redirects == 5
+        assert chain.deadline == 1010
+        assert (chain.retries, chain.retry_delay) == (2, 1)
+        # the first hop is verified before the chain is resumed
+        assert chain.resume == resume
+        assert chain.redirect_url == 'http://a.ru/'
+
+    def test_redirect_chain_error_after_deadline(self):
+        with patch('lib.time', Mock(return_value=1000)):
+            chain = RedirectChain('http://a.ru/', budget=5)
+        with patch('lib.time', Mock(return_value=1005)):
+            chain.add_hop('http://a.ru/', 'ERROR', None)
+
+        assert chain.finished
+        assert chain.history_types == [DEADLINE_EXCEEDED]
+
+    def test_get_redirect_history_deadline(self):
+        times = iter([1000, 1001, 1006])
+
+        with patch('lib.time', Mock(side_effect=lambda: next(times))):
+            with patch('lib.get_url', Mock(return_value=('http://b.ru/', REDIRECT_HTTP, None))) as get_url:
+                history_types, history_urls, counters = get_redirect_history('http://a.ru/', CheckSettings(3, budget=5))
+
+        assert history_types == [REDIRECT_HTTP, DEADLINE_EXCEEDED]
+        assert history_urls == ['http://a.ru/', 'http://b.ru/', 'http://b.ru/']
+        assert get_url.call_count == 1
+
+    def test_classify_error(self):
+        assert classify_error(pycurl.E_COULDNT_RESOLVE_HOST) == 'dns'
+        assert classify_error(pycurl.E_RECV_ERROR) == 'connect'
+        assert classify_error(pycurl.E_OPERATION_TIMEDOUT) == 'timeout'
+        assert classify_error(pycurl.E_SSL_CONNECT_ERROR) == 'tls'
+        assert classify_error(pycurl.E_TOO_MANY_REDIRECTS) == 'http'
+        assert classify_error(0, 503) == 'http'
+        assert classify_error(0, 404) is None
+
+    def test_is_transient_error(self):
+        assert is_transient_error(pycurl.E_RECV_ERROR)
+        assert is_transient_error(0, 502)
+        assert not is_transient_error(pycurl.E_COULDNT_RESOLVE_HOST, 0)
+        assert not is_transient_error(0, 404)
+
+    def test_redirect_chain_retry_after(self):
+        chain = RedirectChain('http://a.ru/', retries=2, retry_delay=0.5)
+
+        assert chain.retry_after(pycurl.E_COULDNT_CONNECT, 0) is None
+        assert chain.retry_after(pycurl.E_RECV_ERROR, 0) == 0.5
+        assert chain.retry_after(0, 503) == 1.0
+        assert chain.retry_after(0, 503) is None
+
+        chain.add_hop('http://b.ru/', REDIRECT_HTTP, None)
+        assert chain.retry_after(0, 503) == 0.5
+
+    def test_redirect_chain_retry_after_deadline(self):
+        with patch('lib.time', Mock(return_value=1000)):
+            chain = RedirectChain('http://a.ru/', budget=5, retries=5, retry_delay=2)
+
+            assert chain.retry_after(0, 503) == 2
+            assert chain.retry_after(0, 503) == 4
+            assert chain.retry_after(0, 503) is None
+
+    def test_get_redirect_history_retry(self):
+        responses = iter([
+            ({'error': pycurl.E_RECV_ERROR, 'code': 0}, ('http://a.ru/', 'ERROR', None)),
+            ({'error': 0, 'code': 503}, (None, None, 'unavailable')),
+            ({'error': 0, 'code': 200}, (None, None, 'content')),
+        ])
+
+        def get_url(url, timings=None, **kwargs):
+            request, hop = next(responses)
+            timings.append(request)
+            return hop
+
+        with patch('lib.get_url', Mock(side_effect=get_url)):
+            with patch('lib.sleep') as sleep:
+                result = get_redirect_history('http://a.ru/', CheckSettings(3, retries=2, retry_delay=0.5))
+
+        assert result == ([], ['http://a.ru/'], [])
+        assert sleep.call_args_list == [call(0.5), call(1.0)]
+
+    def test_get_redirect_history_no_retry_without_request(self):
+        with patch('lib.get_url', Mock(return_value=('http://a.ru/', 'ERROR', None))) as get_url:
+            result = get_redirect_history('http://a.ru/', CheckSettings(3, retries=2))
+
+        assert result == (['ERROR'], ['http://a.ru/', 'http://a.ru/'], [])
+        assert get_url.call_count == 1
+
+    def test_is_resumable(self):
+        assert is_resumable('http://a.ru/', [REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'])
+        assert not is_resumable('http://a.ru/', [], ['http://a.ru/'])
+        assert not is_resumable('http://c.ru/', [REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'])
+        assert not is_resumable('http://a.ru/', [REDIRECT_HTTP], ['http://a.ru/'])
+        assert not is_resumable('http://a.ru/', ['ERROR'], ['http://a.ru/', 'http://a.ru/'])
+
+    def test_redirect_chain_resume(self):
+        resume = ([REDIRECT_HTTP, REDIRECT_META], ['http://a.ru/', 'http://b.ru/', 'http://c.ru/'])
+
+        chain = RedirectChain('http://a.ru/', resume=resume)
+
+        assert not chain.finished
+        assert chain.redirect_url == 'http://c.ru/'
+        chain.add_hop(None, None, 'content')
+        assert chain.result()[:2] == resume
+
+    def test_redirect_chain_resume_ignored(self):
+        resume = ([REDIRECT_HTTP], ['http://b.ru/', 'http://c.ru/'])
+
+        chain = RedirectChain('http://a.ru/', resume=resume)
+
+        assert chain.redirect_url == 'http://a.ru/'
+        assert chain.history_urls == ['http://a.ru/']
+
+    def test_redirect_chain_resume_verify_first_hop(self):
+        resume = ([REDIRECT_HTTP, REDIRECT_META], ['http://a.ru/', 'http://b.ru/', 'http://c.ru/'])
+        chain = RedirectChain('http://a.ru/', resume=resume, verify_first_hop=True)
+
+        assert chain.redirect_url == 'http://a.ru/'
+        chain.add_hop('http://b.ru/', REDIRECT_HTTP, None)
+
+        assert chain.redirect_url == 'http://c.ru/'
+        assert chain.history_types == [REDIRECT_HTTP, REDIRECT_META]
+        assert chain.history_urls == ['http://a.ru/', 'http://b.ru/', 'http://c.ru/']
+
+    def test_redirect_chain_resume_first_hop_changed(self):
+        resume = ([REDIRECT_HTTP, REDIRECT_META], ['http://a.ru/', 'http://b.ru/', 'http://c.ru/'])
+        chain = RedirectChain('http://a.ru/', resume=resume, verify_first_hop=True)
+
+        chain.add_hop('http://d.ru/', REDIRECT_HTTP, None)
+
+        assert chain.redirect_url == 'http://d.ru/'
+        assert chain.history_types == [REDIRECT_HTTP]
+        assert chain.history_urls == ['http://a.ru/', 'http://d.ru/']
+
+    def test_get_redirect_history_resume(self):
+        resume = ([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'])
+
+        with patch('lib.get_url', Mock(return_value=(None, None, None))) as get_url:
+            result = get_redirect_history('http://a.ru/', CheckSettings(3), resume=resume)
+
+        assert result == ([REDIRECT_HTTP], ['http://a.ru/', 'http://b.ru/'], [])
+        assert get_url.call_args[1]['url'] == 'http://b.ru/'
+
+    def test_setup_curl_timeouts(self):
+        curl = Mock()
+
+        setup_curl(curl, 'http://a.ru/', 2.5004, connect_timeout=1)
+
+        curl.setopt.assert_any_call(curl.TIMEOUT_MS, 2501)
+        curl.setopt.assert_any_call(curl.CONNECTTIMEOUT_MS, 1000)
+
+    def test_setup_curl_connect_timeout_is_cut(self):
+        curl = Mock()
+
+        setup_curl(curl, 'http://a.ru/', 0.5, connect_timeout=1)
+
+        curl.setopt.assert_any_call(curl.CONNECTTIMEOUT_MS, 500)
+
+    def test_redirect_chain_loop(self):
+        chain = RedirectChain('http://a.ru/', max_redirects=5)
+        chain.add_hop('http://b.ru/', REDIRECT_HTTP, None)
+        assert not chain.finished
+
+        chain.add_hop('http://a.ru/', REDIRECT_META, 'content')
+
+        assert chain.finished
+        assert chain.history_types == [REDIRECT_HTTP, REDIRECT_META]
+
+    def test_redirect_chain_max_redirects(self):
+        chain = RedirectChain('http://a.ru/', max_redirects=2)
+        chain.add_hop('http://b.ru/', REDIRECT_HTTP, None)
+        chain.add_hop('http://c.ru/', REDIRECT_HTTP, None)
+
+        assert chain.finished
+
+    def test_redirect_chain_final_page_counters(self):
+        chain = RedirectChain('http://a.ru/', max_redirects=5)
+
+        with patch('lib.get_counters', Mock(return_value=['YA_METRICA'])):
+            chain.add_hop(None, None, 'content')
+
+            assert chain.finished
+            assert chain.result() == ([], ['http://a.ru/'], ['YA_METRICA'])
+
+    def test_get_counters_default_rules(self):
+        counters = get_counters('<img src="//top-fwz1.mail.ru/counter?id=1"><a href="//top.mail.ru/jump?from=1">')
+
+        assert counters == ['TOP_MAIL_RU', 'TOP_MAIL_RU']
+
+    def test_get_counters_scanner(self):
+        scanner = Mock()
+        scanner.scan = Mock(return_value=['COUNTER'])
+
+        assert get_counters('content', scanner) == ['COUNTER']
+        scanner.scan.assert_called_once_with('content')
+
+    def test_get_counter_scanner_is_cached(self):
+        rules = (('COUNTER', r'counter\.ru'),)
+
+        assert lib.get_counter_scanner(rules) is lib.get_counter_scanner(list(rules))
+
+    def test_response_stream_stops_on_redirect_headers(self):
+        stream = ResponseStream('http://site/path')
+        stream.header('HTTP/1.1 302 Found\r\n')
+        stream.header('Location: /other\r\n')
+
+        assert stream.header('\r\n') == 0
+        assert stream.stopped
+        assert stream.redirect_url == 'http://site/other'
+
+    def test_response_stream_drains_small_redirect_body(self):
+        stream = ResponseStream('http://site/path')
+        stream.header('HTTP/1.1 301 Moved Permanently\r\n')
+        stream.header('Location: http://other/\r\n')
+        stream.header('Content-Length: 20\r\n')
+
+        assert stream.header('\r\n') is None
+        assert stream.write('moved to other place') is None
+        assert not stream.stopped
+        assert stream.getvalue() == ''
+
+    def test_response_stream_new_response_resets_headers(self):
+        stream = ResponseStream('http://site/path')
+        stream.header('HTTP/1.1 100 Continue\r\n')
+        stream.header('Location: /other\r\n')
+        stream.header('\r\n')
+        stream.header('HTTP/1.1 200 OK\r\n')
+
+        assert stream.status == 200
+        assert stream.headers == {}
+        assert stream.redirect_url is None
+
+    def test_response_stream_max_body_size(self):
+        stream = ResponseStream('http://site/path', FetchPolicy(max_body_size=5))
+        stream.head_checked = True
+
+        assert stream.write('abc') is None
+        assert stream.write('defgh') == 0
+        assert stream.getvalue() == 'abcde'
+        assert stream.truncated and stream.stopped
+
+    def test_response_stream_skips_not_html(self):
+        stream = ResponseStream('http://site/app.apk', FetchPolicy())
+        stream.header('HTTP/1.1 200 OK\r\n')
+        stream.header('Content-Type: application/vnd.android.package-archive\r\n')
+
+        assert stream.header('\r\n') == 0
+        assert stream.skipped and stream.stopped
+        assert stream.getvalue() is None
+
+    def test_response_stream_downloads_html(self):
+        stream = ResponseStream('http://site/path', FetchPolicy(max_content_length=100))
+        stream.header('HTTP/1.1 200 OK\r\n')
+        stream.header('Content-Type: text/html\r\n')
+        stream.header('Content-Length: 50\r\n')
+
+        assert stream.header('\r\n') is None
+        assert not stream.skipped
+
+    def test_response_stream_head_needs_body(self):
+        stream = ResponseStream('http://site/path', FetchPolicy(), head=True)
+        stream.header('HTTP/1.1 200 OK\r\n')
+        stream.header('Content-Type: text/html\r\n')
+        stream.header('\r\n')
+
+        assert stream.needs_body
+
+    def test_process_response_without_content(self):
+        assert process_response('http://site/app.apk', None, None) == (None, None, None)
+
+    def test_response_stream_stops_on_meta_in_head(self):
+        stream = ResponseStream('http://site/path')
+
+        assert stream.write('<html><head><meta http-equiv="refresh" ') is None
+        assert stream.write('content="0; url=/next"></head><body>') == 0
+        assert stream.getvalue().startswith('<html><head>')
+
+    def test_response_stream_head_without_meta(self):
+        stream = ResponseStream('http://site/path')
+
+        assert stream.write('<html><head><title>t</title></head><body>') is None
+        assert stream.head_checked
+        assert not stream.stopped
+
+    def test_make_pycurl_request_stopped_transfer(self):
+        mocked_curl = Mock()
+        mocked_curl.getinfo = Mock(return_value=None)
+
+        def perform():
+            header = [args[1] for args, kwargs in mocked_curl.setopt.call_args_list
+                      if args[0] == mocked_curl.HEADERFUNCTION][0]
+            header('HTTP/1.1 302 Found\r\n')
+            header('Location: /next\r\n')
+            header('\r\n')
+            raise pycurl.error(23, 'Failed writing header')
+
+        mocked_curl.perform = Mock(side_effect=perform)
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            content, redirect_url = make_pycurl_request('http://site/', 11, 'user_agent')
+
+        assert content == ''
+        assert redirect_url == u'http://site/next'
+
+    def test_make_pycurl_request_head_first_skips_get(self):
+        mocked_curl = Mock()
+        mocked_curl.getinfo = Mock(return_value=None)
+
+        def perform():
+            header = [args[1] for args, kwargs in mocked_curl.setopt.call_args_list
+                      if args[0] == mocked_curl.HEADERFUNCTION][-1]
+            header('HTTP/1.1 200 OK\r\n')
+            header('Content-Type: video/mp4\r\n')
+            header('\r\n')
+            raise pycurl.error(23, 'Failed writing header')
+
+        mocked_curl.perform = Mock(side_effect=perform)
+        policy = FetchPolicy(head_first_domains=['site'])
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            content, redirect_url = make_pycurl_request('http://site/movie', 11, policy=policy)
+
+        assert content is None
+        assert redirect_url is None
+        assert mocked_curl.perform.call_count == 1
+        mocked_curl.setopt.assert_any_call(mocked_curl.NOBODY, True)
+
+    def test_make_pycurl_request_head_first_gets_html(self):
+        mocked_curl = Mock()
+        mocked_curl.getinfo = Mock(return_value=None)
+
+        def perform():
+            calls = mocked_curl.setopt.call_args_list
+            header = [args[1] for args, kwargs in calls if args[0] == mocked_curl.HEADERFUNCTION][-1]
+            write = [args[1] for args, kwargs in calls if args[0] == mocked_curl.WRITEFUNCTION][-1]
+            header('HTTP/1.1 200 OK\r\n')
+            header('Content-Type: text/html\r\n')
+            header('\r\n')
+            write('page')
+
+        mocked_curl.perform = Mock(side_effect=perform)
+        policy = FetchPolicy(head_first_domains=['site'])
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            content, redirect_url = make_pycurl_request('http://site/', 11, policy=policy)
+
+        assert content == 'page'
+        assert mocked_curl.perform.call_count == 2
+        mocked_curl.reset.assert_called_once_with()
+
+    def test_make_pycurl_request_caches_redirect(self):
+        mocked_curl = Mock()
+        mocked_curl.getinfo = Mock(return_value=None)
+
+        def perform():
+            header = [args[1] for args, kwargs in mocked_curl.setopt.call_args_list
+                      if args[0] == mocked_curl.HEADERFUNCTION][0]
+            header('HTTP/1.1 301 Moved Permanently\r\n')
+            header('Location: /next\r\n')
+            header('\r\n')
+            raise pycurl.error(23, 'Failed writing header')
+
+        mocked_curl.perform = Mock(side_effect=perform)
+        hop_cache = HopCache()
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            first = make_pycurl_request('http://site/', 11, hop_cache=hop_cache)
+            second = make_pycurl_request('http://site/', 11, hop_cache=hop_cache)
+
+        assert first == second == ('', u'http://site/next')
+        assert mocked_curl.perform.call_count == 1
+
+    def test_make_pycurl_request_timings(self):
+        mocked_curl = Mock()
+        mocked_curl.perform = Mock(side_effect=pycurl.error(7, 'Failed to connect'))
+        mocked_curl.getinfo = Mock(side_effect=lambda info: {
+            mocked_curl.RESPONSE_CODE: 0,
+            mocked_curl.SIZE_DOWNLOAD: 0.0,
+            mocked_curl.NAMELOOKUP_TIME: 0.01,
+        }.get(info, 0.0))
+        timings = []
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            self.assertRaises(pycurl.error, make_pycurl_request, 'http://site/', 11, timings=timings)
+
+        assert timings == [{
+            'url': 'http://site/',
+            'method': 'GET',
+            'code': 0,
+            'error': 7,
+            'size': 0,
+            'namelookup': 0.01,
+            'connect': 0.0,
+            'appconnect': 0.0,
+            'starttransfer': 0.0,
+            'total': 0.0,
+        }]
+
+    def test_get_redirect_history_extended(self):
+        def get_url(url, timings=None, **kwargs):
+            timings.append({'url': url})
+            return None, None, 'content'
+
+        with patch('lib.get_url', Mock(side_effect=get_url)):
+            result = get_redirect_history('http://a.ru/', CheckSettings(11), extended=True)
+
+        assert result == ([], ['http://a.ru/'], [], [{'url': 'http://a.ru/'}])
+
+    def test_make_pycurl_request_error(self):
+        mocked_curl = Mock()
+        mocked_curl.perform = Mock(side_effect=pycurl.error(7, 'Failed to connect'))
+
+        with patch('pycurl.Curl', Mock(return_value=mocked_curl)):
+            self.assertRaises(pycurl.error, make_pycurl_request, 'http://site/', 11)
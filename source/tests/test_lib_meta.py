@@ -0,0 +1,83 @@
+from unittest import TestCase
+from bs4 import BeautifulSoup
+from mock import Mock, patch
+from lib import check_for_meta
+from lib.meta import MarkupError, find_first_meta, parse_attributes
+
+
+class LibMetaTestCase(TestCase):
+    def test_parse_attributes(self):
+        attrs = parse_attributes(' HTTP-EQUIV="Refresh" content=\'0; url=/a?b=1&amp;c=2\' async x=y')
+
+        assert attrs == {
+            'http-equiv': 'Refresh',
+            'content': u'0; url=/a?b=1&c=2',
+            'async': '',
+            'x': 'y'
+        }
+
+    def test_parse_attributes_duplicate(self):
+        assert parse_attributes('content="1" content="2"') == {'content': '2'}
+
+    def test_find_first_meta(self):
+        content = '<html><head><meta charset="utf-8"><meta http-equiv="refresh"></head></html>'
+
+        assert find_first_meta(content) == {'charset': 'utf-8'}
+
+    def test_find_first_meta_skips_comments_and_scripts(self):
+        content = '<head><!-- <meta a="1"> --><script>"<meta a=2>"</script><meta a="3"></head>'
+
+        assert find_first_meta(content) == {'a': '3'}
+
+    def test_find_first_meta_without_meta(self):
+        assert find_first_meta('<html><head></head><body></body></html>') is None
+
+    def test_find_first_meta_after_head(self):
+        content = '<html><head></head><body><meta a="1"></body></html>'
+
+        self.assertRaises(MarkupError, find_first_meta, content)
+
+    def test_find_first_meta_unclosed_tag(self):
+        self.assertRaises(MarkupError, find_first_meta, '<html><head><meta a="1></head>')
+
+    def test_find_first_meta_skips_attribute_values(self):
+        content = '<head><div title="x>y"><meta a="1"></head>'
+
+        assert find_first_meta(content) == {'a': '1'}
+
+    def test_check_for_meta_after_meta_in_attribute_value(self):
+        content = '<head><div title="<meta"><meta http-equiv="refresh" content="0; url=/real"></head>'
+
+        self.assertRaises(MarkupError, find_first_meta, content)
+        assert check_for_meta(content, 'http://site/') == 'http://site/real'
+
+    def test_find_first_meta_inside_attribute_value(self):
+        content = '<head><img alt="<meta http-equiv=refresh content=\'0; url=/fake\'>"></head>'
+
+        self.assertRaises(MarkupError, find_first_meta, content)
+        assert check_for_meta(content, 'http://site/') is None
+
+    def test_find_first_meta_after_unclosed_tag(self):
+        content = '<head><don\'t<meta http-equiv="refresh" content="0; url=/a"></head>'
+
+        self.assertRaises(MarkupError, find_first_meta, content)
+        assert find_first_meta('<head><a title="x></head>') is None
+
+    def test_check_for_meta_fallback(self):
+        content = '<html><head></head><body><meta http-equiv="refresh" content="0; url=/body"></body></html>'
+
+        with patch('lib.BeautifulSoup', Mock(wraps=BeautifulSoup)) as mocked_soup:
+            redirect_url = check_for_meta(content, 'http://site/')
+
+            assert mocked_soup.called
+            assert redirect_url == 'http://site/body'
+
+    def test_check_for_meta_fast_path(self):
+        content = '<html><head><meta http-equiv="refresh" content="0; url=/head"></head></html>'
+
+        with patch('lib.BeautifulSoup') as mocked_soup:
+            redirect_url = check_for_meta(content, 'http://site/')
+
+            assert not mocked_soup.called
+            assert redirect_url == 'http://site/head'
+
@@ -0,0 +1,208 @@
+import errno
+import os
+import shutil
+import signal
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+import lib.metrics
+from lib.metrics import Metrics, MetricsCollector, MetricsHandler, OFFSETS, SIZE, format_metrics, get_metrics, \
+    serve_metrics, stop_metrics_server
+
+HOP = {'total': 0.3, 'error': 0, 'code': 200}
+TIMEOUT_HOP = {'total': 3.0, 'error': 28, 'code': 0}
+
+
+class LibMetricsTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.metrics.logger
+        lib.metrics.logger = Mock()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        lib.metrics.logger = self.original_logger
+        shutil.rmtree(self.directory)
+
+    def worker_metrics(self, pid):
+        return Metrics(os.path.join(self.directory, '{}.metrics'.format(pid)))
+
+    def test_inc(self):
+        metrics = Metrics()
+        metrics.inc('tasks_total', 3)
+        metrics.inc('tasks_total')
+        metrics.inc('hop_errors_total', label='tls')
+
+        values = metrics.read()
+        assert values[OFFSETS['tasks_total']] == 4
+        assert values[OFFSETS['hop_errors_total'] + 3] == 1
+
+    def test_observe(self):
+        metrics = Metrics()
+        metrics.observe('chain_hops', 1)
+        metrics.observe('chain_hops', 4)
+        metrics.observe('chain_hops', 100)
+
+        values = metrics.read()
+        offset = OFFSETS['chain_hops']
+        # buckets 0, 1, 2, 3, 5, 10, 20, 30, +Inf and sum
+        assert values[offset:offset + 10] == (0, 1, 0, 0, 1, 0, 0, 0, 1, 105)
+
+    def test_add_chain(self):
+        metrics = Metrics()
+        metrics.add_chain(['http_status', 'ERROR'], [HOP, TIMEOUT_HOP])
+
+        text = format_metrics(metrics.read())
+        assert 'redirect_checker_chain_hops_sum 2.0' in text
+        assert 'redirect_checker_hop_seconds_bucket{le="0.5"} 1.0' in text
+        assert 'redirect_checker_hop_seconds_count 2.0' in text
+        assert 'redirect_checker_hop_errors_total{kind="timeout"} 1.0' in text
+        assert 'redirect_checker_hop_errors_total{kind="dns"} 0.0' in text
+
+    def test_format_metrics(self):
+        metrics = Metrics()
+        metrics.inc('tasks_total', 2)
+        metrics.observe('take_seconds', 0.002)
+
+        text = format_metrics(metrics.read())
+
+        assert '# TYPE redirect_checker_tasks_total counter\nredirect_checker_tasks_total 2.0\n' in text
+        assert '# TYPE redirect_checker_take_seconds histogram\n' in text
+        assert 'redirect_checker_take_seconds_bucket{le="0.001"} 0.0\n' in text
+        assert 'redirect_checker_take_seconds_bucket{le="0.005"} 1.0\n' in text
+        assert 'redirect_checker_take_seconds_bucket{le="+Inf"} 1.0\n' in text
+        assert text.endswith('\n')
+
+    def test_file_is_shared(self):
+        metrics = self.worker_metrics(42)
+        metrics.inc('tasks_total', 5)
+        metrics.close()
+
+        metrics = self.worker_metrics(42)
+        metrics.inc('tasks_total')
+
+        assert metrics.read()[OFFSETS['tasks_total']] == 6
+        metrics.close()
+
+    def test_collect(self):
+        for pid in (10, 11):
+            metrics = self.worker_metrics(pid)
+            metrics.inc('tasks_total', pid)
+            metrics.close()
+        open(os.path.join(self.directory, 'other'), 'w').close()
+
+        collector = MetricsCollector(self.directory)
+        with patch('lib.metrics.is_alive', Mock(return_value=True)):
+            values = collector.collect()
+
+        assert len(values) == SIZE
+        assert values[OFFSETS['tasks_total']] == 21
+
+    def test_collect_keeps_values_of_finished_workers(self):
+        metrics = self.worker_metrics(10)
+        metrics.inc('tasks_total', 3)
+        metrics.close()
+
+        collector = MetricsCollector(self.directory)
+        with patch('lib.metrics.is_alive', Mock(return_value=False)):
+            assert collector.collect()[OFFSETS['tasks_total']] == 3
+        assert not os.path.exists(os.path.join(self.directory, '10.metrics'))
+
+        metrics = self.worker_metrics(11)
+        metrics.inc('tasks_total')
+        metrics.close()
+        with patch('lib.metrics.is_alive', Mock(return_value=True)):
+            assert collector.collect()[OFFSETS['tasks_total']] == 4
+
+    def test_clear(self):
+        directory = os.path.join(self.directory, 'metrics')
+        collector = MetricsCollector(directory)
+        collector.clear()
+        self.worker_metrics(10).inc('tasks_total')
+        open(os.path.join(directory, '10.metrics'), 'w').close()
+
+        collector.clear()
+
+        assert os.listdir(directory) == []
+
+    def test_handler(self):
+        handler = Mock()
+        handler.path = '/metrics'
+        handler.server.collector.render = Mock(return_value='text\n')
+
+        MetricsHandler.do_GET.im_func(handler)
+
+        handler.send_response.assert_called_once_with(200)
+        handler.wfile.write.assert_called_once_with('text\n')
+
+    def test_handler_not_found(self):
+        handler = Mock()
+        handler.path = '/'
+
+        MetricsHandler.do_GET.im_func(handler)
+
+        handler.send_error.assert_called_once_with(404)
+        assert not handler.server.collector.render.called
+
+    def test_get_metrics(self):
+        config = Mock()
+        config.METRICS_PORT = None
+        assert get_metrics(config) is None
+
+        config.METRICS_PORT = 9102
+        config.METRICS_DIR = self.directory
+        with patch('lib.metrics.os.getpid', Mock(return_value=42)):
+            metrics = get_metrics(config)
+        assert metrics.path == os.path.join(self.directory, '42.metrics')
+
+    def test_serve_metrics(self):
+        config = Mock()
+        config.METRICS_HOST = '127.0.0.1'
+        config.METRICS_PORT = 9102
+        config.METRICS_DIR = self.directory
+
+        with patch('lib.metrics.os.fork', Mock(return_value=42)):
+            with patch('lib.metrics.HTTPServer') as http_server:
+                assert serve_metrics(config) == 42
+
+        # the socket is opened only in the server process
+        assert not http_server.called
+
+    def test_serve_metrics_process(self):
+        config = Mock()
+        config.METRICS_HOST = '127.0.0.1'
+        config.METRICS_PORT = 9102
+        config.METRICS_DIR = self.directory
+        server = Mock()
+
+        with patch('lib.metrics.os.fork', Mock(return_value=0)):
+            with patch('lib.metrics.os._exit') as exit:
+                with patch('lib.metrics.set_parent_death_signal') as set_parent_death_signal:
+                    with patch('lib.metrics.signal.signal'):
+                        with patch('lib.metrics.HTTPServer', Mock(return_value=server)) as http_server:
+                            serve_metrics(config)
+
+        http_server.assert_called_once_with(('127.0.0.1', 9102), MetricsHandler)
+        assert server.collector.directory == self.directory
+        server.serve_forever.assert_called_once_with()
+        set_parent_death_signal.assert_called_once_with(signal.SIGTERM)
+        exit.assert_called_once_with(1)
+
+    def test_stop_metrics_server(self):
+        with patch('lib.metrics.os.kill') as kill:
+            with patch('lib.metrics.os.waitpid') as waitpid:
+                stop_metrics_server(42)
+
+        kill.assert_called_once_with(42, signal.SIGTERM)
+        waitpid.assert_called_once_with(42, 0)
+
+    def test_stop_exited_metrics_server(self):
+        with patch('lib.metrics.os.kill', Mock(side_effect=OSError(errno.ESRCH, 'No such process'))):
+            stop_metrics_server(42)
+
+    def test_serve_metrics_disabled(self):
+        config = Mock()
+        config.METRICS_PORT = None
+
+        with patch('lib.metrics.HTTPServer') as http_server:
+            assert serve_metrics(config) is None
+        assert not http_server.called
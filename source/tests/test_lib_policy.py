@@ -0,0 +1,37 @@
+from unittest import TestCase
+from lib.policy import FetchPolicy
+
+
+class LibPolicyTestCase(TestCase):
+    def test_is_html(self):
+        policy = FetchPolicy()
+
+        assert policy.is_html({'content-type': 'text/html; charset=utf-8'})
+        assert policy.is_html({'content-type': 'Application/XHTML+XML'})
+        assert not policy.is_html({'content-type': 'application/vnd.android.package-archive'})
+
+    def test_is_html_without_content_type(self):
+        assert FetchPolicy().is_html({})
+
+    def test_should_download(self):
+        policy = FetchPolicy(max_content_length=100)
+
+        assert policy.should_download({'content-type': 'text/html', 'content-length': '100'})
+        assert policy.should_download({'content-type': 'text/html'})
+        assert not policy.should_download({'content-type': 'text/html', 'content-length': '101'})
+        assert not policy.should_download({'content-type': 'image/png', 'content-length': '10'})
+
+    def test_should_download_without_limit(self):
+        assert FetchPolicy().should_download({'content-length': str(10 ** 9)})
+
+    def test_head_first(self):
+        policy = FetchPolicy(head_first_domains=['Files.example.com', '.cdn.net'])
+
+        assert policy.head_first(u'http://files.example.com/app.apk')
+        assert policy.head_first(u'http://a.cdn.net/video')
+        assert policy.head_first(u'https://cdn.net/')
+        assert not policy.head_first(u'http://example.com/')
+        assert not policy.head_first(u'http://notcdn.net/')
+
+    def test_head_first_without_domains(self):
+        assert not FetchPolicy().head_first(u'http://site/')
@@ -0,0 +1,131 @@
+import os
+import shutil
+import signal
+import tempfile
+from collections import Counter
+from unittest import TestCase
+from mock import Mock, patch
+import lib.profiler
+from lib.profiler import CPROFILE, PROFILE_SIGNAL, Profiler, collapse_stack, get_profiler, write_collapsed
+
+
+def inner(frames):
+    import sys
+    frames.append(sys._getframe())
+
+
+def outer(frames):
+    inner(frames)
+
+
+class LibProfilerTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.profiler.logger
+        lib.profiler.logger = Mock()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        lib.profiler.logger = self.original_logger
+        shutil.rmtree(self.directory)
+
+    def test_collapse_stack(self):
+        frames = []
+        outer(frames)
+
+        stack = collapse_stack(frames[0]).split(';')
+
+        assert stack[-2].endswith('test_lib_profiler.py:outer')
+        assert stack[-1].endswith('test_lib_profiler.py:inner')
+
+    def test_write_collapsed(self):
+        path = os.path.join(self.directory, 'out.collapsed')
+
+        write_collapsed(path, Counter({'a;b': 2, 'a;c': 5}))
+
+        with open(path) as f:
+            assert f.read() == 'a;c 5\na;b 2\n'
+
+    def test_install(self):
+        profiler = Profiler(self.directory)
+
+        with patch('lib.profiler.signal.signal') as mocked_signal:
+            with patch('lib.profiler.signal.siginterrupt') as siginterrupt:
+                profiler.install()
+
+        mocked_signal.assert_called_once_with(PROFILE_SIGNAL, profiler.on_start)
+        siginterrupt.assert_called_once_with(PROFILE_SIGNAL, False)
+
+    @patch('lib.profiler.signal.signal', Mock())
+    @patch('lib.profiler.signal.siginterrupt', Mock())
+    def test_sample(self):
+        profiler = Profiler(self.directory, duration=10, interval=0.01)
+        frames = []
+        outer(frames)
+
+        with patch('lib.profiler.signal.setitimer') as setitimer:
+            with patch('lib.profiler.time', Mock(return_value=1000)):
+                profiler.on_start(PROFILE_SIGNAL, None)
+                profiler.on_start(PROFILE_SIGNAL, None)
+            setitimer.assert_any_call(signal.ITIMER_PROF, 0.01, 0.01)
+            setitimer.assert_any_call(signal.ITIMER_REAL, 10)
+            assert setitimer.call_count == 2
+
+            profiler.on_sample(signal.SIGPROF, frames[0])
+            profiler.on_sample(signal.SIGPROF, frames[0])
+            with patch('lib.profiler.os.getpid', Mock(return_value=42)):
+                profiler.on_stop(signal.SIGALRM, None)
+            setitimer.assert_any_call(signal.ITIMER_PROF, 0)
+
+        path = os.path.join(self.directory, '42.1000.collapsed')
+        with open(path) as f:
+            assert f.read() == '{} 2\n'.format(collapse_stack(frames[0]))
+        # late samples are ignored
+        profiler.on_sample(signal.SIGPROF, frames[0])
+
+    @patch('lib.profiler.signal.signal', Mock())
+    @patch('lib.profiler.signal.siginterrupt', Mock())
+    @patch('lib.profiler.signal.setitimer', Mock())
+    def test_cprofile(self):
+        directory = os.path.join(self.directory, 'profiles')
+        profiler = Profiler(directory, mode=CPROFILE)
+
+        with patch('lib.profiler.time', Mock(return_value=1000)):
+            profiler.start()
+        outer([])
+        with patch('lib.profiler.os.getpid', Mock(return_value=42)):
+            path = profiler.stop()
+
+        assert path == os.path.join(directory, '42.1000.pstats')
+        assert os.path.getsize(path)
+        assert profiler.profile is None
+
+    def test_stop_not_started(self):
+        with patch('lib.profiler.signal.setitimer') as setitimer:
+            assert Profiler(self.directory).stop() is None
+        assert not setitimer.called
+
+    @patch('lib.profiler.signal.signal', Mock())
+    @patch('lib.profiler.signal.siginterrupt', Mock())
+    @patch('lib.profiler.signal.setitimer', Mock())
+    def test_stop_write_fail(self):
+        profiler = Profiler(os.path.join(self.directory, 'file', 'profiles'))
+        open(os.path.join(self.directory, 'file'), 'w').close()
+
+        profiler.start()
+
+        assert profiler.stop() is None
+        assert lib.profiler.logger.exception.called
+
+    def test_get_profiler(self):
+        config = Mock()
+        config.PROFILE_DIR = None
+        assert get_profiler(config) is None
+
+        config.PROFILE_DIR = self.directory
+        config.PROFILE_MODE = CPROFILE
+        config.PROFILE_DURATION = 5
+        config.PROFILE_INTERVAL = 0.01
+        profiler = get_profiler(config)
+
+        assert (profiler.directory, profiler.mode, profiler.duration, profiler.interval) == \
+            (self.directory, CPROFILE, 5, 0.01)
@@ -0,0 +1,134 @@
+from unittest import TestCase
+from mock import Mock, patch
+import tarantool
+import lib.publisher
+from lib.publisher import ResultPublisher
+
+
+class LibPublisherTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.publisher.logger
+        lib.publisher.logger = Mock()
+        self.input_tube = Mock()
+        self.input_tube.ack_batch = Mock(return_value=set([1, 2]))
+        self.output_tube = Mock()
+
+    def tearDown(self):
+        lib.publisher.logger = self.original_logger
+
+    def make_task(self, task_id, pri=0):
+        task = Mock()
+        task.task_id = task_id
+        task.pri = pri
+        return task
+
+    def test_flush(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        task1 = self.make_task(1, pri=5)
+        task2 = self.make_task(2)
+
+        publisher.add(task1, (True, {'url': 'a'}))
+        publisher.add(task2, (False, {'url_id': 2}))
+        publisher.flush()
+
+        self.input_tube.put_batch.assert_called_once_with([({'url': 'a'}, 5)], delay=300)
+        self.output_tube.put_batch.assert_called_once_with([({'url_id': 2}, None)])
+        self.input_tube.ack_batch.assert_called_once_with([task1, task2])
+        assert len(publisher) == 0
+
+    def test_flush_metrics(self):
+        metrics = Mock()
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300, metrics=metrics)
+        publisher.add(self.make_task(1), (True, {'url': 'a'}))
+        publisher.add(self.make_task(2), (False, {'url_id': 2}))
+
+        with patch('lib.publisher.time', Mock(side_effect=[1000, 1000.25])):
+            publisher.flush()
+
+        metrics.observe.assert_called_once_with('put_seconds', 0.25)
+        metrics.inc.assert_called_once_with('rechecks_total', 1)
+
+    def test_task_without_result_is_acked(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        task = self.make_task(1)
+
+        publisher.add(task, None)
+        publisher.flush()
+
+        self.output_tube.put_batch.assert_called_once_with([])
+        self.input_tube.ack_batch.assert_called_once_with([task])
+
+    def test_flush_when_full(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300, max_size=2)
+
+        publisher.add(self.make_task(1), (False, {}))
+        assert not self.input_tube.ack_batch.called
+        publisher.add(self.make_task(2), (False, {}))
+
+        assert self.input_tube.ack_batch.called
+        assert len(publisher) == 0
+
+    def test_maybe_flush(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300, max_delay=0.5)
+        with patch('lib.publisher.time', Mock(return_value=1000)):
+            publisher.add(self.make_task(1), (False, {}))
+        with patch('lib.publisher.time', Mock(return_value=1000.4)):
+            publisher.maybe_flush()
+            assert not self.input_tube.ack_batch.called
+        with patch('lib.publisher.time', Mock(return_value=1000.5)):
+            publisher.maybe_flush()
+            assert self.input_tube.ack_batch.called
+
+    def test_empty_flush(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+
+        publisher.flush()
+
+        assert not self.output_tube.put_batch.called
+        assert not self.input_tube.ack_batch.called
+
+    def test_tasks_are_not_acked_if_results_are_not_sent(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        self.output_tube.put_batch = Mock(side_effect=tarantool.DatabaseError)
+
+        publisher.add(self.make_task(1), (False, {}))
+        publisher.flush()
+
+        assert not self.input_tube.ack_batch.called
+        assert lib.publisher.logger.exception.called
+
+    def test_written_rechecks_are_acked_if_outputs_are_not_sent(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        self.output_tube.put_batch = Mock(side_effect=tarantool.DatabaseError)
+        recheck_task = self.make_task(1)
+        output_task = self.make_task(2)
+        empty_task = self.make_task(3)
+
+        publisher.add(recheck_task, (True, {'url': 'a'}))
+        publisher.add(output_task, (False, {'url_id': 2}))
+        publisher.add(empty_task, None)
+        publisher.flush()
+
+        self.input_tube.put_batch.assert_called_once_with([({'url': 'a'}, 0)], delay=300)
+        self.input_tube.ack_batch.assert_called_once_with([empty_task, recheck_task])
+        assert lib.publisher.logger.exception.called
+
+    def test_nothing_is_acked_if_rechecks_are_not_sent(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        self.input_tube.put_batch = Mock(side_effect=tarantool.DatabaseError)
+
+        publisher.add(self.make_task(1), (True, {'url': 'a'}))
+        publisher.add(self.make_task(2), (False, {'url_id': 2}))
+        publisher.flush()
+
+        assert not self.output_tube.put_batch.called
+        assert not self.input_tube.ack_batch.called
+
+    def test_ack_fail(self):
+        publisher = ResultPublisher(self.input_tube, self.output_tube, 300)
+        self.input_tube.ack_batch = Mock(side_effect=tarantool.DatabaseError)
+
+        publisher.add(self.make_task(1), (False, {}))
+        publisher.flush()
+
+        assert lib.publisher.logger.exception.called
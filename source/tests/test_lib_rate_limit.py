@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+from lib.rate_limit import TokenBucket
+
+
+class LibRateLimitTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'bucket')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_burst(self):
+        with patch('lib.rate_limit.time', Mock(return_value=1000)):
+            bucket = TokenBucket(10, burst=2)
+
+            assert bucket.acquire() == 0
+            assert bucket.acquire() == 0
+            assert abs(bucket.acquire() - 0.1) < 1e-9
+
+    def test_refill(self):
+        with patch('lib.rate_limit.time', Mock(return_value=1000)):
+            bucket = TokenBucket(2, burst=1)
+            assert bucket.acquire() == 0
+            assert bucket.acquire() == 0.5
+        with patch('lib.rate_limit.time', Mock(return_value=1000.5)):
+            assert bucket.acquire() == 0
+
+    def test_burst_is_at_least_one(self):
+        with patch('lib.rate_limit.time', Mock(return_value=1000)):
+            bucket = TokenBucket(0.5)
+
+            assert bucket.acquire() == 0
+            assert bucket.acquire() == 2
+
+    def test_shared_between_buckets(self):
+        with patch('lib.rate_limit.time', Mock(return_value=1000)):
+            first = TokenBucket(1, burst=1, path=self.path)
+            second = TokenBucket(1, burst=1, path=self.path)
+
+            assert first.acquire() == 0
+            assert second.acquire() == 1
+        first.close()
+        second.close()
+
+    def test_wait(self):
+        bucket = TokenBucket(10, burst=1)
+        bucket.acquire = Mock(side_effect=(0.1, 0))
+
+        with patch('lib.rate_limit.sleep', Mock()) as sleep:
+            bucket.wait()
+
+        sleep.assert_called_once_with(0.1)
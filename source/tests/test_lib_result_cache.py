@@ -0,0 +1,71 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+from lib.result_cache import ResultCache
+import lib.result_cache
+
+
+class LibResultCacheTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.result_cache.logger
+        lib.result_cache.logger = Mock()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'results.db')
+
+    def tearDown(self):
+        lib.result_cache.logger = self.original_logger
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        cache = ResultCache(self.path)
+        history = (['http_status'], [u'http://a.ru/', u'http://b.ru/'], ['YA_METRICA'])
+        cache.put(u'http://a.ru/', history)
+
+        assert cache.get(u'http://a.ru/') == ([u'http_status'], [u'http://a.ru/', u'http://b.ru/'], [u'YA_METRICA'])
+        assert cache.get(u'http://b.ru/') is None
+        cache.close()
+
+    def test_shared_between_connections(self):
+        history = ([], [u'http://a.ru/'], [])
+        ResultCache(self.path).put(u'http://a.ru/', history)
+
+        assert ResultCache(self.path).get(u'http://a.ru/') == ([], [u'http://a.ru/'], [])
+
+    def test_key_is_normalized_url(self):
+        cache = ResultCache(self.path)
+        cache.put(u'http://a.ru/path with space', ([], [u'http://a.ru/'], []))
+
+        assert cache.get('http://a.ru/path%20with%20space') is not None
+
+    def test_error_result_is_not_stored(self):
+        cache = ResultCache(self.path)
+        cache.put(u'http://a.ru/', (['ERROR'], [u'http://a.ru/', u'http://a.ru/'], []))
+
+        assert cache.get(u'http://a.ru/') is None
+
+    def test_expired_result(self):
+        cache = ResultCache(self.path, ttl=10)
+        with patch('lib.result_cache.time', Mock(return_value=1000)):
+            cache.put(u'http://a.ru/', ([], [u'http://a.ru/'], []))
+        with patch('lib.result_cache.time', Mock(return_value=1010)):
+            assert cache.get(u'http://a.ru/') is None
+
+    def test_cleanup(self):
+        with patch('lib.result_cache.time', Mock(return_value=1000)):
+            cache = ResultCache(self.path, ttl=10, cleanup_interval=60)
+            cache.put(u'http://a.ru/', ([], [u'http://a.ru/'], []))
+        with patch('lib.result_cache.time', Mock(return_value=1060)):
+            cache.put(u'http://b.ru/', ([], [u'http://b.ru/'], []))
+
+        assert cache.connect().execute('SELECT url FROM results').fetchall() == [(u'http://b.ru/',)]
+
+    def test_database_error_is_cache_miss(self):
+        cache = ResultCache(self.path)
+        cache.connection = Mock()
+        cache.connection.execute = Mock(side_effect=sqlite3.OperationalError('database is locked'))
+
+        assert cache.get(u'http://a.ru/') is None
+        cache.put(u'http://a.ru/', ([], [u'http://a.ru/'], []))
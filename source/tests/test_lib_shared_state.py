@@ -0,0 +1,82 @@
+import os
+import shutil
+import struct
+import tempfile
+from unittest import TestCase
+from lib.shared_state import SharedState
+
+STATE = struct.Struct('di')
+
+
+class LibSharedStateTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_local_initial_state(self):
+        state = SharedState(STATE, initial=(1.5, 2))
+
+        assert state.read() == (1.5, 2)
+        assert state.fd is None
+
+    def test_local_zeroed_state(self):
+        assert SharedState(STATE).read() == (0, 0)
+
+    def test_update(self):
+        state = SharedState(STATE, initial=(1.5, 2))
+
+        def change(state, step):
+            value, count = state
+            return (value + step, count + 1), count
+
+        result = state.update(change, 2)
+
+        assert result == 2
+        assert state.read() == (3.5, 3)
+
+    def test_file_is_opened_lazily(self):
+        state = SharedState(STATE, self.path)
+
+        assert not os.path.exists(self.path)
+        assert state.read() == (0, 0)
+        assert os.path.getsize(self.path) == STATE.size
+        state.close()
+
+    def test_shared_between_states(self):
+        first = SharedState(STATE, self.path, initial=(1.5, 2))
+        second = SharedState(STATE, self.path)
+
+        first.update(lambda state: ((0.5, 7), None))
+
+        assert second.read() == (0.5, 7)
+        first.close()
+        second.close()
+
+    def test_failed_update_keeps_state(self):
+        state = SharedState(STATE, self.path)
+
+        def change(state):
+            raise ValueError()
+
+        self.assertRaises(ValueError, state.update, change)
+        # the lock is released
+        assert state.update(lambda state: ((1, 1), 'ok')) == 'ok'
+        assert state.read() == (1, 1)
+        state.close()
+
+    def test_close(self):
+        state = SharedState(STATE, self.path)
+        state.read()
+
+        state.close()
+
+        assert state.fd is None
+        assert state.read() == (0, 0)
+        state.close()
+
+    def test_close_unopened(self):
+        SharedState(STATE, self.path).close()
+        SharedState(STATE).close()
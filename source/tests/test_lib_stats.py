@@ -0,0 +1,85 @@
+from unittest import TestCase
+from mock import Mock, patch
+from lib.stats import HopStats, hop_phases
+import lib.stats
+
+
+def make_timings(namelookup=0.01, connect=0.03, appconnect=0.0, starttransfer=0.1, total=0.15, code=200, size=100,
+                 error=0):
+    return {
+        'url': 'http://a.ru/',
+        'method': 'GET',
+        'code': code,
+        'error': error,
+        'size': size,
+        'namelookup': namelookup,
+        'connect': connect,
+        'appconnect': appconnect,
+        'starttransfer': starttransfer,
+        'total': total,
+    }
+
+
+class LibStatsTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.stats.logger
+        lib.stats.logger = Mock()
+
+    def tearDown(self):
+        lib.stats.logger = self.original_logger
+
+    def assert_phases(self, phases, expected):
+        for phase, duration in expected.iteritems():
+            assert abs(phases[phase] - duration) < 1e-9, (phase, phases[phase])
+
+    def test_hop_phases(self):
+        phases = hop_phases(make_timings())
+
+        self.assert_phases(phases, {'dns': 0.01, 'connect': 0.02, 'tls': 0, 'wait': 0.07, 'transfer': 0.05,
+                                    'total': 0.15})
+
+    def test_hop_phases_tls(self):
+        phases = hop_phases(make_timings(appconnect=0.08, starttransfer=0.1))
+
+        self.assert_phases(phases, {'tls': 0.05, 'wait': 0.02})
+
+    def test_hop_phases_connect_failed(self):
+        phases = hop_phases(make_timings(connect=0, starttransfer=0, total=1.0, code=0))
+
+        self.assert_phases(phases, {'dns': 0.01, 'connect': 0, 'wait': 0, 'transfer': 0, 'total': 1.0})
+
+    def test_summary(self):
+        stats = HopStats()
+        stats.add_chain([make_timings(), make_timings(total=0.25, code=302, size=0)])
+
+        summary = stats.summary()
+
+        assert summary['chains'] == 1
+        assert summary['hops'] == 2
+        assert summary['size'] == 100
+        assert summary['codes'] == {200: 1, 302: 1}
+        assert abs(summary['avg']['total'] - 200) < 1e-6
+        assert abs(summary['max']['total'] - 250) < 1e-6
+
+    def test_summary_errors(self):
+        stats = HopStats()
+        stats.add_chain([make_timings(code=0, error=28), make_timings(code=503), make_timings(code=0, error=6)])
+        stats.add_chain([make_timings(code=0, error=28)])
+
+        assert stats.summary()['errors'] == {'timeout': 2, 'http': 1, 'dns': 1}
+
+    def test_summary_without_hops(self):
+        assert HopStats().summary()['avg']['total'] == 0
+
+    def test_maybe_log(self):
+        with patch('lib.stats.time', Mock(return_value=1000)):
+            stats = HopStats(interval=60)
+            stats.add_chain([make_timings()])
+        with patch('lib.stats.time', Mock(return_value=1059)):
+            stats.maybe_log()
+            assert not lib.stats.logger.info.called
+        with patch('lib.stats.time', Mock(return_value=1060)):
+            stats.maybe_log()
+
+        assert lib.stats.logger.info.call_count == 2
+        assert stats.hops == 0
@@ -0,0 +1,103 @@
+from unittest import TestCase
+from mock import Mock, patch
+import signal
+import lib.supervisor
+from lib.supervisor import Supervisor
+
+
+class LibSupervisorTestCase(TestCase):
+    def setUp(self):
+        self.original_logger = lib.supervisor.logger
+        lib.supervisor.logger = Mock()
+
+    def tearDown(self):
+        lib.supervisor.logger = self.original_logger
+
+    def make_worker(self, pid):
+        worker = Mock()
+        worker.pid = pid
+        return worker
+
+    def test_fill(self):
+        target = Mock()
+        with patch('lib.supervisor.os.getpid', Mock(return_value=42)):
+            supervisor = Supervisor(target, ('config',), 3)
+
+        with patch('lib.supervisor.active_children', Mock(return_value=[self.make_worker(1)])):
+            with patch('lib.supervisor.spawn_workers') as spawn_workers:
+                assert supervisor.fill() == 2
+
+        spawn_workers.assert_called_once_with(num=2, target=target, args=('config',), parent_pid=42)
+
+    def test_fill_full(self):
+        supervisor = Supervisor(Mock(), (), 1)
+
+        with patch('lib.supervisor.active_children', Mock(return_value=[self.make_worker(1)])):
+            with patch('lib.supervisor.spawn_workers') as spawn_workers:
+                assert supervisor.fill() == 0
+
+        assert not spawn_workers.called
+
+    def test_drain(self):
+        supervisor = Supervisor(Mock(), (), 2, drain_timeout=60)
+        workers = [self.make_worker(1), self.make_worker(2)]
+
+        with patch('lib.supervisor.active_children', Mock(return_value=workers)):
+            with patch('lib.supervisor.time', Mock(return_value=100)):
+                assert supervisor.drain() == 2
+                assert supervisor.drain() == 2
+
+        for worker in workers:
+            worker.terminate.assert_called_once_with()
+        assert supervisor.draining == {1: 160, 2: 160}
+
+    def test_signal_workers(self):
+        supervisor = Supervisor(Mock(), (), 2)
+        supervisor.draining = {2: 200}
+        workers = [self.make_worker(1), self.make_worker(2)]
+
+        with patch('lib.supervisor.active_children', Mock(return_value=workers)):
+            with patch('lib.supervisor.os.kill') as kill:
+                supervisor.signal_workers(signal.SIGUSR2)
+
+        kill.assert_called_once_with(1, signal.SIGUSR2)
+
+    def test_kill_stuck(self):
+        supervisor = Supervisor(Mock(), (), 2, drain_timeout=60)
+        supervisor.draining = {1: 160, 2: 200, 3: 160}
+        workers = [self.make_worker(1), self.make_worker(2), self.make_worker(4)]
+
+        with patch('lib.supervisor.time', Mock(return_value=170)):
+            with patch('lib.supervisor.os.kill') as kill:
+                supervisor.kill_stuck(workers)
+
+        kill.assert_called_once_with(1, signal.SIGKILL)
+        # finished workers are forgotten
+        assert supervisor.draining == {1: 160, 2: 200}
+
+    def test_fill_counts_draining_workers(self):
+        supervisor = Supervisor(Mock(), (), 2, drain_timeout=60)
+        supervisor.draining = {1: 160}
+
+        with patch('lib.supervisor.active_children', Mock(return_value=[self.make_worker(1)])):
+            with patch('lib.supervisor.time', Mock(return_value=100)):
+                with patch('lib.supervisor.spawn_workers') as spawn_workers:
+                    assert supervisor.fill() == 1
+
+        assert spawn_workers.call_args[1]['num'] == 1
+
+    def test_fill_shrink(self):
+        supervisor = Supervisor(Mock(), (), 1, drain_timeout=60)
+        supervisor.draining = {1: 160}
+        workers = [self.make_worker(1), self.make_worker(2), self.make_worker(3)]
+
+        with patch('lib.supervisor.active_children', Mock(return_value=workers)):
+            with patch('lib.supervisor.time', Mock(return_value=100)):
+                with patch('lib.supervisor.spawn_workers') as spawn_workers:
+                    assert supervisor.fill() == 0
+
+        assert not workers[0].terminate.called
+        assert not workers[1].terminate.called
+        workers[2].terminate.assert_called_once_with()
+        assert supervisor.draining == {1: 160, 3: 160}
+        assert not spawn_workers.called
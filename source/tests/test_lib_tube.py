@@ -0,0 +1,90 @@
+from unittest import TestCase
+from mock import Mock
+from lib.tube import BatchTube
+
+
+class LibTubeTestCase(TestCase):
+    def make_tube(self, response=()):
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.queue.space = 0
+        tube.queue.tnt.call = Mock(return_value=list(response))
+        return BatchTube(tube)
+
+    def test_take_batch(self):
+        tube = self.make_tube([
+            ('id1', 'tube_name', 'taken', '0', 'data1'),
+            ('id2', 'tube_name', 'taken', '-5', 'data2'),
+        ])
+
+        tasks = tube.take_batch(5, 0.1)
+
+        tube.queue.tnt.call.assert_called_once_with('queue.take_batch', ('0', 'tube_name', '5', '0.1'))
+        assert [task.task_id for task in tasks] == ['id1', 'id2']
+        assert tasks[1].raw_data == 'data2'
+        assert tasks[0].status == 'taken'
+        assert [task.pri for task in tasks] == [0, -5]
+        for task in tasks:
+            task.modified = True
+
+    def test_take_batch_empty(self):
+        tube = self.make_tube()
+
+        assert tube.take_batch(5, 0.1) == []
+
+    def test_take_batch_without_timeout(self):
+        tube = self.make_tube()
+
+        tube.take_batch(5, None)
+
+        tube.queue.tnt.call.assert_called_once_with('queue.take_batch', ('0', 'tube_name', '5'))
+
+    def test_take_batch_zero_count(self):
+        tube = self.make_tube()
+
+        assert tube.take_batch(0, 0.1) == []
+        assert not tube.queue.tnt.call.called
+
+    def test_put_batch(self):
+        tube = self.make_tube([('2',)])
+        tube.tube.opt.update({'delay': 0, 'ttl': 0, 'ttr': 0, 'pri': 0})
+        tube.tube.serialize = lambda data: 'serialized ' + data
+
+        assert tube.put_batch([('data1', None), ('data2', 7)], delay=300) == 2
+        tube.queue.tnt.call.assert_called_once_with('queue.put_batch', (
+            '0', 'tube_name', '300', '0', '0', '0', 'serialized data1', '7', 'serialized data2'
+        ))
+
+    def test_put_batch_empty(self):
+        tube = self.make_tube()
+
+        assert tube.put_batch([]) == 0
+        assert not tube.queue.tnt.call.called
+
+    def test_ack_batch(self):
+        tube = self.make_tube([('id1',)])
+        tasks = [Mock(task_id='id1', modified=False), Mock(task_id='id2', modified=False)]
+
+        assert tube.ack_batch(tasks) == set(['id1'])
+        tube.queue.tnt.call.assert_called_once_with('queue.ack_batch', ('0', 'id1', 'id2'))
+        assert all(task.modified for task in tasks)
+
+    def test_bury_batch(self):
+        tube = self.make_tube([('id1',)])
+
+        assert tube.bury_batch([Mock(task_id='id1')]) == set(['id1'])
+        tube.queue.tnt.call.assert_called_once_with('queue.bury_batch', ('0', 'id1'))
+
+    def test_empty_batch_is_not_sent(self):
+        tube = self.make_tube()
+
+        assert tube.ack_batch([]) == set()
+        assert not tube.queue.tnt.call.called
+
+    def test_tube_attributes(self):
+        tube = self.make_tube()
+
+        tube.put('data')
+
+        tube.tube.put.assert_called_once_with('data')
+        assert tube.opt == {'tube': 'tube_name'}
@@ -1,10 +1,10 @@
 import socket
 from unittest import TestCase
-import urllib2
 from mock import patch, Mock
 import mock
+import signal
 from lib.utils import daemonize, load_config_from_pyfile, parse_cmd_args, create_pidfile, spawn_workers, \
-    check_network_status, get_tube, try_fork
+    get_tube, try_fork, ParentWatcher
 
 __author__ = 'f1nal'
 
@@ -95,20 +95,6 @@ class LibUtilsCase(TestCase):
             spawn_workers(workers_num, 'target', 'args', 'parent_pid')
             assert mocked_process.call_count == workers_num
 
-    def test_check_network_status_ok(self):
-        url = 'url'
-        timeout = 55
-
-        with patch('lib.utils.urllib2.urlopen'):
-            assert check_network_status(url, timeout)
-
-    def test_check_network_status_bad_url(self):
-        url = 'url'
-        timeout = 55
-
-        with patch('lib.utils.urllib2.urlopen', Mock(side_effect=urllib2.URLError('error'))):
-            assert not check_network_status(url, timeout)
-
     def test_get_tube(self):
         host = 'url'
         port = 55
@@ -118,5 +104,38 @@ class LibUtilsCase(TestCase):
         mocked_queue = Mock()
 
         with patch('lib.utils.tarantool_queue.Queue', Mock(return_value=mocked_queue)):
-            get_tube(host, port, space, name)
-            mocked_queue.tube.assert_called_once_with(name)
\ No newline at end of file
+            tube = get_tube(host, port, space, name)
+            mocked_queue.tube.assert_called_once_with(name)
+            assert tube.tube == mocked_queue.tube.return_value
+
+    @patch('lib.utils.signal.siginterrupt', Mock())
+    def test_parent_watcher_signal(self):
+        with patch('lib.utils.signal.signal', Mock()) as mocked_signal:
+            with patch('lib.utils.set_parent_death_signal', Mock(return_value=True)):
+                with patch('lib.utils.os.getppid', Mock(return_value=42)):
+                    with patch('lib.utils.os.path.exists', Mock()) as mocked_exists:
+                        watcher = ParentWatcher(42)
+
+                        assert watcher.alive()
+                        watcher.on_parent_death(signal.SIGTERM, None)
+                        assert not watcher.alive()
+                        assert not mocked_exists.called
+
+        mocked_signal.assert_called_once_with(signal.SIGTERM, watcher.on_parent_death)
+
+    @patch('lib.utils.signal.signal', Mock())
+    @patch('lib.utils.signal.siginterrupt', Mock())
+    def test_parent_watcher_parent_died_before_start(self):
+        with patch('lib.utils.set_parent_death_signal', Mock(return_value=True)):
+            with patch('lib.utils.os.getppid', Mock(return_value=1)):
+                assert not ParentWatcher(42).alive()
+
+    @patch('lib.utils.signal.siginterrupt', Mock())
+    def test_parent_watcher_without_signal(self):
+        with patch('lib.utils.signal.signal', Mock()) as mocked_signal:
+            with patch('lib.utils.set_parent_death_signal', Mock(return_value=False)):
+                with patch('lib.utils.os.path.exists', Mock(return_value=False)) as mocked_exists:
+                    assert not ParentWatcher(42).alive()
+
+        mocked_exists.assert_called_once_with('/proc/42')
+        mocked_signal.assert_called_with(signal.SIGTERM, signal.SIG_DFL)
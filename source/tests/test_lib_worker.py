@@ -1,11 +1,20 @@
 from unittest import TestCase
+import mock
 from mock import Mock, patch
+import gevent
 import lib
-from lib.worker import get_redirect_history_from_task, worker
+from lib import CheckSettings
+from lib.worker import WorkerContext, get_redirect_history_from_task, report_chain, should_recycle, take_tasks, \
+    worker, multi_worker, gevent_worker
 
 __author__ = 'f1nal'
 
 
+def parent_watcher(*alive):
+    """ParentWatcher mock, alive() returns the given values"""
+    return Mock(return_value=Mock(alive=Mock(side_effect=alive)))
+
+
 class LibWorkerTestCase(TestCase):
     def setUp(self):
         self.original_logger = lib.worker.logger
@@ -23,16 +32,80 @@ class LibWorkerTestCase(TestCase):
             'recheck': False
         }
 
-        timeout = 11
+        settings = CheckSettings(11)
 
         return_values = (['ERROR', 'MSG'], ['url1', 'url2'], ['counters'])
 
         with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
-            is_input, data = get_redirect_history_from_task(task, timeout)
+            is_input, data = get_redirect_history_from_task(task, settings)
 
             assert data['recheck']
             assert is_input
 
+    def test_get_redirect_history_from_task_deadline_is_input(self):
+        task = Mock()
+        task.task_id = 5
+        task.data = {
+            'url_id': '32',
+            'url': 'dummy_url',
+        }
+
+        return_values = (['http_status', 'DEADLINE'], ['url1', 'url2', 'url2'], [])
+
+        with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
+            is_input, data = get_redirect_history_from_task(task, CheckSettings(11, budget=20))
+
+            assert data['recheck']
+            assert is_input
+
+    def test_get_redirect_history_from_task_stores_partial_history(self):
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url_id': '32', 'url': 'http://a.ru/'}
+
+        return_values = (
+            ['http_status', 'meta_tag', 'ERROR'],
+            [u'http://a.ru/', u'http://b.ru/', u'http://c.ru/', u'http://c.ru/'],
+            []
+        )
+
+        with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
+            is_input, data = get_redirect_history_from_task(task, CheckSettings(11))
+
+        assert is_input
+        assert data['history'] == [['http_status', 'meta_tag'], [u'http://a.ru/', u'http://b.ru/', u'http://c.ru/']]
+
+    def test_get_redirect_history_from_task_first_hop_failed(self):
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url_id': '32', 'url': 'http://a.ru/'}
+
+        return_values = (['ERROR'], [u'http://a.ru/', u'http://a.ru/'], [])
+
+        with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
+            is_input, data = get_redirect_history_from_task(task, CheckSettings(11))
+
+        assert is_input
+        assert 'history' not in data
+
+    def test_get_redirect_history_from_task_resume(self):
+        task = Mock()
+        task.task_id = 5
+        history = [['http_status'], ['http://a.ru/', 'http://b.ru/']]
+        task.data = {'url_id': '32', 'url': 'http://a.ru/', 'recheck': True, 'history': history}
+
+        return_values = (['http_status'], [u'http://a.ru/', u'http://b.ru/'], [])
+
+        settings = CheckSettings(11, verify_first_hop=True)
+
+        with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)) as get_redirect_history:
+            is_input, data = get_redirect_history_from_task(task, settings)
+
+        assert not is_input
+        args, kwargs = get_redirect_history.call_args
+        assert kwargs['resume'] == (['http_status'], ['http://a.ru/', 'http://b.ru/'])
+        assert args == (u'http://a.ru/', settings)
+
     def test_get_redirect_history_from_task_is_not_input(self):
         task = Mock()
         task.task_id = 5
@@ -43,12 +116,12 @@ class LibWorkerTestCase(TestCase):
             'suspicious': 'asd'
         }
 
-        timeout = 11
+        settings = CheckSettings(11)
 
         return_values = (['MSG'], ['url1', 'url2'], ['counters'])
 
         with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
-            is_input, data = get_redirect_history_from_task(task, timeout)
+            is_input, data = get_redirect_history_from_task(task, settings)
 
             assert data['check_type'] == 'normal'
             assert data['suspicious'] == task.data['suspicious']
@@ -63,71 +136,517 @@ class LibWorkerTestCase(TestCase):
             'recheck': False,
         }
 
-        timeout = 11
+        settings = CheckSettings(11)
 
         return_values = (['MSG'], ['url1', 'url2'], ['counters'])
 
         with patch('lib.worker.get_redirect_history', Mock(return_value=return_values)):
-            is_input, data = get_redirect_history_from_task(task, timeout)
+            is_input, data = get_redirect_history_from_task(task, settings)
 
             assert data['check_type'] == 'normal'
             assert 'suspicious' not in data
             assert not is_input
 
+    def test_get_redirect_history_from_task_result_cache(self):
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url_id': '32', 'url': 'http://a.ru/'}
+
+        result_cache = Mock()
+        result_cache.get = Mock(return_value=([], [u'http://a.ru/'], []))
+
+        with patch('lib.worker.get_redirect_history', Mock()) as get_redirect_history:
+            is_input, data = get_redirect_history_from_task(task, CheckSettings(11), result_cache=result_cache)
+
+        assert not get_redirect_history.called
+        assert data['result'] == [[], [u'http://a.ru/'], []]
+        assert not is_input
+
+    def test_get_redirect_history_from_task_result_cache_miss(self):
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url_id': '32', 'url': 'http://a.ru/'}
+
+        result_cache = Mock()
+        result_cache.get = Mock(return_value=None)
+        history = ([], [u'http://a.ru/'], [])
+
+        with patch('lib.worker.get_redirect_history', Mock(return_value=history)):
+            get_redirect_history_from_task(task, CheckSettings(11), result_cache=result_cache)
+
+        result_cache.put.assert_called_once_with(u'http://a.ru/', history)
+
     def test_worker(self):
         config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
 
         task = Mock()
-        task_meta_pri = 'fri'
-        task.meta = Mock(return_value={
-            'pri': task_meta_pri
-        })
+        task.pri = 3
 
         tube = Mock()
         tube.opt = {'tube': 'tube_name'}
-        tube.take = Mock(return_value=task)
+        tube.take_batch = Mock(return_value=[task])
+        tube.ack_batch = Mock(return_value=set())
 
         is_input = True
         data = []
 
         with patch('lib.worker.get_tube', Mock(return_value=tube)):
-            with patch('lib.worker.os.path.exists', Mock(side_effect=(
-                    True, False
-            ))):
+            with patch('lib.worker.ParentWatcher', parent_watcher(True, True, False)):
                 with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=(is_input, data))):
                     worker(config, 42)
 
-                    tube.put.assert_called_once_with(
-                        data,
-                        delay=config.RECHECK_DELAY,
-                        pri=task_meta_pri
-                    )
-                    task.ack.assert_called_once_with()
+        tube.put_batch.assert_any_call([(data, 3)], delay=config.RECHECK_DELAY)
+        tube.ack_batch.assert_called_once_with([task])
+        assert not task.meta.called
+
+    def test_worker_idle(self):
+        config = Mock()
+        config.QUEUE_TAKE_BATCH = 10
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+
+        task = Mock()
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(side_effect=([task], []))
+        tube.ack_batch = Mock(return_value=set())
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.ParentWatcher', parent_watcher(True, True, True, False)):
+                with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=None)):
+                    worker(config, 42)
+
+        # long poll on the idle queue, short one while results are not sent;
+        # one task at a time, so that a taken task does not wait for a batch past the queue ttr
+        assert tube.take_batch.call_args_list == [
+            mock.call(1, config.QUEUE_IDLE_TAKE_TIMEOUT),
+            mock.call(1, config.QUEUE_TAKE_TIMEOUT),
+        ]
+        # results are sent as soon as the queue is empty
+        tube.ack_batch.assert_called_once_with([task])
+
+    def test_worker_recycle(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = 2
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+
+        tasks = [Mock(), Mock()]
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=tasks)
+        tube.ack_batch = Mock(return_value=set())
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.ParentWatcher', Mock(return_value=Mock(alive=Mock(return_value=True)))):
+                with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=None)):
+                    worker(config, 42)
+
+        assert tube.take_batch.call_count == 1
+        tube.ack_batch.assert_called_once_with(tasks)
+
+    def test_worker_flushes_after_each_task(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = 2
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+
+        tasks = [Mock(), Mock()]
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=tasks)
+        tube.ack_batch = Mock(return_value=set())
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.ParentWatcher', Mock(return_value=Mock(alive=Mock(return_value=True)))):
+                with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=None)):
+                    worker(config, 42)
+
+        assert tube.ack_batch.call_args_list == [mock.call([tasks[0]]), mock.call([tasks[1]])]
+
+    def test_worker_stops_in_the_middle_of_tasks(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+
+        tasks = [Mock(), Mock()]
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=tasks)
+        tube.ack_batch = Mock(return_value=set())
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.ParentWatcher', parent_watcher(True, True, False, False)):
+                with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=None)) as mocked_check:
+                    worker(config, 42)
+
+        assert mocked_check.call_count == 1
+        assert mocked_check.call_args[0][0] is tasks[0]
+        # the result of the checked task is sent before the worker exits
+        tube.ack_batch.assert_called_once_with([tasks[0]])
+
+    def test_worker_breaker_open(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        breaker = Mock()
+        breaker.acquire = Mock(return_value=0)
+        breaker.wait_time = Mock(return_value=25)
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.get_breaker', Mock(return_value=breaker)):
+                with patch('lib.worker.ParentWatcher', parent_watcher(True, False)):
+                    with patch('lib.worker.sleep') as mocked_sleep:
+                        worker(config, 42)
+
+        assert not tube.take_batch.called
+        # the worker sleeps until probe tasks may be taken
+        mocked_sleep.assert_called_once_with(25)
+        breaker.close.assert_called_once_with()
+
+    def test_worker_context(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.WORKER_MAX_TASKS = 2
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=[Mock(), Mock()])
+        hop_cache, result_cache, breaker = Mock(), Mock(), Mock()
+        breaker.acquire = Mock(return_value=2)
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.ParentWatcher', Mock(return_value=Mock(alive=Mock(return_value=True)))):
+                with patch('lib.worker.get_worker_hop_cache', Mock(return_value=hop_cache)):
+                    with patch('lib.worker.get_worker_result_cache', Mock(return_value=result_cache)):
+                        with patch('lib.worker.get_breaker', Mock(return_value=breaker)):
+                            context = WorkerContext(config, 42, 10)
+
+        assert context.extended
+        assert context.running()
+        assert len(context.take_tasks(2, 0.1)) == 2
+        # recycled after WORKER_MAX_TASKS tasks
+        assert not context.running()
+
+        context.close()
+
+        hop_cache.save.assert_called_once_with()
+        result_cache.close.assert_called_once_with()
+        breaker.close.assert_called_once_with()
+
+    def test_take_tasks(self):
+        tube = Mock()
+        tube.take_batch = Mock(return_value=['task'])
+        breaker = Mock()
+        breaker.acquire = Mock(return_value=2)
+
+        assert take_tasks(tube, 10, 5, breaker) == ['task']
+        breaker.acquire.assert_called_once_with(10)
+        tube.take_batch.assert_called_once_with(2, 5)
+        breaker.release.assert_called_once_with(1)
+
+    def test_take_tasks_metrics(self):
+        tube = Mock()
+        tube.take_batch = Mock(return_value=['task1', 'task2'])
+        metrics = Mock()
+
+        with patch('lib.worker.time', Mock(side_effect=[1000, 1000.5])):
+            assert take_tasks(tube, 10, 5, metrics=metrics) == ['task1', 'task2']
+
+        tube.take_batch.assert_called_once_with(10, 5)
+        metrics.observe.assert_called_once_with('take_seconds', 0.5)
+        metrics.inc.assert_called_once_with('tasks_total', 2)
+
+    def test_take_tasks_breaker_open(self):
+        tube = Mock()
+        breaker = Mock()
+        breaker.acquire = Mock(return_value=0)
+
+        assert take_tasks(tube, 10, 5, breaker) is None
+        assert not tube.take_batch.called
+
+    def test_report_chain(self):
+        stats = Mock()
+        breaker = Mock()
+        history = (['http_status'], ['http://a.ru/', 'http://b.ru/'], [], ['timings'])
+
+        assert report_chain(history, stats, breaker) == history[:3]
+        stats.add_chain.assert_called_once_with(['timings'])
+        breaker.add_chain.assert_called_once_with(['timings'], ['http_status'])
+        assert report_chain(history[:3]) == history[:3]
+
+    def test_report_chain_metrics(self):
+        metrics = Mock()
+        history = (['http_status'], ['http://a.ru/', 'http://b.ru/'], [], ['timings'])
+
+        assert report_chain(history, metrics=metrics) == history[:3]
+        metrics.add_chain.assert_called_once_with(['http_status'], ['timings'])
+
+    def test_should_recycle(self):
+        config = Mock()
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = 1024 * 1024
+        usage = Mock(ru_maxrss=512)
+
+        with patch('lib.worker.resource.getrusage', Mock(return_value=usage)):
+            assert not should_recycle(config, 100)
+            usage.ru_maxrss = 2048
+            assert should_recycle(config, 100)
+
+        config.WORKER_MAX_TASKS = 100
+        config.WORKER_MAX_RSS = None
+        assert not should_recycle(config, 99)
+        assert should_recycle(config, 100)
 
     def test_worker_is_not_input(self):
         config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
 
         task = Mock()
-        task_meta_pri = 'fri'
-        task.meta = Mock(return_value={
-            'pri': task_meta_pri
-        })
+        task.pri = 3
 
         tube = Mock()
         tube.opt = {'tube': 'tube_name'}
-        tube.take = Mock(return_value=task)
+        tube.take_batch = Mock(return_value=[task])
+        tube.ack_batch = Mock(return_value=set())
 
         is_input = False
         data = []
 
         with patch('lib.worker.get_tube', Mock(return_value=tube)):
-            with patch('lib.worker.os.path.exists', Mock(side_effect=(
-                    True, False
-            ))):
+            with patch('lib.worker.ParentWatcher', parent_watcher(True, True, False)):
                 with patch('lib.worker.get_redirect_history_from_task', Mock(return_value=(is_input, data))):
                     worker(config, 32)
 
-                    tube.put.assert_called_once_with(
-                        data
-                    )
-                    task.ack.assert_called_once_with()
\ No newline at end of file
+        tube.put_batch.assert_any_call([(data, None)])
+        tube.ack_batch.assert_called_once_with([task])
+
+    def test_multi_worker(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+        config.MULTI_MAX_CHAINS = 2
+
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url': 'http://a.ru/', 'url_id': '32'}
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=[task])
+        tube.ack_batch = Mock(return_value=set())
+
+        history = ([], ['http://a.ru/'], [])
+
+        engine = Mock()
+        engine.__len__ = Mock(return_value=0)
+        engine.add = Mock(side_effect=lambda url, callback, resume: callback(history))
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.RedirectEngine', Mock(return_value=engine)):
+                with patch('lib.worker.ParentWatcher', parent_watcher(True, False)):
+                    multi_worker(config, 42)
+
+        engine.add.assert_called_once_with(u'http://a.ru/', mock.ANY, None)
+        tube.put_batch.assert_any_call([({
+            'url_id': '32',
+            'result': [[], ['http://a.ru/'], []],
+            'check_type': 'normal'
+        }, None)])
+        tube.ack_batch.assert_called_once_with([task])
+        engine.perform.assert_called_once_with(config.QUEUE_TAKE_TIMEOUT)
+        engine.close.assert_called_once_with()
+
+    def test_multi_worker_result_cache(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+        config.MULTI_MAX_CHAINS = 2
+
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url': 'http://a.ru/', 'url_id': '32'}
+
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        tube.take_batch = Mock(return_value=[task])
+        tube.ack_batch = Mock(return_value=set())
+
+        result_cache = Mock()
+        result_cache.get = Mock(return_value=([], [u'http://a.ru/'], []))
+
+        engine = Mock()
+        engine.__len__ = Mock(return_value=0)
+
+        with patch('lib.worker.get_tube', Mock(return_value=tube)):
+            with patch('lib.worker.RedirectEngine', Mock(return_value=engine)):
+                with patch('lib.worker.ResultCache', Mock(return_value=result_cache)):
+                    with patch('lib.worker.ParentWatcher', parent_watcher(True, False)):
+                        multi_worker(config, 42)
+
+        assert not engine.add.called
+        tube.put_batch.assert_any_call([({
+            'url_id': '32',
+            'result': [[], [u'http://a.ru/'], []],
+            'check_type': 'normal'
+        }, None)])
+        tube.ack_batch.assert_called_once_with([task])
+        result_cache.close.assert_called_once_with()
+
+    def test_gevent_worker(self):
+        config = Mock()
+        config.EXTRA_COUNTER_TYPES = ()
+        config.HEAD_FIRST_DOMAINS = ()
+        config.HOP_CACHE_SIZE = 0
+        config.WORKER_MAX_TASKS = None
+        config.WORKER_MAX_RSS = None
+        config.RESULT_BATCH_SIZE = 100
+        config.RESULT_FLUSH_INTERVAL = 0.5
+        config.RATE_LIMIT = None
+        config.STATS_INTERVAL = None
+        config.RESULT_CACHE_PATH = None
+        config.BREAKER_FILE = None
+        config.METRICS_PORT = None
+        config.PROFILE_DIR = None
+        config.GEVENT_POOL_SIZE = 2
+
+        task = Mock()
+        task.task_id = 5
+        task.data = {'url': 'http://a.ru/', 'url_id': '32'}
+
+        tasks = [task]
+        tube = Mock()
+        tube.opt = {'tube': 'tube_name'}
+        # an empty queue lets the started greenlets run
+        tube.take_batch = Mock(side_effect=lambda count, timeout: [tasks.pop()] if tasks else gevent.sleep(0) or [])
+        tube.ack_batch = Mock(return_value=set())
+
+        history = ([], ['http://a.ru/'], [])
+
+        engine = Mock()
+        engine.perform = Mock(return_value=0)
+        engine.add = Mock(side_effect=lambda url, callback, resume: callback(history))
+
+        with patch('lib.worker.patch_socket', Mock()):
+            with patch('lib.worker.get_tube', Mock(return_value=tube)):
+                with patch('lib.worker.RedirectEngine', Mock(return_value=engine)):
+                    with patch('lib.worker.ParentWatcher', parent_watcher(True, True, False)):
+                        gevent_worker(config, 42)
+
+        engine.add.assert_called_once_with(u'http://a.ru/', mock.ANY, None)
+        tube.put_batch.assert_any_call([({
+            'url_id': '32',
+            'result': [[], ['http://a.ru/'], []],
+            'check_type': 'normal'
+        }, None)])
+        tube.ack_batch.assert_called_once_with([task])
+        engine.close.assert_called_once_with()
@@ -45,11 +45,10 @@ class NotificationPusherTestCase(unittest.TestCase):
 
             task_queue.put.assert_called_once_with((task, 'bury'))
 
-    def main_loop_done_with_processed_tasks(self, task_queue):
+    def main_loop_done_with_processed_tasks(self, tube, task_queue):
         notification_pusher.run_application = False
 
     @patch('notification_pusher.sleep', Mock())
-    @patch('notification_pusher.tarantool_queue.Queue', Mock())
     def test_main_loop(self):
         config = Mock()
         pool_size = 4
@@ -62,7 +61,10 @@ class NotificationPusherTestCase(unittest.TestCase):
         mocked_worker = Mock()
         mocked_gevent_queue = Mock()
 
-        with patch('notification_pusher.tarantool_queue.Queue', Mock()):
+        mocked_tube = Mock()
+        mocked_tube.take_batch = Mock(return_value=[Mock() for _ in xrange(pool_size)])
+
+        with patch('notification_pusher.get_tube', Mock(return_value=mocked_tube)):
             with patch('notification_pusher.Pool', Mock(return_value=mocked_pool)):
                 with patch('notification_pusher.done_with_processed_tasks', mocked_done_with_processed_tasks):
                     with patch('notification_pusher.Greenlet', Mock(return_value=mocked_worker)):
@@ -71,10 +73,12 @@ class NotificationPusherTestCase(unittest.TestCase):
                             main_loop(config)
 
                             assert mocked_worker.start.call_count == pool_size
-                            mocked_done_with_processed_tasks.assert_called_once_with(mocked_gevent_queue)
+                            mocked_tube.take_batch.assert_called_once_with(pool_size, config.QUEUE_TAKE_TIMEOUT)
+                            mocked_done_with_processed_tasks.assert_called_once_with(
+                                mocked_tube, mocked_gevent_queue
+                            )
 
     @patch('notification_pusher.sleep', Mock())
-    @patch('notification_pusher.tarantool_queue.Queue', Mock())
     def test_main_loop_no_task(self):
         config = Mock()
         pool_size = 4
@@ -87,15 +91,10 @@ class NotificationPusherTestCase(unittest.TestCase):
         mocked_worker = Mock()
         mocked_gevent_queue = Mock()
 
-        mocked_task = Mock()
-
-        mocked_tube = Mock(return_value=mocked_task)
-        mocked_tube.take = Mock(return_value=None)
-
-        mocked_tarantool_queue = Mock()
-        mocked_tarantool_queue.tube = Mock(return_value=mocked_tube)
+        mocked_tube = Mock()
+        mocked_tube.take_batch = Mock(return_value=[])
 
-        with patch('notification_pusher.tarantool_queue.Queue', Mock(return_value=mocked_tarantool_queue)):
+        with patch('notification_pusher.get_tube', Mock(return_value=mocked_tube)):
             with patch('notification_pusher.Pool', Mock(return_value=mocked_pool)):
                 with patch('notification_pusher.done_with_processed_tasks', mocked_done_with_processed_tasks):
                     with patch('notification_pusher.Greenlet', Mock(return_value=mocked_worker)):
@@ -104,7 +103,9 @@ class NotificationPusherTestCase(unittest.TestCase):
                             main_loop(config)
 
                             assert not mocked_worker.start.called
-                            mocked_done_with_processed_tasks.assert_called_once_with(mocked_gevent_queue)
+                            mocked_done_with_processed_tasks.assert_called_once_with(
+                                mocked_tube, mocked_gevent_queue
+                            )
 
     def main_main_loop(self, config):
         notification_pusher.run_application = False
@@ -191,26 +192,31 @@ class NotificationPusherTestCase(unittest.TestCase):
                                 assert mocked_main_loop.called
 
     def test_done_with_processed_tasks_execution(self):
-        task = Mock()
+        task1 = Mock()
+        task2 = Mock()
+        task3 = Mock()
+        tube = Mock()
         task_queue = Mock()
 
-        task_queue.qsize = Mock(return_value=3)
+        task_queue.qsize = Mock(return_value=4)
         task_queue.get_nowait = Mock(side_effect=(
-            (task, 'action1'),
-            (task, 'action2'),
+            (task1, 'ack'),
+            (task2, 'bury'),
+            (task3, 'ack'),
             gevent_queue.Empty
         ))
 
-        notification_pusher.done_with_processed_tasks(task_queue)
+        notification_pusher.done_with_processed_tasks(tube, task_queue)
 
-        assert task.action1.called
-        assert task.action2.called
-        assert not task.action3.called
+        tube.ack_batch.assert_called_once_with([task1, task3])
+        tube.bury_batch.assert_called_once_with([task2])
+        assert not task1.ack.called
 
     def test_done_with_processed_tasks_execution_exception(self):
         task = Mock()
 
-        task.action1 = Mock(side_effect=tarantool.DatabaseError)
+        tube = Mock()
+        tube.action1_batch = Mock(side_effect=tarantool.DatabaseError)
 
         task_queue = Mock()
 
@@ -223,10 +229,10 @@ class NotificationPusherTestCase(unittest.TestCase):
         original_logger = notification_pusher.logger
 
         notification_pusher.logger = mocked_logger
-        notification_pusher.done_with_processed_tasks(task_queue)
+        notification_pusher.done_with_processed_tasks(tube, task_queue)
         notification_pusher.logger = original_logger
 
-        assert task.action1.called
+        tube.action1_batch.assert_called_once_with([task])
         assert mocked_logger.exception.called
 
     def test_stop_handler_set_run_application(self):
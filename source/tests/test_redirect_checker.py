@@ -1,7 +1,8 @@
 import unittest
+import mock
 from mock import Mock, patch
 from redirect_checker import main, main_loop
-from lib.worker import worker
+from lib.worker import multi_worker, worker
 import redirect_checker
 
 
@@ -59,18 +60,23 @@ class RedirectCheckerTestCase(unittest.TestCase):
                             assert mocked_load_config_from_pyfile.called
                             mocked_main_loop.assert_called_once_with(mocked_config)
 
+    @patch('redirect_checker.get_autoscaler', Mock(return_value=None))
+    @patch('redirect_checker.signal', Mock())
     @patch('redirect_checker.sleep', Mock())
-    @patch('redirect_checker.check_network_status', Mock(return_value=True))
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
     def test_main_loop(self):
         mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
         mocked_config.WORKER_POOL_SIZE = 5
+        mocked_config.SLEEP = 10
 
-        active_children = [1, 2]
+        active_children = [Mock(), Mock()]
         parent_pid = 5
 
-        with patch('redirect_checker.spawn_workers') as mocked_spawn_workers:
-            with patch('redirect_checker.os.getpid', Mock(return_value=parent_pid)):
-                with patch('redirect_checker.active_children', Mock(side_effect=(
+        with patch('lib.supervisor.spawn_workers') as mocked_spawn_workers:
+            with patch('lib.supervisor.os.getpid', Mock(return_value=parent_pid)):
+                with patch('lib.supervisor.active_children', Mock(side_effect=(
                         active_children, Exception
                 ))):
                     try:
@@ -85,47 +91,187 @@ class RedirectCheckerTestCase(unittest.TestCase):
                         parent_pid=parent_pid
                     )
 
+    @patch('redirect_checker.get_autoscaler', Mock(return_value=None))
+    @patch('redirect_checker.signal', Mock())
     @patch('redirect_checker.sleep', Mock())
-    @patch('redirect_checker.check_network_status', Mock(return_value=True))
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
     def test_main_loop_no_required_workers(self):
         mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
         mocked_config.WORKER_POOL_SIZE = 5
+        mocked_config.SLEEP = 10
 
-        active_children = [1, 2, 3, 4, 5]
-        parent_pid = 5
+        active_children = [Mock() for _ in range(5)]
 
-        with patch('redirect_checker.spawn_workers') as mocked_spawn_workers:
-            with patch('redirect_checker.os.getpid', Mock(return_value=parent_pid)):
-                with patch('redirect_checker.active_children', Mock(side_effect=(
-                        active_children, Exception
+        with patch('lib.supervisor.spawn_workers') as mocked_spawn_workers:
+            with patch('lib.supervisor.active_children', Mock(side_effect=(
+                    active_children, Exception
+            ))):
+                try:
+                    main_loop(mocked_config)
+                except Exception:
+                    pass
+
+                assert not mocked_spawn_workers.called
+
+    @patch('redirect_checker.get_autoscaler', Mock(return_value=None))
+    @patch('redirect_checker.sleep', Mock())
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
+    def test_main_loop_profile_signal(self):
+        mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
+        mocked_config.WORKER_POOL_SIZE = 1
+        mocked_config.SLEEP = 10
+        mocked_config.PROFILE_DIR = '/tmp/profiles'
+
+        with patch('redirect_checker.signal') as mocked_signal:
+            with patch('lib.supervisor.active_children', Mock(side_effect=Exception)):
+                try:
+                    main_loop(mocked_config)
+                except Exception:
+                    pass
+
+            mocked_signal.signal.assert_any_call(redirect_checker.PROFILE_SIGNAL, mock.ANY)
+            handler = [c[0][1] for c in mocked_signal.signal.call_args_list
+                       if c[0][0] == redirect_checker.PROFILE_SIGNAL][0]
+
+        with patch('redirect_checker.Supervisor.signal_workers') as signal_workers:
+            handler(redirect_checker.PROFILE_SIGNAL, None)
+        signal_workers.assert_called_once_with(redirect_checker.PROFILE_SIGNAL)
+
+    @patch('redirect_checker.get_autoscaler', Mock(return_value=None))
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock(return_value=77))
+    @patch('redirect_checker.stop_metrics_server')
+    def test_main_loop_drains_workers_on_sigterm(self, mocked_stop_metrics_server):
+        mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
+        mocked_config.WORKER_POOL_SIZE = 1
+        mocked_config.SLEEP = 10
+        mocked_config.WORKER_DRAIN_TIMEOUT = 60
+
+        worker_process = Mock()
+        worker_process.pid = 100
+
+        with patch('redirect_checker.signal') as mocked_signal:
+            def stop(seconds):
+                handler = [c[0][1] for c in mocked_signal.signal.call_args_list
+                           if c[0][0] == mocked_signal.SIGTERM][0]
+                handler(mocked_signal.SIGTERM, None)
+
+            with patch('redirect_checker.sleep', Mock(side_effect=stop)):
+                with patch('lib.supervisor.active_children', Mock(side_effect=(
+                        [worker_process], [worker_process], []
                 ))):
+                    main_loop(mocked_config)
+
+        worker_process.terminate.assert_called_once_with()
+        mocked_stop_metrics_server.assert_called_once_with(77)
+
+    @patch('redirect_checker.signal', Mock())
+    @patch('redirect_checker.sleep', Mock())
+    @patch('redirect_checker.serve_metrics', Mock())
+    def test_main_loop_breaker_open(self):
+        mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
+        mocked_config.WORKER_POOL_SIZE = 2
+        mocked_config.SLEEP = 10
+
+        autoscaler = Mock()
+        breaker = Mock()
+        breaker.is_closed = Mock(return_value=False)
+        active_children = [Mock(), Mock()]
+
+        with patch('redirect_checker.get_autoscaler', Mock(return_value=autoscaler)):
+            with patch('redirect_checker.get_breaker', Mock(return_value=breaker)):
+                with patch('lib.supervisor.active_children', Mock(side_effect=(active_children, Exception))):
                     try:
                         main_loop(mocked_config)
                     except Exception:
                         pass
 
-                    assert not mocked_spawn_workers.called
+        assert not autoscaler.update.called
+        for c in active_children:
+            assert not c.terminate.called
 
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
+    @patch('redirect_checker.signal', Mock())
     @patch('redirect_checker.sleep', Mock())
-    @patch('redirect_checker.check_network_status', Mock(return_value=False))
-    def test_main_loop_network_offline(self):
+    def test_main_loop_autoscales_every_sleep(self):
         mocked_config = Mock()
-        mocked_config.WORKER_POOL_SIZE = 5
+        mocked_config.WORKER_BACKEND = 'process'
+        mocked_config.WORKER_POOL_SIZE = 1
+        mocked_config.SLEEP = 10
 
-        children1 = Mock()
-        children2 = Mock()
+        autoscaler = Mock()
+        autoscaler.update = Mock(return_value=1)
 
-        active_children = [children1, children2]
-        parent_pid = 5
+        with patch('redirect_checker.get_autoscaler', Mock(return_value=autoscaler)):
+            with patch('lib.supervisor.spawn_workers', Mock()):
+                with patch('lib.supervisor.active_children', Mock(side_effect=([], [], Exception))):
+                    with patch('redirect_checker.time', Mock(side_effect=(100, 100, 105))):
+                        try:
+                            main_loop(mocked_config)
+                        except Exception:
+                            pass
 
-        with patch('redirect_checker.os.getpid', Mock(return_value=parent_pid)):
-            with patch('redirect_checker.active_children', Mock(side_effect=(
-                    active_children, Exception
-            ))):
+        assert autoscaler.update.call_count == 1
+        redirect_checker.sleep.assert_called_once_with(10)
+
+    @patch('redirect_checker.get_autoscaler', Mock(return_value=None))
+    @patch('redirect_checker.signal', Mock())
+    @patch('redirect_checker.sleep', Mock())
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
+    def test_main_loop_multi_backend(self):
+        mocked_config = Mock()
+        mocked_config.WORKER_POOL_SIZE = 1
+        mocked_config.WORKER_BACKEND = 'multi'
+        mocked_config.SLEEP = 10
+
+        with patch('lib.supervisor.spawn_workers') as mocked_spawn_workers:
+            with patch('lib.supervisor.active_children', Mock(side_effect=([], Exception))):
                 try:
                     main_loop(mocked_config)
                 except Exception:
                     pass
 
-                for c in active_children:
-                    c.terminate.assert_called_with()
\ No newline at end of file
+                assert mocked_spawn_workers.call_args[1]['target'] is multi_worker
+
+    @patch('redirect_checker.serve_metrics')
+    def test_main_loop_unknown_backend(self, mocked_serve_metrics):
+        mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'threads'
+
+        with patch('lib.supervisor.spawn_workers') as mocked_spawn_workers:
+            self.assertRaises(ValueError, main_loop, mocked_config)
+
+            assert not mocked_spawn_workers.called
+            assert not mocked_serve_metrics.called
+
+    @patch('redirect_checker.signal', Mock())
+    @patch('redirect_checker.sleep', Mock())
+    @patch('redirect_checker.get_breaker', Mock(return_value=None))
+    @patch('redirect_checker.serve_metrics', Mock())
+    def test_main_loop_autoscale(self):
+        mocked_config = Mock()
+        mocked_config.WORKER_BACKEND = 'process'
+        mocked_config.WORKER_POOL_SIZE = 2
+        mocked_config.SLEEP = 10
+
+        autoscaler = Mock()
+        autoscaler.update = Mock(return_value=4)
+
+        with patch('redirect_checker.get_autoscaler', Mock(return_value=autoscaler)):
+            with patch('lib.supervisor.spawn_workers') as mocked_spawn_workers:
+                with patch('lib.supervisor.active_children', Mock(side_effect=([Mock()], Exception))):
+                    try:
+                        main_loop(mocked_config)
+                    except Exception:
+                        pass
+
+        autoscaler.update.assert_called_once_with(2)
+        assert mocked_spawn_workers.call_args[1]['num'] == 3